@@ -0,0 +1 @@
+"""スタブやローカルDBを使った性能計測スクリプト群。"""
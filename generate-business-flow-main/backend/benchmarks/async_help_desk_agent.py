@@ -0,0 +1,153 @@
+"""HelpDeskAgentの同期版と非同期版をスタブクライアントで比較するベンチマーク。
+
+OpenAI呼び出しとツール実行を固定レイテンシのスタブに差し替え、非同期サーバー上で
+複数の質問を同時に処理したときの実行時間と、最終結果が一致することを確認します。
+
+Usage:
+    python -m benchmarks.async_help_desk_agent --requests 4 --subtasks 4 --latency 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from langchain_core.tools import tool
+
+from src.models import Plan, ReflectionResult
+from src.services.sample_agent import AsyncHelpDeskAgent, HelpDeskAgent
+
+
+def _build_response(message: SimpleNamespace) -> SimpleNamespace:
+    # OpenAIレスポンスのうちエージェントが参照する属性だけを再現する
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _tool_call(name: str) -> SimpleNamespace:
+    payload = {
+        "id": f"call_{name}",
+        "type": "function",
+        "function": {"name": name, "arguments": '{"keywords": "stub"}'},
+    }
+    return SimpleNamespace(model_dump=lambda: payload)
+
+
+class _StubCompletions:
+    """chat.completions.create / beta.chat.completions.parse のスタブ。"""
+
+    def __init__(self, latency: float, subtasks: int, is_async: bool) -> None:
+        self.latency = latency
+        self.subtasks = subtasks
+        self.is_async = is_async
+
+    def _respond(self, kwargs: dict) -> SimpleNamespace:
+        response_format = kwargs.get("response_format")
+        if response_format is Plan:
+            plan = Plan(subtasks=[f"subtask-{index}" for index in range(self.subtasks)])
+            return _build_response(SimpleNamespace(parsed=plan))
+        if response_format is ReflectionResult:
+            reflection = ReflectionResult(advice="", is_completed=True)
+            return _build_response(SimpleNamespace(parsed=reflection))
+        if kwargs.get("tools"):
+            return _build_response(
+                SimpleNamespace(tool_calls=[_tool_call("search_stub")], content=None)
+            )
+        return _build_response(SimpleNamespace(content="stub answer", tool_calls=None))
+
+    def create(self, **kwargs):
+        if self.is_async:
+            return self._acreate(kwargs)
+        time.sleep(self.latency)
+        return self._respond(kwargs)
+
+    parse = create
+
+    async def _acreate(self, kwargs: dict) -> SimpleNamespace:
+        await asyncio.sleep(self.latency)
+        return self._respond(kwargs)
+
+
+def _stub_client(latency: float, subtasks: int, is_async: bool) -> SimpleNamespace:
+    completions = _StubCompletions(latency, subtasks, is_async)
+    chat = SimpleNamespace(completions=completions)
+    return SimpleNamespace(chat=chat, beta=SimpleNamespace(chat=chat))
+
+
+def _build_tools(latency: float) -> list:
+    @tool
+    def search_stub(keywords: str) -> list:
+        """スタブ検索ツール。"""
+        time.sleep(latency)
+        return []
+
+    return [search_stub]
+
+
+async def _serve_sync(agent: HelpDeskAgent, questions: list[str]) -> list:
+    # 非同期サーバー内で同期版を呼んだ場合を再現する（呼び出し中はループが止まる）
+    async def handle(question: str):
+        return agent.run_agent(question)
+
+    return await asyncio.gather(*(handle(question) for question in questions))
+
+
+async def _serve_async(agent: AsyncHelpDeskAgent, questions: list[str]) -> list:
+    return await asyncio.gather(*(agent.arun_agent(question) for question in questions))
+
+
+def main() -> int:
+    # CLIエントリーポイント。同期版と非同期版を同条件で1回ずつ実行する
+    """ベンチマークを実行し、所要時間と結果の一致を表示します。
+
+    Returns:
+        int: 結果が一致すれば0、不一致なら1。
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subtasks", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=4, help="同時に処理する質問数")
+    parser.add_argument("--latency", type=float, default=0.2, help="スタブ1呼び出しの秒数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    settings = SimpleNamespace(openai_api_key="stub", openai_model="stub-model")
+    tools = _build_tools(args.latency)
+    questions = [f"benchmark question {index}" for index in range(args.requests)]
+
+    sync_agent = HelpDeskAgent(settings, tools=tools)
+    sync_agent.client = _stub_client(args.latency, args.subtasks, is_async=False)
+    try:
+        started = time.perf_counter()
+        sync_results = asyncio.run(_serve_sync(sync_agent, questions))
+        sync_elapsed = time.perf_counter() - started
+    finally:
+        sync_agent.close()
+
+    async_agent = AsyncHelpDeskAgent(
+        settings, tools=tools, max_concurrent_subtasks=args.concurrency
+    )
+    async_agent.async_client = _stub_client(args.latency, args.subtasks, is_async=True)
+    try:
+        started = time.perf_counter()
+        async_results = asyncio.run(_serve_async(async_agent, questions))
+        async_elapsed = time.perf_counter() - started
+    finally:
+        async_agent.close()
+
+    same = [result.model_dump() for result in sync_results] == [
+        result.model_dump() for result in async_results
+    ]
+    print(
+        f"requests={args.requests} subtasks={args.subtasks} "
+        f"latency={args.latency}s concurrency={args.concurrency}"
+    )
+    print(f"run_agent  : {sync_elapsed:.3f}s")
+    print(f"arun_agent : {async_elapsed:.3f}s ({sync_elapsed / async_elapsed:.2f}x)")
+    print(f"results identical: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
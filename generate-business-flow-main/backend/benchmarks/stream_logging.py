@@ -0,0 +1,140 @@
+"""ストリーム中のログ出力がイベントループに与えるコストを比較するベンチマーク。
+
+LLMのcontentチャンク相当のバイト列を指定件数流し、ストリームを中継する処理が
+イベントループ上で消費した時間を1トークン（1チャンク）あたりで比較します。
+
+- sync-per-chunk: 従来構成。ルートロガーに同期のファイル・コンソールハンドラーを付け、
+  チャンクごとにログを出力する
+- queue-per-chunk: QueueHandler/QueueListener構成で、チャンクごとにログを出力する
+- queue-summary: QueueHandler/QueueListener構成で、ストリーム終了時に要約を1件だけ出力する
+
+コンソール出力は/dev/nullへ、ファイル出力は一時ディレクトリへ書き込みます。
+
+Usage:
+    python -m benchmarks.stream_logging --tokens 20000 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import TimedRotatingFileHandler
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+from src.api.request_body import summarize_for_log
+from src.observability.log_config import TEXT_FORMAT, configure_queue_logging
+
+LOGGER = logging.getLogger("src.api.routes")
+
+
+async def _token_stream(tokens: int) -> AsyncIterator[bytes]:
+    """Anthropicクライアントが返すcontentイベントと同じ形のチャンクを生成する。"""
+    for index in range(tokens):
+        event = {"type": "content", "text": "業務フロー", "chunk": index + 1}
+        yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _relay_per_chunk(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """従来のwrap_stream_with_loggingと同じく、チャンクごとにログを出力する。"""
+    async for chunk in stream:
+        LOGGER.info("stream_response_chunk: %s", summarize_for_log(chunk))
+        yield chunk
+
+
+async def _relay_summary(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """現在のwrap_stream_with_loggingと同じく、終了時に要約だけを出力する。"""
+    chunk_count = 0
+    byte_count = 0
+    try:
+        async for chunk in stream:
+            chunk_count += 1
+            byte_count += len(chunk)
+            yield chunk
+    finally:
+        LOGGER.info(
+            "stream_response_summary: outcome=ok chunks=%s bytes=%s", chunk_count, byte_count
+        )
+
+
+async def _measure(relay, tokens: int) -> float:
+    """ストリームを最後まで消費し、イベントループ上の経過時間を返す。"""
+    started = time.perf_counter()
+    async for _chunk in relay(_token_stream(tokens)):
+        pass
+    return time.perf_counter() - started
+
+
+async def _baseline(tokens: int) -> float:
+    """ログを出力しない中継にかかる時間（比較の基準）。"""
+    started = time.perf_counter()
+    async for _chunk in _token_stream(tokens):
+        pass
+    return time.perf_counter() - started
+
+
+def _configure_sync_logging(log_file: Path, devnull) -> None:
+    """従来の_configure_loggingと同じ同期ハンドラー構成にする。"""
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    console_handler = logging.StreamHandler(devnull)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    file_handler = TimedRotatingFileHandler(log_file, when="midnight", encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root_logger.addHandler(console_handler)
+    root_logger.addHandler(file_handler)
+    root_logger.setLevel(logging.INFO)
+
+
+def _best(samples: List[float]) -> float:
+    return min(samples)
+
+
+def main(tokens: int, repeat: int) -> None:
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w", encoding="utf-8") as devnull:
+        baseline = _best([asyncio.run(_baseline(tokens)) for _ in range(repeat)])
+
+        _configure_sync_logging(Path(tmp) / "sync.log", devnull)
+        results["sync-per-chunk"] = _best(
+            [asyncio.run(_measure(_relay_per_chunk, tokens)) for _ in range(repeat)]
+        )
+
+        # configure_queue_logging のコンソールハンドラーは生成時のsys.stderrへ書き込む
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            listener = configure_queue_logging(Path(tmp) / "queue.log")
+        finally:
+            sys.stderr = stderr
+        results["queue-per-chunk"] = _best(
+            [asyncio.run(_measure(_relay_per_chunk, tokens)) for _ in range(repeat)]
+        )
+        results["queue-summary"] = _best(
+            [asyncio.run(_measure(_relay_summary, tokens)) for _ in range(repeat)]
+        )
+        drain_started = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - drain_started
+
+    print(f"tokens={tokens} repeat={repeat} (best of repeat)")
+    print(f"{'mode':<16} {'loop time':>10} {'us/token':>10} {'logging us/token':>17}")
+    print(f"{'no-logging':<16} {baseline:>9.3f}s {baseline / tokens * 1e6:>10.2f} {0:>17.2f}")
+    for mode, elapsed in results.items():
+        overhead = (elapsed - baseline) / tokens * 1e6
+        print(f"{mode:<16} {elapsed:>9.3f}s {elapsed / tokens * 1e6:>10.2f} {overhead:>17.2f}")
+    print(f"listener drain after stop: {drain:.3f}s (background thread)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20_000, help="1ストリームのチャンク数")
+    parser.add_argument("--repeat", type=int, default=3, help="各モードの試行回数")
+    args = parser.parse_args()
+    main(args.tokens, args.repeat)
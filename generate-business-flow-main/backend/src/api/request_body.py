@@ -0,0 +1,129 @@
+"""Size-bounded JSON body reading for API routes."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Type, TypeVar
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+DEFAULT_MAX_REQUEST_BODY_BYTES = 32 * 1024 * 1024
+_MAX_REQUEST_BODY_BYTES = DEFAULT_MAX_REQUEST_BODY_BYTES
+LOG_FIELD_MAX_CHARS = 200
+
+
+class RequestBodyTooLargeError(ValueError):
+    """リクエストボディがサイズ上限を超えた場合の例外。"""
+
+
+async def read_limited_chunks(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+    """ボディを受信しながらサイズ上限を判定し、チャンクを返します。
+
+    Args:
+        request: 受信中のリクエスト。
+        max_bytes: ボディの最大バイト数。
+
+    Yields:
+        bytes: 受信したチャンク。
+
+    Raises:
+        RequestBodyTooLargeError: Content-Lengthまたは受信済みサイズが上限を超えた場合。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise RequestBodyTooLargeError(f"リクエストボディは最大{max_bytes}バイトまでです")
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise RequestBodyTooLargeError(f"リクエストボディは最大{max_bytes}バイトまでです")
+        yield chunk
+
+
+def set_max_request_body_bytes(max_bytes: int) -> None:
+    """create_appで読み込んだボディサイズ上限を登録。"""
+    global _MAX_REQUEST_BODY_BYTES
+    _MAX_REQUEST_BODY_BYTES = max_bytes
+
+
+async def parse_json_body(
+    request: Request, model: Type[ModelT], max_bytes: Optional[int] = None
+) -> ModelT:
+    """サイズ上限付きでJSONボディを受信し、スキーマへ変換します。
+
+    上限を超えた時点で受信を打ち切るため、巨大なボディをすべて読み込むことはありません。
+    上限内のボディはjson.loadsでまとめてパースします。
+
+    Args:
+        request: 受信中のリクエスト。
+        model: 変換先のPydanticモデル。
+        max_bytes: ボディの最大バイト数。省略時は登録済みの上限を使います。
+
+    Returns:
+        ModelT: 検証済みのリクエストモデル。
+
+    Raises:
+        HTTPException: サイズ超過で413、JSON不正で400エラーを送出。
+        RequestValidationError: スキーマ検証に失敗した場合（FastAPIの422応答になる）。
+    """
+    chunks = []
+    try:
+        async for chunk in read_limited_chunks(request, max_bytes or _MAX_REQUEST_BODY_BYTES):
+            chunks.append(chunk)
+    except RequestBodyTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+
+    try:
+        data = json.loads(b"".join(chunks))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"JSONの形式が不正です: {exc}") from exc
+
+    try:
+        return model.model_validate(data)
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False), body=None) from exc
+
+
+def json_body_openapi(model: Type[BaseModel]) -> Dict[str, Any]:
+    """parse_json_bodyで読むボディのスキーマをOpenAPIへ載せるためのopenapi_extraを返します。
+
+    Requestを直接受け取るルートはFastAPIがボディのスキーマを生成しないため、
+    ルートデコレーターの ``openapi_extra`` に渡して明示します。
+
+    Args:
+        model: ボディのPydanticモデル。
+
+    Returns:
+        Dict[str, Any]: requestBodyの定義。
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
+
+
+def summarize_for_log(value: Any, max_chars: int = LOG_FIELD_MAX_CHARS) -> str:
+    """ログ出力用に長い値を切り詰め、全体の長さとハッシュを付与します。
+
+    Args:
+        value: ログへ出力する値。
+        max_chars: そのまま出力する最大文字数。
+
+    Returns:
+        str: 切り詰めた文字列。短い値はそのまま返します。
+    """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= max_chars:
+        return text
+    digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()[:16]
+    return f"{text[:max_chars]}...(truncated, {len(text)} chars, sha256={digest})"
@@ -2,19 +2,63 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, FastAPI, HTTPException
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
+from src.api.request_body import json_body_openapi, parse_json_body, summarize_for_log
 from src.constants import file_names
+from src.db.repository import (
+    FlowRequestCursor,
+    find_flow_session_id,
+    get_flow_request_drawio,
+    list_flow_request_page,
+    summarize_flow_request_usage,
+)
+from src.db.session import get_async_db_session
 from src.settings.settings import Settings
 from src.llm.base_llm_client import BaseLLMClient
+from src.observability.loop_monitor import get_loop_monitor_singleton
+from src.observability.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_metrics_singleton
+from src.observability.readiness import get_readiness_singleton
+from src.observability.tracing import get_tracer_singleton, trace_span
+from src.observability.usage import get_usage_ledger_singleton
 from src.schemas.requests import LLMBatchRequest, LLMMessageRequest
 from src.services.agent import define_flow_agent
+from src.services.attachment_extraction import get_attachment_extractor_singleton
+from src.services.attachment_retrieval import get_attachment_retriever_singleton
+from src.services.attachments import (
+    AttachmentError,
+    AttachmentTooLargeError,
+    build_prompt_with_attachments,
+    collect_attachment_texts,
+    get_attachment_store_singleton,
+)
+from src.services.batch_job_queue import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_SUCCEEDED,
+    BatchJobQueue,
+    get_batch_job_queue_singleton,
+)
+from src.services.flow_history import get_flow_history_recorder_singleton
 from src.services.prompt_builder import PromptBuilder
-from src.services.session_manager import SessionManager
+from src.services.session_manager import SessionManager, get_session_manager_singleton
+from src.services.single_flight import flight_key, get_generation_flights_singleton
+from src.services.stream_replay import (
+    SSE_MEDIA_TYPE,
+    ReplayGapError,
+    get_stream_replay_registry_singleton,
+    ndjson_events,
+    parse_event_id,
+    sse_events,
+)
 
 
 def register_routes(
@@ -31,39 +75,269 @@ def register_routes(
     router = APIRouter()
     logger = logging.getLogger(__name__)
 
-    async def wrap_stream_with_logging(stream):
+    async def wrap_stream_with_logging(stream, leading_events=None, started_at=None):
         """ストリームレスポンスをログへ書き込みつつ透過的に返却します。
 
         Args:
             stream: LLMから受け取るストリームジェネレーター。
+            leading_events: ストリームの先頭に追加で流すイベントの一覧。
+            started_at: リクエスト受信時刻（time.perf_counter）。指定時は所要時間を記録します。
 
         Yields:
             Any: ストリーミングされたチャンク。
         """
-        async for chunk in stream:
-            logger.info("stream_response_chunk: %s", chunk)
-            yield chunk
+        metrics = get_metrics_singleton()
+        metrics.active_streams.inc()
+        # ジェネレーターは別のコンテキストから閉じられることがあるため、現在のスパンは切り替えない
+        span = get_tracer_singleton().start_span("response.stream")
+        # 最後まで流し切らずに終わった場合（クライアント切断など）はcancelledのまま記録する
+        outcome = "cancelled"
+        # チャンクごとのログはトークン単位の書き込みになるため、ストリーム単位の要約にまとめる
+        chunk_count = 0
+        byte_count = 0
+        try:
+            for event in leading_events or []:
+                yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            failed = False
+            async for chunk in stream:
+                chunk_count += 1
+                byte_count += len(chunk)
+                if chunk.startswith(b'{"type": "error"'):
+                    failed = True
+                    logger.warning("stream_response_error: %s", summarize_for_log(chunk))
+                yield chunk
+            outcome = "error" if failed else "ok"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            logger.info(
+                "stream_response_summary: outcome=%s chunks=%s bytes=%s",
+                outcome,
+                chunk_count,
+                byte_count,
+            )
+            metrics.active_streams.dec()
+            if span is not None:
+                span.set_attribute("outcome", outcome)
+                span.end()
+            if started_at is not None:
+                metrics.request_duration.labels(outcome).observe(time.perf_counter() - started_at)
+
+    def resume_stream(request: Request, session_id: str, last_event_id: str | None):
+        """Last-Event-IDの続きから生成中（または生成済み）のストリームを再送します。
+
+        新しいLLM呼び出しは行わず、リングバッファに残っているイベントを流した後に
+        生成中であれば以降のイベントを続けて流します。
+
+        Args:
+            request: 再接続したリクエスト。切断の検知に使います。
+            session_id: ストリームを生成したセッションID。
+            last_event_id: クライアントが最後に受け取ったイベントのID。
+
+        Returns:
+            StreamingResponse: SSE形式のストリーム。
+
+        Raises:
+            HTTPException: IDが不正・ストリームが存在しない場合は404、再送できない場合は410。
+        """
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            raise HTTPException(status_code=400, detail="Last-Event-IDの形式が不正です")
+        stream_id, after_seq = parsed
+        stream = get_stream_replay_registry_singleton().get(stream_id)
+        if stream is None or stream.session_id != session_id:
+            raise HTTPException(status_code=404, detail="再開できるストリームが見つかりません")
+        try:
+            stream.check_resumable(after_seq)
+        except ReplayGapError as exc:
+            raise HTTPException(status_code=410, detail=str(exc)) from exc
+        logger.info(
+            "Resuming stream %s for session %s after event %s", stream_id, session_id, after_seq
+        )
+        return StreamingResponse(
+            sse_events(stream, after_seq, request.is_disconnected),
+            media_type=SSE_MEDIA_TYPE,
+            headers=SSE_HEADERS,
+        )
+
+    async def start_agent_stream(session_id, user_prompt, attachments, started_at):
+        """添付を展開してエージェントを実行し、ログ・計測付きの生成ストリームを返します。
+
+        Args:
+            session_id: セッションID。
+            user_prompt: 添付を展開する前のユーザープロンプト。
+            attachments: リクエストで参照する添付。
+            started_at: リクエスト受信時刻（time.perf_counter）。
+
+        Returns:
+            AsyncGenerator[bytes, None]: 1行1イベントのNDJSONストリーム。
+
+        Raises:
+            HTTPException: 添付の抽出に失敗した場合、またはストリームが得られなかった場合。
+        """
+        request_prompt = user_prompt
+        leading_events = []
+        if attachments:
+            try:
+                with trace_span("attachments.extract", attachments=len(attachments)):
+                    extracted_texts = await get_attachment_extractor_singleton().extract_many(
+                        attachments
+                    )
+            except AttachmentError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            texts = collect_attachment_texts(attachments, extracted_texts)
+            # 大きな添付は今回の指示に関連するチャンクだけを送る。
+            # 索引の作成と検索は重いため、イベントループを止めないようワーカースレッドで行う
+            with trace_span("attachments.retrieve"):
+                retrieval = await asyncio.to_thread(
+                    get_attachment_retriever_singleton().select,
+                    session_id,
+                    user_prompt,
+                    attachments,
+                    texts,
+                )
+            if retrieval is not None:
+                texts.update(retrieval.texts)
+                leading_events.append(retrieval.to_event())
+            user_prompt = build_prompt_with_attachments(user_prompt, attachments, texts)
+
+        with trace_span("define_flow_agent"):
+            agent_graph = await define_flow_agent(
+                session_id,
+                user_prompt,
+            )
+        initial_state = {
+            "user_prompt": user_prompt,
+        }
+        with trace_span("agent.ainvoke"):
+            state = await agent_graph.ainvoke(initial_state)
+        stream = state.get("generator")
+        if stream is None:
+            raise HTTPException(status_code=500, detail="エージェントがストリームを返しませんでした")
+        # 履歴には添付を展開する前のプロンプトを残す
+        stream = get_flow_history_recorder_singleton().record_stream(
+            stream, session_id, request_prompt, bool(state.get("is_first_request"))
+        )
+        return wrap_stream_with_logging(stream, leading_events, started_at)
+
+    def generation_response(request: Request, replay, reserved: bool = False):
+        """生成中のストリームを、Acceptヘッダーに応じてSSEまたはNDJSONで返します。
+
+        Args:
+            request: 生成を要求したリクエスト。
+            replay: 購読するReplayableStream。
+            reserved: Trueの場合はreplayで確保済みの購読者を引き継ぎます。
+
+        Returns:
+            StreamingResponse: SSE形式（text/event-stream）または既存のNDJSON形式のストリーム。
+        """
+        # 本文を流し始める前に切断された場合も、確保した購読者をレスポンスの終了時に解放する
+        background = BackgroundTask(replay.release_reservation) if reserved else None
+        if SSE_MEDIA_TYPE in request.headers.get("accept", ""):
+            # SSEでは接続が切れても生成を続け、Last-Event-IDでの再接続に備えて保持する
+            return StreamingResponse(
+                sse_events(replay, is_disconnected=request.is_disconnected, reserved=reserved),
+                media_type=SSE_MEDIA_TYPE,
+                headers=SSE_HEADERS,
+                background=background,
+            )
+
+        headers = {
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+        }
+        return StreamingResponse(
+            # NDJSONのクライアントが全員切断したら上流の生成を止める
+            ndjson_events(replay, request.is_disconnected, reserved=reserved),
+            media_type="text/plain; charset=utf-8",
+            headers=headers,
+            background=background,
+        )
+
+    async def join_generation(request: Request, pending):
+        """同一リクエストの生成が始まるのを待ち、そのストリームを先頭から返します。
+
+        Args:
+            request: 後から届いた同一のリクエスト。
+            pending: 先行リクエストがストリームを開始した時点で完了するFuture。
+
+        Returns:
+            StreamingResponse: 先行リクエストと同じ生成ストリーム。
+
+        Raises:
+            HTTPException: 先行リクエストが生成の開始前に中断された場合は503。
+                先頭のイベントがバッファの上限で破棄済みの場合は410。
+                準備中に失敗した場合は先行リクエストと同じ例外。
+        """
+        try:
+            replay = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            raise HTTPException(
+                status_code=503, detail="同一リクエストの生成が中断されました。再送してください"
+            ) from None
+        try:
+            replay.check_resumable(0)
+        except ReplayGapError as exc:
+            detail = "生成中の出力が再送バッファの上限を超えたため合流できません。完了後に再送してください"
+            raise HTTPException(status_code=410, detail=detail) from exc
+        get_metrics_singleton().coalesced_requests.inc()
+        logger.info(
+            "Joined in-flight generation %s for session %s", replay.stream_id, replay.session_id
+        )
+        return generation_response(request, replay)
 
     @router.get("/health")
     async def health_check():
         """APIの稼働状況を返却します。
 
         Returns:
-            dict: 稼働ステータスとタイムスタンプを含む情報。
+            dict: 稼働ステータス、タイムスタンプ、イベントループの遅延を含む情報。
         """
         return {
             "status": "ok",
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "service": "LLM Proxy Server",
+            "eventLoop": get_loop_monitor_singleton().snapshot(),
         }
 
-    @router.put("/sessions/{session_id}/flows")
-    async def llm_messages(session_id: str, payload: LLMMessageRequest):
+    @router.get("/ready")
+    async def readiness_check():
+        """ロードバランサー向けに、このワーカーが新しいリクエストを受け付けられるかを返します。
+
+        同時ストリーム数・イベントループの遅延・セッションキャッシュの使用量・上流の応答開始時間の
+        いずれかがしきい値を超えた場合は503を返し、トラフィックを他のワーカーへ逃がします。
+
+        Returns:
+            JSONResponse: 判定結果と各項目の値・しきい値。
+        """
+        ready, body = get_readiness_singleton().evaluate()
+        body["timestamp"] = datetime.now(timezone.utc).isoformat()
+        return JSONResponse(body, status_code=200 if ready else 503)
+
+    @router.get("/metrics")
+    async def export_metrics():
+        """生成パイプラインのメトリクスをPrometheusのテキスト形式で返却します。
+
+        Returns:
+            PlainTextResponse: カウンタ・ゲージ・ヒストグラムの現在値。
+        """
+        return PlainTextResponse(
+            get_metrics_singleton().render(), media_type=METRICS_CONTENT_TYPE
+        )
+
+    @router.put(
+        "/sessions/{session_id}/flows", openapi_extra=json_body_openapi(LLMMessageRequest)
+    )
+    async def llm_messages(session_id: str, request: Request):
         """業務フロー生成を実行し、結果をストリーミングで返すエンドポイントです。
 
         Args:
             session_id: パスで指定されたセッションID。
-            payload: プロンプト・セッション・ストリーミング指定を含むリクエスト。
+            request: LLMMessageRequest形式のJSONボディを持つリクエスト。
 
         Returns:
             Response: ストリーミング時はStreamingResponse、非ストリーミング時はJSONResponse。
@@ -72,42 +346,66 @@ def register_routes(
             HTTPException: プロンプトが空の場合に400エラーを送出。
         """
 
-        user_prompt = (payload.user_prompt or "").strip()
-        logger.info("llm_messages payload: %s", user_prompt)
+        started_at = time.perf_counter()
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id:
+            # 再接続時はボディを読まず、生成中のストリームの続きを返す
+            return resume_stream(request, session_id.strip(), last_event_id)
 
-        if not user_prompt:
-            raise HTTPException(status_code=400, detail="プロンプトが必要です")
+        # 数MBのプロンプトを想定し、上限付きで受信してからログには要約だけを残す
+        with trace_span("parse_request_body"):
+            payload = await parse_json_body(request, LLMMessageRequest)
+        user_prompt = (payload.user_prompt or "").strip()
+        logger.info("llm_messages payload: %s", summarize_for_log(user_prompt))
 
         if not session_id or not session_id.strip():
             raise HTTPException(status_code=400, detail="session_id path parameter is required")
         session_id = session_id.strip()
 
+        store = get_attachment_store_singleton()
+        if payload.attachment_ids is None:
+            attachments = store.session_attachments(session_id)
+        else:
+            try:
+                attachments = store.resolve(payload.attachment_ids)
+            except AttachmentError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            # 一度参照した添付はセッションに登録し、以降のリクエストではIDの送信を省略できる
+            attachments = store.register_session(session_id, attachments)
+
+        if not user_prompt and not attachments:
+            raise HTTPException(status_code=400, detail="プロンプトが必要です")
+
         use_agent_mode = bool(payload.use_agent_mode)
-        logger.info(session_id, use_agent_mode)
+        logger.info("session_id=%s use_agent_mode=%s", session_id, use_agent_mode)
 
         if use_agent_mode:
-            agent_graph = await define_flow_agent(
-                session_id,
-                user_prompt,
+            # 二重クリックや再送による同一リクエストは生成中のストリームを共有し、
+            # 上流の呼び出しとSessionManagerの更新を1回にまとめる
+            flights = get_generation_flights_singleton()
+            key = flight_key(
+                session_id, user_prompt, (attachment.sha256 for attachment in attachments)
             )
-            initial_state = {
-                "user_prompt": user_prompt,
-            }
-            state = await agent_graph.ainvoke(initial_state)
-            stream = state.get("generator")
-            if stream is None:
-                raise HTTPException(status_code=500, detail="エージェントがストリームを返しませんでした")
-
-            headers = {
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-            }
-            return StreamingResponse(
-                wrap_stream_with_logging(stream),
-                media_type="text/plain; charset=utf-8",
-                headers=headers,
+            pending = flights.join(key)
+            if pending is not None:
+                return await join_generation(request, pending)
+
+            future = flights.lead(key)
+            try:
+                stream = await start_agent_stream(session_id, user_prompt, attachments, started_at)
+            except BaseException as exc:
+                flights.abandon(key, future, exc)
+                raise
+            # 後から合流したリクエストにも先頭から流せるよう、生成中はバイト数の上限まで保持する。
+            # 合流したリクエストが先に切断しても生成が止まらないよう、このリクエストの購読を確保する
+            replay = flights.publish(
+                key,
+                future,
+                get_stream_replay_registry_singleton().create(
+                    session_id, stream, keep_all=True, reserve=True
+                ),
             )
+            return generation_response(request, replay, reserved=True)
         
         else:
             pass
@@ -141,34 +439,304 @@ def register_routes(
 
             # return JSONResponse({**result, "actualPrompt": system_prompt})
 
-    # @router.post("/api/llm/messages-batch")
-    # async def llm_messages_batch(payload: LLMBatchRequest):
-    #     """バッチモードでLLMメッセージを生成します。
+    @router.get("/sessions/{session_id}/flows/events")
+    async def resume_flow_events(
+        session_id: str,
+        request: Request,
+        last_event_id: str | None = Query(None, alias="lastEventId"),
+    ):
+        """SSEで受信していた生成ストリームへ再接続します。
 
-    #     Args:
-    #         payload: プロンプトとセッションIDを含むリクエスト。
+        EventSourceの自動再接続が送るLast-Event-IDヘッダー、またはlastEventIdクエリで
+        最後に受け取ったイベントを指定します。
 
-    #     Returns:
-    #         JSONResponse: LLM APIからの結果をまとめたJSONレスポンス。
+        Args:
+            session_id: パスで指定されたセッションID。
+            request: Last-Event-IDヘッダーを持つリクエスト。
+            last_event_id: ヘッダーを送れないクライアント向けのイベントID。
 
-    #     Raises:
-    #         HTTPException: プロンプトが空の場合に400エラーを送出。
-    #     """
-    #     logger.info("llm_messages_batch payload: %s", payload.dict())
-    #     user_prompt = (payload.user_prompt or "").strip()
-    #     if not user_prompt:
-    #         raise HTTPException(status_code=400, detail="プロンプトが必要です")
+        Returns:
+            StreamingResponse: 未受信のイベントから始まるSSE形式のストリーム。
+        """
+        return resume_stream(
+            request, session_id.strip(), request.headers.get("last-event-id") or last_event_id
+        )
+
+    async def receive_attachments(request: Request, session_id: str | None = None) -> dict:
+        """multipartリクエストから添付を保存し、レスポンス用の辞書を返します。
+
+        Args:
+            request: ファイルパートを含むmultipartリクエスト。
+            session_id: 指定した場合、保存した添付を紐づけるセッションID。
+
+        Returns:
+            dict: 保存した添付のID・サイズ・SHA-256の一覧。
+
+        Raises:
+            HTTPException: 形式不正やファイル数超過で400、サイズ超過で413エラーを送出。
+        """
+        store = get_attachment_store_singleton()
+        try:
+            attachments = await store.receive_multipart(
+                request.headers.get("content-type", ""), request.stream(), session_id
+            )
+        except AttachmentTooLargeError as exc:
+            raise HTTPException(status_code=413, detail=str(exc)) from exc
+        except AttachmentError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+        if not attachments:
+            raise HTTPException(status_code=400, detail="添付ファイルが含まれていません")
+        # docx/xlsx/pptx/pdfはアップロード直後から抽出を始め、生成リクエスト時の待ち時間を減らす
+        get_attachment_extractor_singleton().prefetch(attachments)
+        return {"attachments": [attachment.to_dict() for attachment in attachments]}
+
+    @router.post("/attachments", status_code=201)
+    async def upload_attachments(request: Request):
+        """multipart/form-dataで送信された添付ファイルを保存し、IDを払い出します。
+
+        Args:
+            request: ファイルパートを含むmultipartリクエスト。
+
+        Returns:
+            dict: 保存した添付のID・サイズ・SHA-256の一覧。
+        """
+        return await receive_attachments(request)
+
+    @router.post("/sessions/{session_id}/attachments", status_code=201)
+    async def upload_session_attachments(session_id: str, request: Request):
+        """添付ファイルを保存してセッションに紐づけます。
+
+        以降の `PUT /sessions/{session_id}/flows` で `attachment_ids` を省略すると、
+        紐づけた添付がサーバー側でプロンプトへ組み込まれます。
+
+        Args:
+            session_id: 紐づけ先のセッションID。
+            request: ファイルパートを含むmultipartリクエスト。
+
+        Returns:
+            dict: セッションに紐づいた添付のID・サイズ・SHA-256の一覧。
+        """
+        return await receive_attachments(request, session_id.strip())
+
+    @router.get("/sessions/{session_id}/attachments")
+    async def list_session_attachments(session_id: str):
+        """セッションに紐づく添付の一覧を返します。
+
+        Args:
+            session_id: 対象のセッションID。
+
+        Returns:
+            dict: 添付のID・サイズ・SHA-256の一覧。
+        """
+        attachments = get_attachment_store_singleton().session_attachments(session_id.strip())
+        return {"attachments": [attachment.to_dict() for attachment in attachments]}
+
+    @router.get("/usage")
+    async def get_usage_summary(top: int = Query(20, ge=1, le=200)):
+        """プロセス起動以降のトークン使用量と概算コストを返します。
+
+        Args:
+            top: 消費の多い順に返すセッション数。
+
+        Returns:
+            dict: 全体・モデル別の合計と、消費の多いセッションの一覧。
+        """
+        return get_usage_ledger_singleton().summary(top)
+
+    @router.get("/usage/history")
+    async def get_usage_history(
+        days: int | None = Query(None, ge=1, le=3650),
+        db: AsyncSession = Depends(get_async_db_session),
+    ):
+        """保存済みのトークン使用量をモデルとリクエスト種別（初回生成/修正）ごとに返します。
+
+        Args:
+            days: 直近何日分を集計するか。省略時は全期間。
+            db: 非同期DBセッション。
+
+        Returns:
+            dict: 集計期間の開始日時と集計行。
+        """
+        since = datetime.now() - timedelta(days=days) if days else None
+        items = await summarize_flow_request_usage(db, since)
+        return {"since": since.isoformat() if since else None, "items": items}
+
+    @router.get("/sessions/{session_id}/usage")
+    async def get_session_usage(session_id: str):
+        """セッションのトークン使用量と概算コストを返します。
+
+        Args:
+            session_id: 対象のセッションID。
+
+        Returns:
+            dict: セッション合計とモデル別の内訳。
+
+        Raises:
+            HTTPException: 使用量の記録がない場合に404エラーを送出。
+        """
+        summary = get_usage_ledger_singleton().session_summary(session_id.strip())
+        if summary is None:
+            raise HTTPException(status_code=404, detail="使用量の記録がありません")
+        return summary
+
+    @router.get("/sessions/{session_id}/partial")
+    async def get_session_partial_content(session_id: str):
+        """クライアント切断で中断した生成の、途中までの本文を返します。
+
+        PERSIST_PARTIAL_ON_CANCELが有効な場合のみ保存され、同じセッションで
+        次の生成が最後まで完了した時点で破棄されます。
+
+        Args:
+            session_id: 対象のセッションID。
+
+        Returns:
+            dict: 途中までの本文と保存日時。
+
+        Raises:
+            HTTPException: 保存された本文がない場合に404エラーを送出。
+        """
+        partial = get_session_manager_singleton().get_partial_content(session_id.strip())
+        if partial is None:
+            raise HTTPException(status_code=404, detail="中断された生成の本文はありません")
+        return {"sessionId": session_id.strip(), **partial}
+
+    @router.get("/sessions/{session_id}/requests")
+    async def list_session_requests(
+        session_id: str,
+        limit: int = Query(20, ge=1, le=100),
+        cursor: str | None = None,
+        db: AsyncSession = Depends(get_async_db_session),
+    ):
+        """セッションのリクエスト履歴を新しい順に返します。
+
+        `PUT /sessions/{session_id}/flows` の生成はPERSIST_INTERACTIVE_REQUESTSが有効な場合に、
+        一括生成ジョブはジョブごとのセッション（batch-<jobId>）に記録されます。
+
+        Args:
+            session_id: 対象のセッションID（FlowSession.session_key）。
+            limit: 1ページの件数。
+            cursor: 前ページのレスポンスに含まれるnextCursor。
+            db: 非同期DBセッション。
+
+        Returns:
+            dict: 履歴のメタデータ一覧と次ページのカーソル。drawio本体は含みません。
+
+        Raises:
+            HTTPException: cursorが不正な場合に400、セッションが存在しない場合に404エラーを送出。
+        """
+        try:
+            page_cursor = FlowRequestCursor.decode(cursor) if cursor else None
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+        flow_session_id = await find_flow_session_id(db, session_id.strip())
+        if flow_session_id is None:
+            raise HTTPException(status_code=404, detail="セッションが見つかりません")
 
-    #     session_id = (payload.sessionId or "default").strip() or "default"
-    #     is_first, previous_drawio = await session_manager.register_request(session_id)
-    #     system_prompt = prompt_builder.build_prompt(user_prompt, is_first, previous_drawio, session_id)
+        items, next_cursor = await list_flow_request_page(db, flow_session_id, limit, page_cursor)
+        return {
+            "sessionId": session_id,
+            "items": items,
+            "nextCursor": next_cursor.encode() if next_cursor else None,
+        }
+
+    @router.get("/sessions/{session_id}/requests/{request_id}")
+    async def get_session_request_drawio(
+        session_id: str,
+        request_id: int,
+        db: AsyncSession = Depends(get_async_db_session),
+    ):
+        """履歴のうち1件のdrawioを返します。
+
+        Args:
+            session_id: 対象のセッションID（FlowSession.session_key）。
+            request_id: 履歴一覧のrequestId。
+            db: 非同期DBセッション。
+
+        Returns:
+            dict: リクエストIDとdrawio。
+
+        Raises:
+            HTTPException: セッションまたはリクエストが存在しない場合に404エラーを送出。
+        """
+        flow_session_id = await find_flow_session_id(db, session_id.strip())
+        if flow_session_id is None:
+            raise HTTPException(status_code=404, detail="セッションが見つかりません")
+
+        found, drawio = await get_flow_request_drawio(db, flow_session_id, request_id)
+        if not found:
+            raise HTTPException(status_code=404, detail="リクエストが見つかりません")
+        return {"requestId": request_id, "drawio": drawio}
+
+    @router.post(
+        "/flows/batch", status_code=202, openapi_extra=json_body_openapi(LLMBatchRequest)
+    )
+    async def submit_flow_batch(request: Request):
+        """複数プロンプトを一括生成ジョブとして登録します。
+
+        Args:
+            request: LLMBatchRequest形式のJSONボディを持つリクエスト。
+
+        Returns:
+            dict: 登録したジョブIDと状態の一覧。
+
+        Raises:
+            HTTPException: プロンプトが空の場合に400、件数がBATCH_MAX_PROMPTSを超える場合に422、
+                ジョブキュー未構成時に503エラーを送出。
+        """
+        payload = await parse_json_body(request, LLMBatchRequest)
+        prompts = [prompt.strip() for prompt in payload.prompts]
+        if not prompts or not all(prompts):
+            raise HTTPException(status_code=400, detail="プロンプトが必要です")
+
+        job_queue = _require_batch_job_queue()
+        if len(prompts) > job_queue.max_batch_size:
+            raise HTTPException(
+                status_code=422,
+                detail=f"一括生成できるプロンプトは最大{job_queue.max_batch_size}件です",
+            )
+        jobs = await job_queue.submit(prompts, payload.user_label)
+        logger.info("flow batch submitted: %s jobs", len(jobs))
+        return {"jobs": jobs}
 
-    #     result = await llm_client.send_message(system_prompt, user_prompt)
-    #     content = result.get("content", "")
-    #     if content:
-    #         await session_manager.cache_drawio_if_present(session_id, content)
+    @router.get("/flows/batch/{job_id}")
+    async def get_flow_batch_job(job_id: str):
+        """一括生成ジョブの状態を返却します。
 
-    #     return JSONResponse({**result, "actualPrompt": user_prompt})
+        Args:
+            job_id: submit時に払い出したジョブID。
+
+        Returns:
+            dict: ジョブの状態。
+
+        Raises:
+            HTTPException: ジョブが存在しない場合に404エラーを送出。
+        """
+        job = await _require_batch_job_queue().get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+        return job
+
+    @router.get("/flows/batch/{job_id}/result")
+    async def get_flow_batch_result(job_id: str):
+        """完了した一括生成ジョブのdrawioを返却します。
+
+        Args:
+            job_id: submit時に払い出したジョブID。
+
+        Returns:
+            dict: ジョブの状態と生成されたdrawio。
+
+        Raises:
+            HTTPException: ジョブが存在しない場合に404、未完了の場合に409エラーを送出。
+        """
+        job = await _require_batch_job_queue().get_result(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+        if job["status"] not in (JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED):
+            raise HTTPException(status_code=409, detail="ジョブはまだ完了していません")
+        return job
 
     # @router.get("/")
     # async def root():
@@ -186,3 +754,27 @@ def register_routes(
     #     return FileResponse(demo_path)
 
     app.include_router(router)
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+    # nginx等のリバースプロキシにバッファリングさせない
+    "X-Accel-Buffering": "no",
+}
+
+
+def _require_batch_job_queue() -> BatchJobQueue:
+    """登録済みのBatchJobQueueを返します。
+
+    Returns:
+        BatchJobQueue: create_appで登録されたジョブキュー。
+
+    Raises:
+        HTTPException: ジョブキューが構成されていない場合に503エラーを送出。
+    """
+    job_queue = get_batch_job_queue_singleton()
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="バッチジョブキューが利用できません")
+    return job_queue
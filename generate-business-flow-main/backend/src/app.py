@@ -2,23 +2,74 @@
 
 from __future__ import annotations
 
+import asyncio
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
+from src.api.request_body import set_max_request_body_bytes
 from src.api.routes import register_routes
 from src.constants import file_names
+from src.db.session import dispose_async_engine
 from src.settings.settings import Settings
 from src.llm.anthropic_llm_client import AnthropicLLMClient
+from src.observability.log_config import configure_queue_logging, parse_log_rules
+from src.observability.loop_monitor import LoopMonitor, set_loop_monitor_singleton
+from src.observability.metrics import GenerationMetrics, set_metrics_singleton
+from src.observability.profiling import (
+    PROFILE_HEADER,
+    PROFILE_ID_HEADER,
+    ProfileSession,
+    ProfilingDenied,
+    RequestProfiler,
+    activate_profile,
+)
+from src.observability.readiness import (
+    ReadinessChecker,
+    ReadinessThresholds,
+    set_readiness_singleton,
+)
+from src.observability.tracing import (
+    STATUS_ERROR,
+    TRACE_ID_HEADER,
+    OTLPJsonFileExporter,
+    Span,
+    Tracer,
+    current_trace_id,
+    get_tracer_singleton,
+    set_tracer_singleton,
+    use_span,
+)
+from src.observability.usage import UsageLedger, set_usage_ledger_singleton
+from src.services.attachment_extraction import (
+    AttachmentTextExtractor,
+    set_attachment_extractor_singleton,
+)
+from src.services.attachment_retrieval import (
+    AttachmentRetriever,
+    set_attachment_retriever_singleton,
+)
+from src.services.attachments import AttachmentStore, set_attachment_store_singleton
+from src.services.batch_job_queue import BatchJobQueue, set_batch_job_queue_singleton
+from src.services.flow_history import FlowHistoryRecorder, set_flow_history_recorder_singleton
 from src.services.prompt_builder import PromptBuilder
+from src.services.retention_scheduler import RetentionScheduler
 from src.services.session_manager import SessionManager, set_session_manager_singleton
+from src.services.single_flight import GenerationFlights, set_generation_flights_singleton
+from src.services.stream_replay import (
+    StreamReplayRegistry,
+    set_stream_replay_registry_singleton,
+)
 
 
 LOGGER = logging.getLogger("app")
+# 監視系のポーリングはトレースの対象外にする
+UNTRACED_PATHS = frozenset({"/health", "/ready", "/metrics"})
 
 
 def create_app() -> FastAPI:
@@ -28,16 +79,111 @@ def create_app() -> FastAPI:
         FastAPI: ルーティングやミドルウェアを設定済みのアプリケーション。
     """
     settings = Settings.load()
+    set_metrics_singleton(GenerationMetrics())
+    set_usage_ledger_singleton(UsageLedger(max_sessions=settings.usage_tracked_sessions))
+    tracer = Tracer(
+        sample_rate=settings.trace_sample_rate,
+        exporter=(
+            OTLPJsonFileExporter(settings.trace_export_path)
+            if settings.trace_sample_rate > 0
+            else None
+        ),
+    )
+    set_tracer_singleton(tracer)
+    loop_monitor = LoopMonitor(
+        interval_ms=settings.loop_monitor_interval_ms,
+        block_threshold_ms=settings.loop_block_threshold_ms,
+    )
+    set_loop_monitor_singleton(loop_monitor)
     session_manager = SessionManager()
     set_session_manager_singleton(session_manager)
+    set_readiness_singleton(
+        ReadinessChecker(
+            ReadinessThresholds(
+                max_streams=settings.ready_max_streams,
+                max_loop_lag_ms=settings.ready_max_loop_lag_ms,
+                max_session_cache_mb=settings.ready_max_session_cache_mb,
+                max_upstream_ttft_ms=settings.ready_max_upstream_ttft_ms,
+            ),
+            session_cache_bytes=session_manager.cache_size_bytes,
+            upstream_window_seconds=settings.ready_upstream_window_seconds,
+        )
+    )
+    stream_replay_registry = StreamReplayRegistry(
+        buffer_events=settings.stream_replay_buffer_events,
+        retention_seconds=settings.stream_replay_retention_seconds,
+        max_streams=settings.stream_replay_max_streams,
+        resume_grace_seconds=settings.stream_resume_grace_seconds,
+        buffer_bytes=settings.stream_replay_buffer_bytes,
+    )
+    set_stream_replay_registry_singleton(stream_replay_registry)
+    set_generation_flights_singleton(GenerationFlights())
     llm_client = AnthropicLLMClient(  # いずれはymlからとってきてFactoryで振り分ける
         api_key=settings.api_key,
         api_url=settings.api_url,
     )
+    batch_job_queue = BatchJobQueue(
+        llm_client=llm_client,
+        prompt_builder=PromptBuilder(
+            settings.read_flow_prompt(),
+            settings.read_flow_modification_prompt(),
+        ),
+        concurrency=settings.batch_concurrency,
+        max_batch_size=settings.batch_max_prompts,
+    )
+    set_batch_job_queue_singleton(batch_job_queue)
+    set_flow_history_recorder_singleton(
+        FlowHistoryRecorder(enabled=settings.persist_interactive_requests)
+    )
+    set_attachment_store_singleton(
+        AttachmentStore(
+            max_bytes=settings.attachment_max_bytes,
+            max_files=settings.attachment_max_files,
+        )
+    )
+    attachment_extractor = AttachmentTextExtractor(
+        max_bytes=settings.attachment_max_bytes,
+        timeout_seconds=settings.extraction_timeout_seconds,
+        max_workers=settings.extraction_workers,
+    )
+    set_attachment_extractor_singleton(attachment_extractor)
+    set_max_request_body_bytes(settings.max_request_body_bytes)
+    set_attachment_retriever_singleton(
+        AttachmentRetriever(
+            token_budget=settings.attachment_token_budget,
+            top_k=settings.attachment_top_k,
+        )
+    )
 
     app = FastAPI(title="Claude Proxy Server", version="1.0.0")
-    _configure_logging()
+    _configure_logging(settings)
+    # 後に登録したミドルウェアほど外側になるため、トレースIDを使う計測を先に登録する
+    _setup_profiling(
+        app,
+        RequestProfiler(
+            token=settings.profile_token,
+            output_dir=settings.profile_dir,
+            max_per_hour=settings.profile_max_per_hour,
+            interval_ms=settings.profile_interval_ms,
+        ),
+    )
     _setup_middleware(app)
+    app.add_event_handler("startup", loop_monitor.start)
+    app.add_event_handler("shutdown", loop_monitor.stop)
+    app.add_event_handler("startup", batch_job_queue.start)
+    app.add_event_handler("shutdown", batch_job_queue.stop)
+    app.add_event_handler("shutdown", attachment_extractor.shutdown)
+    app.add_event_handler("shutdown", stream_replay_registry.shutdown)
+    app.add_event_handler("shutdown", dispose_async_engine)
+    app.add_event_handler("shutdown", tracer.shutdown)
+    if settings.retention_enabled:
+        retention_scheduler = RetentionScheduler(
+            older_than_days=settings.retention_days,
+            interval_seconds=settings.retention_interval_seconds,
+            batch_size=settings.retention_batch_size,
+        )
+        app.add_event_handler("startup", retention_scheduler.start)
+        app.add_event_handler("shutdown", retention_scheduler.stop)
 
     # 定義順にルーティング先を走査するため、staticなコンテンツ（"/"は最後に持ってくる必要あり）
     register_routes(app)
@@ -45,37 +191,81 @@ def create_app() -> FastAPI:
     return app
 
 
-def _configure_logging() -> None:
-    """アプリ全体で利用するロギング設定を適用します。"""
+def _configure_logging(settings: Settings) -> None:
+    """アプリ全体で利用するロギング設定を適用します。
+
+    ファイルと標準エラーへの書き込みはQueueListenerのスレッドで行い、イベントループでは
+    レコードをキューへ積むだけにします。
+
+    Args:
+        settings: ログレベル・形式・サンプリング設定を含む設定。
+    """
     if getattr(_configure_logging, "_configured", False):
         return
 
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-
     # プロジェクトルート配下にログディレクトリを強制生成
     project_root = Path(__file__).resolve().parent.parent.parent
-    log_dir = project_root / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / "app.log"
-
-    logging.basicConfig(
-        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    listener = configure_queue_logging(
+        project_root / "logs" / "app.log",
+        level=logging.getLevelName(settings.log_level),
+        json_format=settings.log_json,
+        rules=parse_log_rules(settings.log_sampling),
     )
+    # 終了時にキューへ残ったレコードを書き出す
+    atexit.register(listener.stop)
 
-    file_handler = TimedRotatingFileHandler(
-        log_file,
-        when="midnight",
-        interval=1,
-        backupCount=7,
-        encoding="utf-8",
-    )
-    file_handler.suffix = "%Y%m%d"
-    file_handler.setFormatter(formatter)
+    _configure_logging._configured = True
 
-    root_logger = logging.getLogger()
-    root_logger.addHandler(file_handler)
 
-    _configure_logging._configured = True
+def _setup_profiling(app: FastAPI, profiler: RequestProfiler) -> None:
+    """``X-Profile-Token`` ヘッダー付きのリクエストを標本化プロファイラーで計測します。
+
+    ストリーミングレスポンスはボディを送り終えるまでを計測し、レポートは
+    ``<プロファイル出力先>/<日時>-<トレースID>.txt`` と ``.folded`` に書き出します。
+    PROFILE_TOKENが未設定の場合はミドルウェアを登録しません。
+
+    Args:
+        app: ミドルウェアを追加するFastAPIインスタンス。
+        profiler: トークン照合とレート制限を行うプロファイラー。
+    """
+    if not profiler.enabled:
+        return
+
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):  # type: ignore[override]
+        """ヘッダーで要求されたリクエストだけを計測します。
+
+        Args:
+            request: 受信したHTTPリクエスト。
+            call_next: 次のミドルウェアまたはエンドポイントを呼び出すコールバック。
+
+        Returns:
+            Response: 下流のレスポンス。計測を拒否した場合は403または429のレスポンス。
+        """
+        token = request.headers.get(PROFILE_HEADER)
+        if token is None:
+            return await call_next(request)
+
+        try:
+            session = profiler.start(
+                token, f"{request.method} {request.url.path}", current_trace_id()
+            )
+        except ProfilingDenied as exc:
+            headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+            return JSONResponse(
+                {"detail": exc.detail}, status_code=exc.status_code, headers=headers
+            )
+
+        with activate_profile(session):
+            try:
+                response = await call_next(request)
+            except Exception:
+                session.stop()
+                raise
+
+        response.headers[PROFILE_ID_HEADER] = session.name
+        response.body_iterator = _stop_profile_after_body(response.body_iterator, session)
+        return response
 
 
 def _setup_middleware(app: FastAPI) -> None:
@@ -91,7 +281,16 @@ def _setup_middleware(app: FastAPI) -> None:
         CORSMiddleware,
         allow_origins=["*"],
         allow_methods=["GET", "POST", "PUT", "OPTIONS"],
-        allow_headers=["Content-Type", "Authorization", "x-api-key", "anthropic-version"],
+        allow_headers=[
+            "Content-Type",
+            "Authorization",
+            "x-api-key",
+            "anthropic-version",
+            # SSEの再接続（fetchで送る場合）とプロファイル取得はカスタムヘッダーを使う
+            "Last-Event-ID",
+            PROFILE_HEADER,
+        ],
+        expose_headers=[TRACE_ID_HEADER, PROFILE_ID_HEADER],
     )
 
     @app.middleware("http")
@@ -109,6 +308,65 @@ def _setup_middleware(app: FastAPI) -> None:
         response = await call_next(request)
         return response
 
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):  # type: ignore[override]
+        """リクエストごとにトレースを開始し、トレースIDをレスポンスヘッダーへ付与します。
+
+        ストリーミングレスポンスではボディを送り終えた時点でルートスパンを閉じます。
+
+        Args:
+            request: 受信したHTTPリクエスト。
+            call_next: 次のミドルウェアまたはエンドポイントを呼び出すコールバック。
+
+        Returns:
+            Response: トレースIDヘッダーを付与したレスポンス。
+        """
+        if request.url.path in UNTRACED_PATHS:
+            return await call_next(request)
+
+        root = get_tracer_singleton().start_trace(
+            f"{request.method} {request.url.path}",
+            **{"http.method": request.method, "http.target": request.url.path},
+        )
+        # call_nextは内部でタスクを作るため、設定したスパンはルート処理側へ引き継がれる
+        with use_span(root):
+            try:
+                response = await call_next(request)
+            except Exception as exc:
+                root.set_error(f"{type(exc).__name__}: {exc}")
+                root.end()
+                raise
+
+        root.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            root.status = STATUS_ERROR
+        response.headers[TRACE_ID_HEADER] = root.trace_id
+        response.body_iterator = _end_span_after_body(response.body_iterator, root)
+        return response
+
+
+async def _end_span_after_body(body_iterator, span: Span):
+    """レスポンスボディを透過的に返し、送信し終えた時点でスパンを閉じます。"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        span.end()
+
+
+async def _stop_profile_after_body(body_iterator, session: ProfileSession):
+    """レスポンスボディを透過的に返し、送信し終えた時点で計測を終了します。"""
+    # ジェネレーターは別のコンテキストから閉じられることがあるため、ContextVarは切り替えず
+    # ボディを送り出すタスクだけを計測対象に加える
+    task = asyncio.current_task()
+    if task is not None:
+        session.tasks.add(task)
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        session.stop()
+
 
 def _setup_static_files(app: FastAPI, settings: Settings) -> None:
     """静的ファイルを /static パスで提供します。"""
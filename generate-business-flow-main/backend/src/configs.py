@@ -0,0 +1,34 @@
+"""Settings for the help desk agent sample (src.services.sample_agent)."""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+DEFAULT_OPENAI_MODEL = "gpt-4o-2024-08-06"
+
+
+@dataclass
+class Settings:
+    """HelpDeskAgentが利用するOpenAIの接続設定。"""
+
+    openai_api_key: str
+    openai_model: str = DEFAULT_OPENAI_MODEL
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """環境変数OPENAI_API_KEYとOPENAI_MODELから設定を読み込みます。
+
+        Returns:
+            Settings: 読み込んだ設定。
+
+        Raises:
+            RuntimeError: OPENAI_API_KEYが未設定の場合。
+        """
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        return cls(
+            openai_api_key=api_key,
+            openai_model=os.getenv("OPENAI_MODEL") or DEFAULT_OPENAI_MODEL,
+        )
@@ -0,0 +1,20 @@
+"""Logger factory for the help desk agent sample."""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+
+def setup_logger(name: str) -> logging.Logger:
+    """モジュールのファイルパスまたは名前からロガーを取得します。
+
+    ハンドラーはアプリ側のlog_configで設定されるため、ここでは追加しません。
+
+    Args:
+        name: ``__file__`` またはロガー名。ファイルパスの場合は拡張子を除いたファイル名を使います。
+
+    Returns:
+        logging.Logger: ``agent.<name>`` のロガー。
+    """
+    return logging.getLogger(f"agent.{Path(name).stem}")
@@ -1,15 +1,31 @@
 """SQLAlchemyによるDBユーティリティをまとめたパッケージ。"""
 
-from src.db.models import FlowRequest, FlowSession
+from src.db.models import FlowBatchJob, FlowDiagram, FlowRequest, FlowRequestArchive, FlowSession
 from src.db.scripts.create_all_tables import create_all_tables
-from src.db.session import Base, get_db_session, get_engine, get_session_factory
+from src.db.session import (
+    Base,
+    dispose_async_engine,
+    get_async_db_session,
+    get_async_engine,
+    get_async_session_factory,
+    get_db_session,
+    get_engine,
+    get_session_factory,
+)
 
 __all__ = [
     "Base",
     "get_db_session",
     "get_engine",
     "get_session_factory",
+    "get_async_db_session",
+    "get_async_engine",
+    "get_async_session_factory",
+    "dispose_async_engine",
     "create_all_tables",
     "FlowSession",
     "FlowRequest",
+    "FlowBatchJob",
+    "FlowDiagram",
+    "FlowRequestArchive",
 ]
@@ -0,0 +1,77 @@
+"""drawio等の大きなテキストを圧縮して保存するためのユーティリティ。"""
+
+from __future__ import annotations
+
+import zlib
+
+try:  # zstandardが無い環境ではzlibへフォールバックする
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def default_codec() -> str:
+    # 利用可能な中で最も圧縮率の高いコーデックを返す
+    """新規保存時に使うコーデック名を返します。
+
+    Returns:
+        str: zstandardが利用可能なら"zstd"、それ以外は"zlib"。
+    """
+
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress_text(text: str, codec: str | None = None) -> tuple[str, bytes]:
+    # UTF-8へエンコードしてから指定コーデックで圧縮する
+    """テキストを圧縮します。
+
+    Args:
+        text: 圧縮対象のテキスト。
+        codec: 使用するコーデック。未指定時はdefault_codec()。
+
+    Returns:
+        tuple[str, bytes]: 使用したコーデック名と圧縮後のバイト列。
+
+    Raises:
+        ValueError: 未対応のコーデックが指定された場合。
+    """
+
+    codec = codec or default_codec()
+    raw = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstdで圧縮するにはzstandardのインストールが必要です")
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == CODEC_ZLIB:
+        return codec, zlib.compress(raw, ZLIB_LEVEL)
+    raise ValueError(f"未対応のコーデックです: {codec}")
+
+
+def decompress_text(codec: str, data: bytes) -> str:
+    # 保存時のコーデックに合わせて伸長し、UTF-8としてデコードする
+    """圧縮済みのバイト列をテキストへ戻します。
+
+    Args:
+        codec: 保存時のコーデック名。
+        data: 圧縮済みのバイト列。
+
+    Returns:
+        str: 伸長したテキスト。
+
+    Raises:
+        ValueError: 未対応のコーデック、またはzstandardが無い環境でzstdを伸長しようとした場合。
+    """
+
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstdで圧縮されたデータの伸長にはzstandardのインストールが必要です")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    raise ValueError(f"未対応のコーデックです: {codec}")
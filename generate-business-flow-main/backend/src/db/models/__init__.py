@@ -2,7 +2,18 @@
 
 from __future__ import annotations
 
+from src.db.models.flow_batch_job import FlowBatchJob
+from src.db.models.flow_diagram import FlowDiagram
 from src.db.models.flow_request import FlowRequest
+from src.db.models.flow_request_archive import FlowRequestArchive
+from src.db.models.flow_request_usage import FlowRequestUsage
 from src.db.models.flow_session import FlowSession
 
-__all__ = ["FlowSession", "FlowRequest"]
+__all__ = [
+    "FlowSession",
+    "FlowRequest",
+    "FlowBatchJob",
+    "FlowDiagram",
+    "FlowRequestArchive",
+    "FlowRequestUsage",
+]
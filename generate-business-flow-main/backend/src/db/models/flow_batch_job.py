@@ -0,0 +1,33 @@
+"""業務フロー一括生成ジョブのテーブル定義。"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from sqlalchemy import ForeignKey, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from src.db.session import Base
+
+if TYPE_CHECKING:
+    from src.db.models.flow_request import FlowRequest
+
+
+class FlowBatchJob(Base):
+    """一括生成ジョブの状態と生成結果(FlowRequest)への参照を保持するエンティティ。"""
+
+    __tablename__ = "flow_batch_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    job_key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    status: Mapped[str] = mapped_column(String(16), index=True)
+    user_prompt: Mapped[str] = mapped_column(Text())
+    user_label: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    request_id: Mapped[int | None] = mapped_column(ForeignKey("flow_requests.id"), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text(), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    started_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(nullable=True)
+
+    request: Mapped["FlowRequest | None"] = relationship()
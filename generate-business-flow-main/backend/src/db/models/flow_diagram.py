@@ -0,0 +1,62 @@
+"""生成されたdrawioを圧縮保存するテーブル定義。"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from sqlalchemy import ForeignKey, Integer, LargeBinary, String, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from src.db.compression import compress_text, decompress_text
+from src.db.session import Base
+
+if TYPE_CHECKING:
+    from src.db.models.flow_request import FlowRequest
+
+
+class FlowDiagram(Base):
+    """FlowRequestの生成結果(drawio)を圧縮して保持するエンティティ。
+
+    本体(data)は遅延ロード列のため、codecやサイズだけを参照する場合は読み込まれません。
+    """
+
+    __tablename__ = "flow_diagrams"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    request_id: Mapped[int] = mapped_column(
+        ForeignKey("flow_requests.id", ondelete="CASCADE"), unique=True, index=True
+    )
+    codec: Mapped[str] = mapped_column(String(16))
+    raw_size: Mapped[int] = mapped_column(Integer())
+    data: Mapped[bytes] = mapped_column(LargeBinary(), deferred=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+
+    request: Mapped["FlowRequest"] = relationship(back_populates="diagram")
+
+    @classmethod
+    def from_xml(cls, drawio_xml: str) -> "FlowDiagram":
+        # drawioを圧縮して新しいFlowDiagramを作る
+        """drawioを圧縮したFlowDiagramを生成します。
+
+        Args:
+            drawio_xml: 保存するdrawio。
+
+        Returns:
+            FlowDiagram: 未保存のFlowDiagram。
+        """
+
+        codec, data = compress_text(drawio_xml)
+        return cls(codec=codec, raw_size=len(drawio_xml.encode("utf-8")), data=data)
+
+    @property
+    def xml(self) -> str:
+        # 参照時に伸長する（dataはこの時点で初めてロードされる）
+        """伸長したdrawioを返します。"""
+
+        return decompress_text(self.codec, self.data)
+
+    @xml.setter
+    def xml(self, drawio_xml: str) -> None:
+        self.codec, self.data = compress_text(drawio_xml)
+        self.raw_size = len(drawio_xml.encode("utf-8"))
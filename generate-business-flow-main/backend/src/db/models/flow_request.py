@@ -5,9 +5,11 @@ from __future__ import annotations
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, ForeignKey, Text, func
+from sqlalchemy import Boolean, ForeignKey, Index, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from src.db.models.flow_diagram import FlowDiagram
+from src.db.models.flow_request_usage import FlowRequestUsage
 from src.db.session import Base
 
 if TYPE_CHECKING:
@@ -15,15 +17,53 @@ if TYPE_CHECKING:
 
 
 class FlowRequest(Base):
-    """各リクエストのプロンプトと生成結果を保持するエンティティ。"""
+    """各リクエストのプロンプトと生成結果を保持するエンティティ。
+
+    生成結果のdrawioはflow_diagramsへ圧縮して別テーブルに保存し、drawio_xmlを参照したときに
+    だけ読み込みます。一覧取得ではこのテーブルの行(メタデータ)だけが読み込まれます。
+    """
 
     __tablename__ = "flow_requests"
+    __table_args__ = (
+        # セッション履歴を新しい順にキーセットページングするための複合インデックス
+        # PostgreSQLではis_initialもINCLUDEし、一覧のメタデータをインデックスだけで返せるようにする
+        Index(
+            "ix_flow_requests_session_created_id",
+            "session_id",
+            "created_at",
+            "id",
+            postgresql_include=["is_initial"],
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    session_id: Mapped[int] = mapped_column(ForeignKey("flow_sessions.id"), index=True)
+    session_id: Mapped[int] = mapped_column(ForeignKey("flow_sessions.id"))
     user_prompt: Mapped[str] = mapped_column(Text())
-    drawio_xml: Mapped[str | None] = mapped_column(Text(), nullable=True)
     is_initial: Mapped[bool] = mapped_column(Boolean(), default=False)
-    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    # キーセットページングのカーソルと同じ表現で保存するため、DB側のnow()ではなくPython側で採番する
+    # (SQLiteのCURRENT_TIMESTAMPは秒精度の文字列になり、バインドしたdatetimeと比較が一致しない)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
 
     session: Mapped["FlowSession"] = relationship(back_populates="requests")
+    diagram: Mapped["FlowDiagram | None"] = relationship(
+        back_populates="request", uselist=False, cascade="all, delete-orphan"
+    )
+    usage: Mapped["FlowRequestUsage | None"] = relationship(
+        back_populates="request", uselist=False, cascade="all, delete-orphan"
+    )
+
+    @property
+    def drawio_xml(self) -> str | None:
+        # 圧縮テーブルから遅延ロードして伸長する
+        """生成されたdrawio。未生成の場合はNone。"""
+
+        return self.diagram.xml if self.diagram is not None else None
+
+    @drawio_xml.setter
+    def drawio_xml(self, drawio_xml: str | None) -> None:
+        if drawio_xml is None:
+            self.diagram = None
+        elif self.diagram is None:
+            self.diagram = FlowDiagram.from_xml(drawio_xml)
+        else:
+            self.diagram.xml = drawio_xml
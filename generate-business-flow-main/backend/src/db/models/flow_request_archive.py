@@ -0,0 +1,30 @@
+"""保持期間を過ぎたFlowRequestを圧縮して退避するアーカイブテーブル定義。"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Boolean, LargeBinary, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.db.session import Base
+
+
+class FlowRequestArchive(Base):
+    """アーカイブ済みリクエストのメタデータと、プロンプト・drawioの圧縮JSONを保持するエンティティ。
+
+    PostgreSQLではcreated_atによる月単位のレンジパーティションとして作成し、
+    古いアーカイブはパーティション単位で切り離して削除できます。
+    """
+
+    __tablename__ = "flow_request_archives"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+
+    # パーティションキーを主キーに含める必要があるため(request_id, created_at)の複合主キーとする
+    request_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    created_at: Mapped[datetime] = mapped_column(primary_key=True)
+    session_key: Mapped[str] = mapped_column(String(64), index=True)
+    is_initial: Mapped[bool] = mapped_column(Boolean(), default=False)
+    codec: Mapped[str] = mapped_column(String(16))
+    payload: Mapped[bytes] = mapped_column(LargeBinary(), deferred=True)
+    archived_at: Mapped[datetime] = mapped_column(default=func.now())
@@ -0,0 +1,74 @@
+"""リクエストごとのトークン使用量テーブル定義。"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import Float, ForeignKey, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from src.db.session import Base
+
+if TYPE_CHECKING:
+    from src.db.models.flow_request import FlowRequest
+
+
+class FlowRequestUsage(Base):
+    """FlowRequestの生成にかかったトークン数・概算コスト・所要時間を保持するエンティティ。
+
+    既存のflow_requestsへ列を追加せずに済むよう、flow_diagramsと同じく1対1の別テーブルにします。
+    """
+
+    __tablename__ = "flow_request_usages"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    request_id: Mapped[int] = mapped_column(
+        ForeignKey("flow_requests.id", ondelete="CASCADE"), unique=True, index=True
+    )
+    model: Mapped[str] = mapped_column(String(100))
+    input_tokens: Mapped[int] = mapped_column(Integer(), default=0)
+    output_tokens: Mapped[int] = mapped_column(Integer(), default=0)
+    cache_read_input_tokens: Mapped[int] = mapped_column(Integer(), default=0)
+    cache_creation_input_tokens: Mapped[int] = mapped_column(Integer(), default=0)
+    cost_usd: Mapped[float | None] = mapped_column(Float(), nullable=True)
+    duration_ms: Mapped[int | None] = mapped_column(Integer(), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+
+    request: Mapped["FlowRequest"] = relationship(back_populates="usage")
+
+    @classmethod
+    def from_event(cls, usage: dict[str, Any]) -> "FlowRequestUsage":
+        # completeイベントのusage(camelCase)から行を作る
+        """ストリームのcompleteイベントに含まれるusageからFlowRequestUsageを生成します。
+
+        Args:
+            usage: completeイベントのusage。
+
+        Returns:
+            FlowRequestUsage: 未保存のFlowRequestUsage。
+        """
+
+        return cls(
+            model=usage.get("model") or "",
+            input_tokens=usage.get("inputTokens") or 0,
+            output_tokens=usage.get("outputTokens") or 0,
+            cache_read_input_tokens=usage.get("cacheReadInputTokens") or 0,
+            cache_creation_input_tokens=usage.get("cacheCreationInputTokens") or 0,
+            cost_usd=usage.get("costUsd"),
+            duration_ms=usage.get("durationMs"),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        # 履歴APIやアーカイブへ載せるcamelCaseの辞書にする
+        """APIレスポンス用のcamelCase辞書へ変換します。"""
+
+        return {
+            "model": self.model,
+            "inputTokens": self.input_tokens,
+            "outputTokens": self.output_tokens,
+            "cacheReadInputTokens": self.cache_read_input_tokens,
+            "cacheCreationInputTokens": self.cache_creation_input_tokens,
+            "costUsd": self.cost_usd,
+            "durationMs": self.duration_ms,
+        }
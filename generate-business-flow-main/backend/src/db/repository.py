@@ -0,0 +1,284 @@
+"""FlowSession/FlowRequestの永続化処理をまとめたリポジトリ関数群。"""
+
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.db.models import FlowDiagram, FlowRequest, FlowRequestUsage, FlowSession
+
+PROMPT_PREVIEW_CHARS = 200
+
+
+def get_or_create_flow_session(
+    db: Session, session_key: str, user_label: str | None = None
+) -> FlowSession:
+    # session_keyで既存セッションを探し、無ければ作成してflushする
+    """session_keyに対応するFlowSessionを取得し、存在しなければ作成します。
+
+    Args:
+        db: 利用中のDBセッション。
+        session_key: フロントエンドやジョブが発行したセッション識別子。
+        user_label: 新規作成時に設定する任意ラベル。
+
+    Returns:
+        FlowSession: 取得または作成したセッション。
+    """
+
+    flow_session = db.scalar(select(FlowSession).where(FlowSession.session_key == session_key))
+    if flow_session is None:
+        flow_session = FlowSession(session_key=session_key, user_label=user_label)
+        db.add(flow_session)
+        db.flush()
+    return flow_session
+
+
+def add_flow_request(
+    db: Session,
+    flow_session: FlowSession,
+    user_prompt: str,
+    drawio_xml: str | None,
+    is_initial: bool,
+    usage: dict | None = None,
+) -> FlowRequest:
+    # 生成結果を1リクエスト分として追加し、採番済みのidを返せるようflushする
+    """セッションに紐づくFlowRequestを追加します。
+
+    Args:
+        db: 利用中のDBセッション。
+        flow_session: 紐づけるFlowSession。
+        user_prompt: ユーザーが送信したプロンプト。
+        drawio_xml: 生成されたdrawio。抽出できなかった場合はNone。
+        is_initial: 初回生成リクエストかどうか。
+        usage: ストリームのcompleteイベントに含まれるusage。未取得の場合はNone。
+
+    Returns:
+        FlowRequest: 追加したリクエスト。
+    """
+
+    flow_request = FlowRequest(
+        session_id=flow_session.id,
+        user_prompt=user_prompt,
+        drawio_xml=drawio_xml,
+        is_initial=is_initial,
+        usage=FlowRequestUsage.from_event(usage) if usage else None,
+    )
+    db.add(flow_request)
+    db.flush()
+    return flow_request
+
+
+@dataclass(frozen=True)
+class FlowRequestCursor:
+    """キーセットページングの位置（直前ページ末尾の作成日時とID）。"""
+
+    created_at: datetime
+    request_id: int
+
+    def encode(self) -> str:
+        # クライアントには中身を意識させないURLセーフな文字列として返す
+        """カーソルを不透明な文字列へ変換します。"""
+
+        payload = json.dumps({"t": self.created_at.isoformat(), "i": self.request_id})
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str) -> "FlowRequestCursor":
+        # encodeの逆変換。改ざんや形式不正はValueErrorにまとめる
+        """文字列からカーソルを復元します。
+
+        Args:
+            cursor: encodeで生成した文字列。
+
+        Returns:
+            FlowRequestCursor: 復元したカーソル。
+
+        Raises:
+            ValueError: 形式が不正な場合。
+        """
+
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            return cls(datetime.fromisoformat(payload["t"]), int(payload["i"]))
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ValueError("cursorの形式が不正です") from exc
+
+
+async def find_flow_session_id(db: AsyncSession, session_key: str) -> int | None:
+    # session_key(ユニークインデックス)からFlowSessionのidだけを引く
+    """session_keyに対応するFlowSessionのidを返します。
+
+    Args:
+        db: 利用中の非同期DBセッション。
+        session_key: フロントエンドやジョブが発行したセッション識別子。
+
+    Returns:
+        int | None: FlowSessionのid。存在しない場合はNone。
+    """
+
+    return await db.scalar(select(FlowSession.id).where(FlowSession.session_key == session_key))
+
+
+async def list_flow_request_page(
+    db: AsyncSession,
+    flow_session_id: int,
+    limit: int,
+    cursor: FlowRequestCursor | None = None,
+) -> tuple[list[dict], FlowRequestCursor | None]:
+    # (session_id, created_at, id)の複合インデックスを新しい順に辿るキーセットページング
+    """セッションのリクエスト履歴を新しい順に1ページ分取得します。
+
+    OFFSETを使わず直前ページ末尾の(created_at, id)より古い行を読むため、履歴が増えても
+    深いページの取得コストが変わりません。drawio本体(flow_diagrams.data)は読み込みません。
+
+    Args:
+        db: 利用中の非同期DBセッション。
+        flow_session_id: FlowSessionのid。
+        limit: 1ページの件数。
+        cursor: 前ページのnext_cursor。先頭ページではNone。
+
+    Returns:
+        tuple[list[dict], FlowRequestCursor | None]: ページの行と次ページのカーソル。
+    """
+
+    statement = (
+        select(
+            FlowRequest.id,
+            FlowRequest.created_at,
+            FlowRequest.is_initial,
+            func.substr(FlowRequest.user_prompt, 1, PROMPT_PREVIEW_CHARS).label("prompt_preview"),
+            FlowDiagram.raw_size,
+            FlowRequestUsage.model,
+            FlowRequestUsage.input_tokens,
+            FlowRequestUsage.output_tokens,
+            FlowRequestUsage.cost_usd,
+        )
+        .outerjoin(FlowDiagram, FlowDiagram.request_id == FlowRequest.id)
+        .outerjoin(FlowRequestUsage, FlowRequestUsage.request_id == FlowRequest.id)
+        .where(FlowRequest.session_id == flow_session_id)
+        .order_by(FlowRequest.created_at.desc(), FlowRequest.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(FlowRequest.created_at, FlowRequest.id)
+            < tuple_(cursor.created_at, cursor.request_id)
+        )
+
+    rows = (await db.execute(statement)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = FlowRequestCursor(rows[-1].created_at, rows[-1].id)
+
+    items = [
+        {
+            "requestId": row.id,
+            "createdAt": row.created_at.isoformat() if row.created_at else None,
+            "isInitial": row.is_initial,
+            "promptPreview": row.prompt_preview,
+            "hasDiagram": row.raw_size is not None,
+            "diagramSize": row.raw_size,
+            "usage": (
+                {
+                    "model": row.model,
+                    "inputTokens": row.input_tokens,
+                    "outputTokens": row.output_tokens,
+                    "costUsd": row.cost_usd,
+                }
+                if row.model is not None
+                else None
+            ),
+        }
+        for row in rows
+    ]
+    return items, next_cursor
+
+
+async def get_flow_request_drawio(
+    db: AsyncSession, flow_session_id: int, request_id: int
+) -> tuple[bool, str | None]:
+    # 履歴の1件を開いたときだけ圧縮済みdrawioを読み込んで伸長する
+    """セッションに属するリクエストのdrawioを取得します。
+
+    Args:
+        db: 利用中の非同期DBセッション。
+        flow_session_id: FlowSessionのid。
+        request_id: FlowRequestのid。
+
+    Returns:
+        tuple[bool, str | None]: リクエストが存在するかと、drawio（未生成の場合はNone）。
+    """
+
+    exists = await db.scalar(
+        select(FlowRequest.id).where(
+            FlowRequest.id == request_id, FlowRequest.session_id == flow_session_id
+        )
+    )
+    if exists is None:
+        return False, None
+    diagram = await db.scalar(select(FlowDiagram).where(FlowDiagram.request_id == request_id))
+    if diagram is None:
+        return True, None
+    await db.refresh(diagram, ["data"])
+    return True, diagram.xml
+
+
+async def summarize_flow_request_usage(
+    db: AsyncSession, since: datetime | None = None
+) -> list[dict]:
+    # flow_request_usagesをモデル・初回/修正の別に集計する
+    """保存済みのトークン使用量をモデルとリクエスト種別（初回生成/修正）ごとに集計します。
+
+    Args:
+        db: 利用中の非同期DBセッション。
+        since: 集計対象とする作成日時の下限。Noneの場合は全期間。
+
+    Returns:
+        list[dict]: 集計行。概算コストの降順。
+    """
+
+    total_cost = func.sum(FlowRequestUsage.cost_usd)
+    statement = (
+        select(
+            FlowRequestUsage.model,
+            FlowRequest.is_initial,
+            func.count().label("requests"),
+            func.sum(FlowRequestUsage.input_tokens).label("input_tokens"),
+            func.sum(FlowRequestUsage.output_tokens).label("output_tokens"),
+            func.sum(FlowRequestUsage.cache_read_input_tokens).label("cache_read_input_tokens"),
+            func.sum(FlowRequestUsage.cache_creation_input_tokens).label(
+                "cache_creation_input_tokens"
+            ),
+            total_cost.label("cost_usd"),
+            func.avg(FlowRequestUsage.duration_ms).label("avg_duration_ms"),
+        )
+        .join(FlowRequest, FlowRequest.id == FlowRequestUsage.request_id)
+        .group_by(FlowRequestUsage.model, FlowRequest.is_initial)
+        .order_by(total_cost.desc().nulls_last())
+    )
+    if since is not None:
+        statement = statement.where(FlowRequest.created_at >= since)
+
+    rows = (await db.execute(statement)).all()
+    return [
+        {
+            "model": row.model,
+            "promptType": "initial" if row.is_initial else "modification",
+            "requests": row.requests,
+            "inputTokens": int(row.input_tokens or 0),
+            "outputTokens": int(row.output_tokens or 0),
+            "cacheReadInputTokens": int(row.cache_read_input_tokens or 0),
+            "cacheCreationInputTokens": int(row.cache_creation_input_tokens or 0),
+            "costUsd": float(row.cost_usd) if row.cost_usd is not None else None,
+            "avgDurationMs": round(float(row.avg_duration_ms)) if row.avg_duration_ms else None,
+        }
+        for row in rows
+    ]
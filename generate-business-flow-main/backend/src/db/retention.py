@@ -0,0 +1,365 @@
+"""保持期間を過ぎたflow_requestsをアーカイブへ移すリテンション処理。"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+
+from src.db.compression import compress_text, decompress_text
+from src.db.models import (
+    FlowBatchJob,
+    FlowDiagram,
+    FlowRequest,
+    FlowRequestArchive,
+    FlowRequestUsage,
+    FlowSession,
+)
+from src.db.session import get_engine
+
+TARGET_TABLE = "table"
+TARGET_JSONL = "jsonl"
+DEFAULT_BATCH_SIZE = 500
+ARCHIVE_TABLE = FlowRequestArchive.__tablename__
+
+
+@dataclass
+class RetentionReport:
+    """リテンション処理の実行結果とスループット。"""
+
+    target: str
+    cutoff: datetime
+    batches: int = 0
+    rows: int = 0
+    raw_bytes: int = 0
+    archived_bytes: int = 0
+    elapsed_seconds: float = 0.0
+    partitions: list[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        # 経過時間0の場合でも割り算で落ちないようにする
+        """1秒あたりの移動行数を返します。"""
+
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def summary(self) -> str:
+        # CLIやログへそのまま出力できる1行サマリ
+        """実行結果を1行の文字列にまとめます。"""
+
+        ratio = self.archived_bytes / self.raw_bytes if self.raw_bytes else 0.0
+        return (
+            f"target={self.target} cutoff={self.cutoff.isoformat()} rows={self.rows} "
+            f"batches={self.batches} elapsed={self.elapsed_seconds:.2f}s "
+            f"throughput={self.rows_per_second:,.0f} rows/s "
+            f"raw={self.raw_bytes}B archived={self.archived_bytes}B ratio={ratio:.2f}"
+        )
+
+
+def archive_expired_requests(
+    older_than: timedelta,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    target: str = TARGET_TABLE,
+    output_path: Path | None = None,
+    pause_seconds: float = 0.0,
+    max_batches: int | None = None,
+    engine: Engine | None = None,
+    now: datetime | None = None,
+) -> RetentionReport:
+    # 古いリクエストをbatch_size件ずつアーカイブへ書き出してから元テーブルから削除する
+    """保持期間を過ぎたFlowRequestをアーカイブテーブルまたはJSONLファイルへ移動します。
+
+    1バッチごとに短いトランザクションでコミットし、バッチ間にpause_secondsの待機を挟むことで
+    長時間のロックや稼働中のリクエストとの競合を避けます。JSONLへの出力はバッチのコミット前に
+    フラッシュするため、途中で中断した場合は同じ行が再出力されることがあります（at-least-once）。
+
+    Args:
+        older_than: 保持期間。作成からこれより古いリクエストを移動します。
+        batch_size: 1トランザクションで移動する行数。
+        target: "table"（flow_request_archives）または "jsonl"。
+        output_path: target="jsonl"の出力先。拡張子が.zstならzstd、.gzならgzipで圧縮します。
+        pause_seconds: バッチ間の待機秒数。
+        max_batches: 処理するバッチ数の上限。未指定時は対象がなくなるまで処理します。
+        engine: 使用するSQLAlchemy Engine。未指定時はデフォルト接続を利用。
+        now: 基準時刻。未指定時は現在時刻。
+
+    Returns:
+        RetentionReport: 移動件数やスループットを含む実行結果。
+
+    Raises:
+        ValueError: targetが不正、またはjsonlで出力先が未指定の場合。
+    """
+
+    if target not in (TARGET_TABLE, TARGET_JSONL):
+        raise ValueError(f"未対応のアーカイブ先です: {target}")
+    if target == TARGET_JSONL and output_path is None:
+        raise ValueError("jsonlへアーカイブする場合は出力先のパスが必要です")
+
+    target_engine = engine or get_engine()
+    cutoff = (now or datetime.now()) - older_than
+    report = RetentionReport(target=target, cutoff=cutoff)
+    started = time.perf_counter()
+    last_id = 0
+    file_size_before = _file_size(output_path) if target == TARGET_JSONL else 0
+
+    with _open_archive_file(output_path if target == TARGET_JSONL else None) as archive_file:
+        while max_batches is None or report.batches < max_batches:
+            with target_engine.begin() as connection:
+                rows = _select_batch(connection, cutoff, last_id, batch_size)
+                if not rows:
+                    break
+
+                records = [_build_record(row) for row in rows]
+                if target == TARGET_TABLE:
+                    _write_archive_rows(connection, records, report)
+                else:
+                    _write_archive_lines(archive_file, records, report)
+                _delete_requests(connection, [row.id for row in rows])
+
+            report.batches += 1
+            report.rows += len(rows)
+            last_id = rows[-1].id
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+    if target == TARGET_JSONL:
+        report.archived_bytes = _file_size(output_path) - file_size_before
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+def purge_archives(
+    before: datetime, engine: Engine | None = None, batch_size: int = DEFAULT_BATCH_SIZE
+) -> list[str]:
+    # アーカイブ自体の保持期限切れを削除する。PostgreSQLではパーティションごと落とす
+    """指定日時より古いアーカイブを削除します。
+
+    PostgreSQLでは終端がbefore以前の月パーティションを切り離して削除するため、行単位の
+    DELETEやVACUUMが発生しません。その他のDBでは行をbatch_size件ずつ削除します。
+
+    Args:
+        before: この日時より前に作成されたリクエストのアーカイブを削除します。
+        engine: 使用するSQLAlchemy Engine。未指定時はデフォルト接続を利用。
+        batch_size: PostgreSQL以外で1トランザクションに削除する行数。
+
+    Returns:
+        list[str]: 削除したパーティション名（PostgreSQL以外では空）。
+    """
+
+    target_engine = engine or get_engine()
+    if target_engine.dialect.name == "postgresql":
+        dropped = []
+        for name, upper in _list_archive_partitions(target_engine):
+            if upper > before.date():
+                continue
+            with target_engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {ARCHIVE_TABLE} DETACH PARTITION {name}"))
+                connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+        return dropped
+
+    while True:
+        with target_engine.begin() as connection:
+            keys = connection.execute(
+                select(FlowRequestArchive.request_id, FlowRequestArchive.created_at)
+                .where(FlowRequestArchive.created_at < before)
+                .limit(batch_size)
+            ).all()
+            if not keys:
+                return []
+            connection.execute(
+                delete(FlowRequestArchive).where(
+                    FlowRequestArchive.request_id.in_([key.request_id for key in keys])
+                )
+            )
+
+
+def _select_batch(connection: Connection, cutoff: datetime, last_id: int, batch_size: int):
+    # id順のキーセットで対象行を取り、他トランザクションがロック中の行は飛ばす
+    statement = (
+        select(
+            FlowRequest.id,
+            FlowRequest.created_at,
+            FlowRequest.is_initial,
+            FlowRequest.user_prompt,
+            FlowSession.session_key,
+            FlowDiagram.codec,
+            FlowDiagram.data,
+            FlowRequestUsage.model,
+            FlowRequestUsage.input_tokens,
+            FlowRequestUsage.output_tokens,
+            FlowRequestUsage.cache_read_input_tokens,
+            FlowRequestUsage.cache_creation_input_tokens,
+            FlowRequestUsage.cost_usd,
+            FlowRequestUsage.duration_ms,
+        )
+        .join(FlowSession, FlowSession.id == FlowRequest.session_id)
+        .outerjoin(FlowDiagram, FlowDiagram.request_id == FlowRequest.id)
+        .outerjoin(FlowRequestUsage, FlowRequestUsage.request_id == FlowRequest.id)
+        .where(FlowRequest.created_at < cutoff, FlowRequest.id > last_id)
+        .order_by(FlowRequest.id)
+        .limit(batch_size)
+    )
+    if connection.dialect.name == "postgresql":
+        statement = statement.with_for_update(skip_locked=True, of=FlowRequest)
+    return connection.execute(statement).all()
+
+
+def _build_record(row) -> dict:
+    # プロンプトとdrawioはアーカイブ時点で伸長し、1件分のJSONとしてまとめる
+    drawio = decompress_text(row.codec, row.data) if row.codec is not None else None
+    usage = None
+    if row.model is not None:
+        usage = {
+            "model": row.model,
+            "inputTokens": row.input_tokens,
+            "outputTokens": row.output_tokens,
+            "cacheReadInputTokens": row.cache_read_input_tokens,
+            "cacheCreationInputTokens": row.cache_creation_input_tokens,
+            "costUsd": row.cost_usd,
+            "durationMs": row.duration_ms,
+        }
+    return {
+        "requestId": row.id,
+        "sessionKey": row.session_key,
+        "isInitial": row.is_initial,
+        "createdAt": row.created_at.isoformat(),
+        "userPrompt": row.user_prompt,
+        "drawio": drawio,
+        "usage": usage,
+        "_created_at": row.created_at,
+    }
+
+
+def _write_archive_rows(connection: Connection, records: list[dict], report: RetentionReport) -> None:
+    # アーカイブテーブルへ圧縮JSONとして挿入する。PostgreSQLでは必要な月パーティションを先に作る
+    if connection.dialect.name == "postgresql":
+        months = {record["_created_at"].date().replace(day=1) for record in records}
+        report.partitions.extend(_ensure_archive_partitions(connection, months))
+
+    values = []
+    for record in records:
+        body = json.dumps(
+            {
+                "userPrompt": record["userPrompt"],
+                "drawio": record["drawio"],
+                "usage": record["usage"],
+            },
+            ensure_ascii=False,
+        )
+        codec, payload = compress_text(body)
+        report.raw_bytes += len(body.encode("utf-8"))
+        report.archived_bytes += len(payload)
+        values.append(
+            {
+                "request_id": record["requestId"],
+                "created_at": record["_created_at"],
+                "session_key": record["sessionKey"],
+                "is_initial": record["isInitial"],
+                "codec": codec,
+                "payload": payload,
+                "archived_at": datetime.now(),
+            }
+        )
+    connection.execute(insert(FlowRequestArchive), values)
+
+
+def _write_archive_lines(archive_file: BinaryIO, records: list[dict], report: RetentionReport) -> None:
+    # 1リクエスト1行のJSONLとして追記し、削除をコミットする前にフラッシュする
+    for record in records:
+        line = json.dumps(
+            {key: value for key, value in record.items() if not key.startswith("_")},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        archive_file.write(line + b"\n")
+        report.raw_bytes += len(line) + 1
+    archive_file.flush()
+
+
+def _delete_requests(connection: Connection, request_ids: list[int]) -> None:
+    # 子テーブルから順に削除する。一括生成ジョブからの参照は外してジョブ自体は残す
+    connection.execute(
+        update(FlowBatchJob).where(FlowBatchJob.request_id.in_(request_ids)).values(request_id=None)
+    )
+    connection.execute(delete(FlowDiagram).where(FlowDiagram.request_id.in_(request_ids)))
+    connection.execute(
+        delete(FlowRequestUsage).where(FlowRequestUsage.request_id.in_(request_ids))
+    )
+    connection.execute(delete(FlowRequest).where(FlowRequest.id.in_(request_ids)))
+
+
+def _file_size(path: Path | None) -> int:
+    return path.stat().st_size if path is not None and path.exists() else 0
+
+
+@contextmanager
+def _open_archive_file(output_path: Path | None) -> Iterator[BinaryIO | None]:
+    # 拡張子で圧縮形式を選ぶ。zstdは追記しても複数フレームとして正しく伸長できる
+    if output_path is None:
+        yield None
+        return
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix == ".zst":
+        import zstandard
+
+        with output_path.open("ab") as raw:
+            with zstandard.ZstdCompressor().stream_writer(raw, closefd=False) as writer:
+                yield writer
+    elif output_path.suffix == ".gz":
+        with gzip.open(output_path, "ab") as writer:
+            yield writer
+    else:
+        with output_path.open("ab") as writer:
+            yield writer
+
+
+def _ensure_archive_partitions(connection: Connection, months: set[date]) -> list[str]:
+    # 月初〜翌月初のレンジパーティションを存在しなければ作成する
+    created = []
+    for month in sorted(months):
+        upper = (month + timedelta(days=32)).replace(day=1)
+        name = f"{ARCHIVE_TABLE}_y{month.year:04d}m{month.month:02d}"
+        exists = connection.scalar(text("SELECT to_regclass(:name)"), {"name": name})
+        if exists is not None:
+            continue
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ARCHIVE_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+        )
+        created.append(name)
+    return created
+
+
+def _list_archive_partitions(engine: Engine) -> list[tuple[str, date]]:
+    # 命名規則(_yYYYYmMM)から各パーティションの上限(翌月初)を求める
+    with engine.connect() as connection:
+        names = connection.scalars(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = :parent"
+            ),
+            {"parent": ARCHIVE_TABLE},
+        ).all()
+
+    partitions = []
+    prefix = f"{ARCHIVE_TABLE}_y"
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        year, month = name[len(prefix) :].split("m")
+        lower = date(int(year), int(month), 1)
+        partitions.append((name, (lower + timedelta(days=32)).replace(day=1)))
+    return sorted(partitions, key=lambda item: item[1])
@@ -1,20 +1,74 @@
-"""任意SQLを簡易実行するスクリプト。"""
+"""任意SQLを簡易実行するスクリプト。
+
+SELECT系の結果はサーバーサイドカーソルでbatch_size行ずつ読み出し、CSV/TSV/JSONLとして
+逐次書き出すため、結果の件数に関係なくメモリ使用量は一定です。
+
+Usage:
+    python -m src.db.run_sql "SELECT 1"
+    python -m src.db.run_sql --format jsonl --output requests.jsonl "SELECT * FROM flow_requests"
+"""
 
 from __future__ import annotations
 
+import argparse
+import csv
+import json
 import sys
-from typing import List, Tuple
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, TextIO, Tuple
 
 from sqlalchemy import text
-from sqlalchemy.engine import Row
+from sqlalchemy.engine import Result
+
+from src.db.session import get_engine
+
+FORMAT_CSV = "csv"
+FORMAT_TSV = "tsv"
+FORMAT_JSONL = "jsonl"
+OUTPUT_FORMATS = (FORMAT_CSV, FORMAT_TSV, FORMAT_JSONL)
+DEFAULT_BATCH_SIZE = 1000
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+@contextmanager
+def stream_raw_sql(sql: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Optional[Result]]:
+    # stream_results/yield_perでDBドライバ側のカーソルから少しずつ行を取り出す
+    """任意SQLを実行し、結果をストリーミングで読み出すResultを提供します。
 
-from src.db import get_db_session
+    PostgreSQL(psycopg)ではサーバーサイドカーソルを使い、batch_size行ずつ取得します。
+    更新系のSQLはコミットしたうえでNoneを返します。
+
+    Args:
+        sql: 実行するSQL文字列。
+        batch_size: 1回にフェッチする行数。
+
+    Yields:
+        Optional[Result]: SELECT系の場合は結果セット、更新系の場合はNone。
+    """
+
+    with get_engine().connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(text(sql))
+        if not result.returns_rows:
+            connection.commit()
+            yield None
+            return
+        try:
+            yield result
+        finally:
+            result.close()
 
 
 def execute_raw_sql(sql: str) -> List[Tuple]:
     # 任意のSQLを実行し、結果セットをタプルのリストで返す
     """任意SQLを実行し、結果を返します。
 
+    結果をすべてメモリへ載せるため、件数の多いクエリにはexport_raw_sqlを利用してください。
+
     Args:
         sql: 実行するSQL文字列。
 
@@ -22,17 +76,106 @@ def execute_raw_sql(sql: str) -> List[Tuple]:
         List[Tuple]: SELECT系の場合は結果の行リスト、更新系の場合は空リスト。
     """
 
-    for session in get_db_session():
-        result = session.execute(text(sql))
-        if result.returns_rows:
-            rows: List[Row] = result.fetchall()
-            return [tuple(row) for row in rows]
-        session.commit()
-        return []
+    with stream_raw_sql(sql) as result:
+        if result is None:
+            return []
+        return [tuple(row) for row in result]
+
+
+def _json_default(value: Any) -> str:
+    # JSONで表現できない型（日時・Decimal・バイナリなど）は文字列化する
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+class _ProgressReporter:
+    """書き出した行数とスループットを一定間隔で標準エラーへ表示します。"""
+
+    def __init__(self, stream: Optional[TextIO]) -> None:
+        self._stream = stream
+        self._started = time.perf_counter()
+        self._last_reported = self._started
+
+    def update(self, rows: int, final: bool = False) -> None:
+        """行数を受け取り、前回表示から一定時間経過していれば表示します。
+
+        Args:
+            rows: これまでに書き出した行数。
+            final: 最後の表示かどうか。Trueの場合は間隔に関係なく表示して改行します。
+        """
+        if self._stream is None:
+            return
+        now = time.perf_counter()
+        if not final and now - self._last_reported < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_reported = now
+        elapsed = now - self._started
+        rate = rows / elapsed if elapsed else 0.0
+        self._stream.write(f"\r{rows:,} rows  {elapsed:.1f}s  {rate:,.0f} rows/s")
+        if final:
+            self._stream.write("\n")
+        self._stream.flush()
+
+
+def export_raw_sql(
+    sql: str,
+    output: TextIO,
+    output_format: str = FORMAT_TSV,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Optional[TextIO] = None,
+) -> int:
+    # 結果セットをbatch_size行ずつ取り出し、その都度outputへ書き出す
+    """任意SQLを実行し、結果を指定形式で逐次書き出します。
+
+    Args:
+        sql: 実行するSQL文字列。
+        output: 書き出し先のテキストストリーム。
+        output_format: "csv"、"tsv"、"jsonl" のいずれか。CSV/TSVは先頭行に列名を出力します。
+        batch_size: 1回にフェッチする行数。
+        progress: 進捗の表示先。Noneの場合は表示しません。
+
+    Returns:
+        int: 書き出した行数。更新系のSQLでは0。
+
+    Raises:
+        ValueError: output_formatが不正な場合。
+    """
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {output_format}")
+
+    reporter = _ProgressReporter(progress)
+    written = 0
+    with stream_raw_sql(sql, batch_size) as result:
+        if result is None:
+            return 0
+        columns = list(result.keys())
+        writer = None
+        if output_format != FORMAT_JSONL:
+            delimiter = "\t" if output_format == FORMAT_TSV else ","
+            writer = csv.writer(output, delimiter=delimiter, lineterminator="\n")
+            writer.writerow(columns)
+
+        for partition in result.partitions():
+            if writer is not None:
+                writer.writerows(partition)
+            else:
+                output.writelines(
+                    json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default)
+                    + "\n"
+                    for row in partition
+                )
+            written += len(partition)
+            reporter.update(written)
+    reporter.update(written, final=True)
+    return written
 
 
 def main(args: list[str]) -> int:
-    # CLIエントリーポイント。最初の引数をSQLとして実行する
+    # CLIエントリーポイント。位置引数をSQLとして実行する
     """CLIからSQLを受け取り、実行します。
 
     Args:
@@ -42,14 +185,30 @@ def main(args: list[str]) -> int:
         int: 正常終了は0、引数不足は1。
     """
 
-    if len(args) < 2:
-        print("Usage: python -m src.db.run_sql \"SELECT 1\"")
+    parser = argparse.ArgumentParser(
+        prog="python -m src.db.run_sql", description="任意SQLを実行し、結果を逐次出力する"
+    )
+    parser.add_argument("sql", nargs="?", help="実行するSQL。'-' の場合は標準入力から読み込む")
+    parser.add_argument(
+        "--format", choices=OUTPUT_FORMATS, default=FORMAT_TSV, help="出力形式（既定: tsv）"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="1回にフェッチする行数"
+    )
+    parser.add_argument("--output", type=Path, help="出力先ファイル。未指定時は標準出力")
+    parser.add_argument("--no-progress", action="store_true", help="標準エラーへの進捗表示を抑止")
+    parsed = parser.parse_args(args[1:])
+    if not parsed.sql:
+        parser.print_usage()
         return 1
 
-    sql = args[1]
-    rows = execute_raw_sql(sql)
-    for row in rows:
-        print(row)
+    sql = sys.stdin.read() if parsed.sql == "-" else parsed.sql
+    progress = None if parsed.no_progress else sys.stderr
+    if parsed.output is None:
+        export_raw_sql(sql, sys.stdout, parsed.format, parsed.batch_size, progress)
+        return 0
+    with parsed.output.open("w", encoding="utf-8", newline="") as output:
+        export_raw_sql(sql, output, parsed.format, parsed.batch_size, progress)
     return 0
 
 
@@ -0,0 +1,69 @@
+"""保持期間を過ぎたリクエストをアーカイブへ移すスクリプト。"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.db.retention import (
+    DEFAULT_BATCH_SIZE,
+    TARGET_JSONL,
+    TARGET_TABLE,
+    archive_expired_requests,
+    purge_archives,
+)
+from src.db.scripts.create_all_tables import create_all_tables
+
+
+def main() -> int:
+    # CLIのエントリーポイント
+    """リテンション処理を実行するCLIエントリーポイントです。
+
+    Returns:
+        int: 正常終了時は0。
+    """
+
+    parser = argparse.ArgumentParser(description="保持期間を過ぎたflow_requestsをアーカイブへ移動")
+    parser.add_argument("--older-than-days", type=int, default=90, help="保持日数")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="1バッチの行数")
+    parser.add_argument(
+        "--target", choices=[TARGET_TABLE, TARGET_JSONL], default=TARGET_TABLE, help="アーカイブ先"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="--target jsonlの出力先（.zst/.gzなら圧縮して追記）"
+    )
+    parser.add_argument("--pause", type=float, default=0.0, help="バッチ間の待機秒数")
+    parser.add_argument("--max-batches", type=int, help="処理するバッチ数の上限")
+    parser.add_argument(
+        "--purge-archives-older-than-days",
+        type=int,
+        help="指定日数より古いアーカイブを削除する（PostgreSQLではパーティション単位）",
+    )
+    args = parser.parse_args()
+    if args.target == TARGET_JSONL and args.output is None:
+        parser.error("--target jsonl には --output が必要です")
+
+    create_all_tables()
+    report = archive_expired_requests(
+        timedelta(days=args.older_than_days),
+        batch_size=args.batch_size,
+        target=args.target,
+        output_path=args.output,
+        pause_seconds=args.pause,
+        max_batches=args.max_batches,
+    )
+    print(report.summary())
+    if report.partitions:
+        print(f"作成したパーティション: {', '.join(report.partitions)}")
+
+    if args.purge_archives_older_than_days is not None:
+        before = datetime.now() - timedelta(days=args.purge_archives_older_than_days)
+        dropped = purge_archives(before)
+        print(f"{before.isoformat()}より古いアーカイブを削除しました。{' '.join(dropped)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,3 +17,7 @@ def create_all_tables(engine: Engine | None = None) -> None:
 
     target_engine = engine or get_engine()
     Base.metadata.create_all(target_engine)
+    # create_allは既存テーブルへ後から追加したインデックスを作らないため個別に作成する
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(target_engine, checkfirst=True)
@@ -0,0 +1,112 @@
+"""flow_requests.drawio_xml(旧カラム)をflow_diagramsへ圧縮して移行するスクリプト。"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from src.db import get_engine
+from src.db.compression import compress_text
+from src.db.scripts.create_all_tables import create_all_tables
+
+LEGACY_COLUMN = "drawio_xml"
+
+
+def migrate_drawio_blobs(
+    engine: Engine | None = None, batch_size: int = 500, drop_column: bool = False
+) -> int:
+    # 旧カラムに残っているdrawioをバッチ単位で圧縮テーブルへ移す
+    """旧drawio_xmlカラムの内容をflow_diagramsへ圧縮して移行します。
+
+    1バッチごとにコミットし、移行済みの行は旧カラムをNULLにするため途中で中断しても再実行できます。
+
+    Args:
+        engine: 使用するSQLAlchemy Engine。未指定時はデフォルト接続を利用。
+        batch_size: 1トランザクションで移行する行数。
+        drop_column: 移行完了後に旧カラムを削除するかどうか。
+
+    Returns:
+        int: 移行した行数。
+    """
+
+    target_engine = engine or get_engine()
+    create_all_tables(target_engine)
+    columns = {column["name"] for column in inspect(target_engine).get_columns("flow_requests")}
+    if LEGACY_COLUMN not in columns:
+        return 0
+
+    migrated = 0
+    last_id = 0
+    while True:
+        with target_engine.begin() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT id, drawio_xml FROM flow_requests "
+                    "WHERE id > :last_id AND drawio_xml IS NOT NULL ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+
+            payload = []
+            for request_id, drawio_xml in rows:
+                codec, data = compress_text(drawio_xml)
+                payload.append(
+                    {
+                        "request_id": request_id,
+                        "codec": codec,
+                        "raw_size": len(drawio_xml.encode("utf-8")),
+                        "data": data,
+                    }
+                )
+            connection.execute(
+                text(
+                    "INSERT INTO flow_diagrams (request_id, codec, raw_size, data, created_at) "
+                    "VALUES (:request_id, :codec, :raw_size, :data, CURRENT_TIMESTAMP)"
+                ),
+                payload,
+            )
+            connection.execute(
+                text(
+                    "UPDATE flow_requests SET drawio_xml = NULL "
+                    "WHERE id > :last_id AND id <= :max_id AND drawio_xml IS NOT NULL"
+                ),
+                {"last_id": last_id, "max_id": rows[-1][0]},
+            )
+        migrated += len(rows)
+        last_id = rows[-1][0]
+
+    if drop_column:
+        with target_engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE flow_requests DROP COLUMN {LEGACY_COLUMN}"))
+    return migrated
+
+
+def main() -> int:
+    # CLIのエントリーポイント
+    """drawioの移行を実行するCLIエントリーポイントです。
+
+    Returns:
+        int: 正常終了時は0。
+    """
+
+    parser = argparse.ArgumentParser(description="flow_requests.drawio_xmlをflow_diagramsへ移行")
+    parser.add_argument("--batch-size", type=int, default=500, help="1トランザクションの行数")
+    parser.add_argument(
+        "--drop-column", action="store_true", help="移行後にflow_requests.drawio_xmlを削除する"
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    migrated = migrate_drawio_blobs(batch_size=args.batch_size, drop_column=args.drop_column)
+    print(f"{migrated}件のdrawioを移行しました（{time.perf_counter() - started:.1f}秒）。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,16 +5,35 @@ from __future__ import annotations
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Iterator
+from typing import Any, AsyncIterator, Dict, Iterator
 
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from src.settings.env import load_env_file
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
+DEFAULT_SQLITE_PATH = PROJECT_ROOT / "sqlite-data" / "bit_flow.sqlite3"
+PROFILE_POSTGRES = "postgres"
+PROFILE_SQLITE = "sqlite"
+# 書き込みスループット重視の設定。WALでは読み取りと書き込みが互いをブロックせず、
+# synchronous=NORMALはチェックポイント時のみfsyncするため電源断以外では整合性を失わない
+SQLITE_PRAGMAS: Dict[str, str] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",
+    "temp_store": "MEMORY",
+    "cache_size": "-65536",
+}
 Base = declarative_base()
 
 
@@ -27,9 +46,13 @@ def _load_env() -> None:
 
 
 def _build_database_url() -> str:
-    # docker-composeのpostgresサービスに接続するURLを構築する
+    # docker-composeのpostgresサービス、またはDB_PROFILE=sqliteならローカルファイルを指すURLを構築する
     """環境変数からDATABASE_URLを決定します。
 
+    DATABASE_URLが未設定でDB_PROFILE=sqliteの場合は、SQLITE_PATH（既定:
+    sqlite-data/bit_flow.sqlite3）のSQLiteファイルを利用します。外部サービスなしで
+    create_all_tablesやベンチマークを実行するためのプロファイルです。
+
     Returns:
         str: SQLAlchemyが利用する接続URL。
 
@@ -38,6 +61,18 @@ def _build_database_url() -> str:
     """
 
     _load_env()
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return database_url
+
+    profile = os.getenv("DB_PROFILE", PROFILE_POSTGRES).lower()
+    if profile == PROFILE_SQLITE:
+        sqlite_path = Path(os.getenv("SQLITE_PATH") or DEFAULT_SQLITE_PATH)
+        sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+        return f"sqlite:///{sqlite_path.resolve()}"
+    if profile != PROFILE_POSTGRES:
+        raise RuntimeError(f"DB_PROFILEは{PROFILE_POSTGRES}または{PROFILE_SQLITE}を指定してください。")
+
     user = os.getenv("POSTGRES_USER", "postgres")
     password = os.getenv("POSTGRES_PASSWORD", "postgres")
     host = os.getenv("POSTGRES_HOST", "postgres")
@@ -64,8 +99,83 @@ def get_engine() -> Engine:
         RuntimeError: 接続先URLが決定できない場合。
     """
 
-    database_url = _build_database_url()
-    return create_engine(database_url, future=True)
+    database_url = _resolve_driver(_build_database_url(), is_async=False)
+    engine = create_engine(database_url, future=True, **_engine_options(database_url))
+    _apply_sqlite_pragmas(engine)
+    return engine
+
+
+def _resolve_driver(database_url: str, is_async: bool) -> str:
+    # SQLiteは同期・非同期でドライバが異なるため、同じDATABASE_URLから切り替える
+    """同期/非同期エンジンに合わせてSQLiteのドライバ名を差し替えます。
+
+    Args:
+        database_url: 接続先URL。
+        is_async: 非同期エンジン向けかどうか。
+
+    Returns:
+        str: ドライバを調整した接続URL。SQLite以外はそのまま返します。
+    """
+
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return database_url
+    drivername = "sqlite+aiosqlite" if is_async else "sqlite"
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def _apply_sqlite_pragmas(engine: Engine) -> None:
+    # PRAGMAは接続単位の設定のため、プールが新しい接続を作るたびに適用する
+    """SQLiteのEngineへ接続時にSQLITE_PRAGMASを実行するリスナーを登録します。
+
+    Args:
+        engine: 対象のEngine。SQLite以外の場合は何もしません。
+    """
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _engine_options(database_url: str) -> Dict[str, Any]:
+    # 同期・非同期エンジン共通の接続プール設定を環境変数から組み立てる
+    """接続プールとステートメントキャッシュの設定を返します。
+
+    Args:
+        database_url: 接続先URL。SQLiteの場合はプール設定を適用しません。
+
+    Returns:
+        Dict[str, Any]: create_engine/create_async_engineへ渡すキーワード引数。
+    """
+
+    _load_env()
+    options: Dict[str, Any] = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        return options
+
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    )
+    if url.get_driver_name() == "psycopg":
+        # psycopgはprepare_threshold回実行したクエリをサーバー側でprepareしてキャッシュする
+        # PgBouncer(transactionモード)経由などprepareを使えない環境では空文字で無効化する
+        threshold = os.getenv("DB_PREPARE_THRESHOLD", "5")
+        options["connect_args"] = {"prepare_threshold": int(threshold) if threshold else None}
+    return options
 
 
 @lru_cache(maxsize=1)
@@ -95,3 +205,53 @@ def get_db_session() -> Iterator[Session]:
         yield db
     finally:
         db.close()
+
+
+@lru_cache(maxsize=1)
+def get_async_engine() -> AsyncEngine:
+    # 非同期ルートからイベントループを止めずにクエリを発行するためのEngine
+    """DATABASE_URLを基にSQLAlchemyのAsyncEngineを生成します。
+
+    psycopg(3)は同じURLのまま非同期ドライバとして利用できます。
+
+    Returns:
+        AsyncEngine: 非同期エンジン。
+    """
+
+    database_url = _resolve_driver(_build_database_url(), is_async=True)
+    engine = create_async_engine(database_url, **_engine_options(database_url))
+    _apply_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+
+@lru_cache(maxsize=1)
+def get_async_session_factory() -> async_sessionmaker[AsyncSession]:
+    # AsyncEngineに紐づくセッションファクトリを遅延生成する
+    """AsyncEngineにバインドされたAsyncSessionファクトリを返します。
+
+    Returns:
+        async_sessionmaker[AsyncSession]: 非同期セッション生成用のファクトリ。
+    """
+
+    # commit後に属性へアクセスしても暗黙のI/Oが走らないようexpire_on_commitは無効にする
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db_session() -> AsyncIterator[AsyncSession]:
+    # FastAPIのDependsで使える非同期セッション提供ジェネレータ
+    """リクエスト単位でAsyncSessionを提供します。
+
+    Yields:
+        AsyncSession: 呼び出し元が利用する非同期DBセッション。
+    """
+
+    async with get_async_session_factory()() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    # アプリ終了時に非同期エンジンのコネクションプールを閉じる
+    """生成済みのAsyncEngineがあれば破棄します。"""
+
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
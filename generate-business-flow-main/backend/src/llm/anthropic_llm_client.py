@@ -5,10 +5,20 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from typing import Any, AsyncGenerator, Dict
+import time
+from typing import Any, AsyncGenerator, Dict, Optional
 
 import httpx
 
+from src.observability.metrics import get_metrics_singleton
+from src.observability.readiness import get_readiness_singleton
+from src.observability.tracing import get_tracer_singleton, httpx_trace_extension
+from src.observability.usage import (
+    TokenUsage,
+    build_usage_payload,
+    estimate_tokens,
+    get_usage_ledger_singleton,
+)
 from src.settings.settings import AnthropicModelConfig, load_anthropic_model_config
 
 from .base_llm_client import BaseLLMClient, CacheCallback
@@ -62,8 +72,15 @@ class AnthropicLLMClient(BaseLLMClient):
 
         LOGGER.info(payload)
 
+        metrics = get_metrics_singleton()
+        started_at = time.perf_counter()
         async with httpx.AsyncClient(timeout=self.http_timeout) as client:
-            response = await client.post(self.api_url, headers=headers, json=payload)
+            try:
+                response = await client.post(self.api_url, headers=headers, json=payload)
+            except httpx.HTTPError:
+                metrics.upstream_responses.labels("error").inc()
+                raise
+        metrics.upstream_responses.labels(str(response.status_code)).inc()
 
         if response.is_error:
             raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
@@ -79,6 +96,9 @@ class AnthropicLLMClient(BaseLLMClient):
             data.get("usage"),
             len(content),
         )
+        usage = TokenUsage()
+        usage.update(data.get("usage"))
+        self._record_usage(None, data.get("model") or self.model_config.model, usage, started_at)
 
         return {
             "content": content,
@@ -92,14 +112,20 @@ class AnthropicLLMClient(BaseLLMClient):
         user_prompt: str,
         session_id: str,
         cache_drawio: CacheCallback,
+        save_partial: Optional[CacheCallback] = None,
     ) -> AsyncGenerator[bytes, None]:
         """Claude APIへストリーミング要求を送り、チャンクを返します。
 
+        呼び出し側がジェネレーターを閉じる（またはタスクをキャンセルする）と、その場で
+        上流のHTTPストリームを閉じます。この場合はcompleteイベントを流さず、drawioも
+        キャッシュしません。
+
         Args:
             system_prompt: Claudeへ渡すシステムインストラクション。
             user_prompt: ユーザーからの要求文。
             session_id: キャッシュに紐づくセッションID。
             cache_drawio: drawioテキストを保存する非同期コールバック。
+            save_partial: 指定時は、キャンセルされた生成の途中までの本文を渡す非同期コールバック。
 
         Returns:
             AsyncGenerator[bytes, None]: 改行区切りJSONをバイト列で返すジェネレーター。
@@ -118,6 +144,18 @@ class AnthropicLLMClient(BaseLLMClient):
             full_content_parts: list[str] = []
             complete_event_sent = False
             error_occurred = False
+            cancelled = False
+            metrics = get_metrics_singleton()
+            tracer = get_tracer_singleton()
+            # ジェネレーターは呼び出し側のコンテキストで動くため、スパンは明示的に開始・終了する
+            connect_span = tracer.start_span("upstream.connect", **{"http.url": self.api_url})
+            generate_span = None
+            response_received = False
+            usage = TokenUsage()
+            model = self.model_config.model
+            usage_payload = None
+            started_at = time.perf_counter()
+            first_content_at = 0.0
 
             yield self._format_chunk(
                 {
@@ -128,9 +166,20 @@ class AnthropicLLMClient(BaseLLMClient):
 
             try:
                 async with httpx.AsyncClient(timeout=self.http_timeout) as client:
+                    started_at = time.perf_counter()
+                    extensions = (
+                        {"trace": httpx_trace_extension(connect_span)} if connect_span else None
+                    )
                     async with client.stream(
-                        "POST", self.api_url, headers=headers, json=payload
+                        "POST", self.api_url, headers=headers, json=payload, extensions=extensions
                     ) as response:
+                        response_received = True
+                        metrics.upstream_first_byte.observe(time.perf_counter() - started_at)
+                        metrics.upstream_responses.labels(str(response.status_code)).inc()
+                        if connect_span is not None:
+                            connect_span.set_attribute("http.status_code", response.status_code)
+                            connect_span.end()
+                            generate_span = tracer.start_span("upstream.generate")
                         if response.is_error:
                             error_text = await response.aread()
                             raise RuntimeError(
@@ -168,6 +217,19 @@ class AnthropicLLMClient(BaseLLMClient):
                                 if not text:
                                     continue
 
+                                if not chunk_count:
+                                    first_content_at = time.perf_counter()
+                                    metrics.upstream_first_content.observe(
+                                        first_content_at - started_at
+                                    )
+                                    get_readiness_singleton().observe_upstream_first_content(
+                                        first_content_at - started_at
+                                    )
+                                    if generate_span is not None:
+                                        generate_span.set_attribute(
+                                            "time_to_first_content_ms",
+                                            round((first_content_at - started_at) * 1000, 2),
+                                        )
                                 full_content_parts.append(text)
                                 chunk_count += 1
 
@@ -184,10 +246,25 @@ class AnthropicLLMClient(BaseLLMClient):
                                     )
 
                             elif parsed.get("type") == "message_start":
-                                LOGGER.info("message_start: %s", parsed.get("message"))
+                                message = parsed.get("message") or {}
+                                LOGGER.info("message_start: %s", message)
+                                model = message.get("model") or model
+                                usage.update(message.get("usage"))
+
+                            elif parsed.get("type") == "message_delta":
+                                usage.update(parsed.get("usage"))
 
                             elif parsed.get("type") == "message_stop":
                                 LOGGER.info("message_stop received")
+                                if usage.output_tokens and chunk_count:
+                                    generation_seconds = time.perf_counter() - first_content_at
+                                    if generation_seconds > 0:
+                                        metrics.tokens_per_second.observe(
+                                            usage.output_tokens / generation_seconds
+                                        )
+                                usage_payload = self._record_usage(
+                                    session_id, model, usage, started_at
+                                )
                                 complete_event_sent = True
                                 full_content = "".join(full_content_parts)
                                 if full_content:
@@ -198,11 +275,22 @@ class AnthropicLLMClient(BaseLLMClient):
                                         "type": "complete",
                                         "fullContent": full_content,
                                         "totalChunks": chunk_count,
+                                        "usage": usage_payload,
                                     }
                                 )
 
+            except (asyncio.CancelledError, GeneratorExit):
+                # クライアントがいなくなった。async withを抜けた時点で上流の接続は閉じている
+                cancelled = True
+                raise
+
             except Exception as exc:  # pylint: disable=broad-except
                 error_occurred = True
+                if not response_received:
+                    metrics.upstream_responses.labels("error").inc()
+                failed_span = generate_span or connect_span
+                if failed_span is not None:
+                    failed_span.set_error(f"{type(exc).__name__}: {exc}")
                 LOGGER.exception("Streaming error")
                 error_message = (
                     "APIとの接続が切断されました。ネットワークを確認して再試行してください。"
@@ -224,21 +312,79 @@ class AnthropicLLMClient(BaseLLMClient):
                 )
 
             finally:
-                if not error_occurred and not complete_event_sent:
-                    full_content = "".join(full_content_parts)
-                    if full_content:
-                        await cache_drawio(session_id, full_content)
-
-                    yield self._format_chunk(
-                        {
-                            "type": "complete",
-                            "fullContent": full_content,
-                            "totalChunks": chunk_count,
-                        }
+                metrics.chunks_per_stream.observe(chunk_count)
+                if cancelled:
+                    # 最終的なusageはmessage_deltaで届くため、届く前に切った分は本文から概算する
+                    usage.output_tokens = max(
+                        usage.output_tokens, estimate_tokens("".join(full_content_parts))
                     )
+                    metrics.cancelled_streams.inc()
+                    for kind, tokens in (
+                        ("input", usage.input_tokens),
+                        ("output", usage.output_tokens),
+                        ("cache_read", usage.cache_read_input_tokens),
+                        ("cache_write", usage.cache_creation_input_tokens),
+                    ):
+                        if tokens:
+                            metrics.cancelled_tokens.labels(kind).inc(tokens)
+                    LOGGER.info(
+                        "Upstream stream cancelled for session %s after %s chunks "
+                        "(~%s output tokens)",
+                        session_id,
+                        chunk_count,
+                        usage.output_tokens,
+                    )
+                # message_stopまで届かなかった場合も、課金対象になった分は集計しておく
+                if usage_payload is None and usage.total_tokens:
+                    usage_payload = self._record_usage(session_id, model, usage, started_at)
+                if connect_span is not None:
+                    connect_span.end()
+                if generate_span is not None:
+                    generate_span.set_attribute("chunks", chunk_count)
+                    generate_span.set_attribute("input_tokens", usage.input_tokens)
+                    generate_span.set_attribute("output_tokens", usage.output_tokens)
+                    if cancelled:
+                        generate_span.set_attribute("cancelled", True)
+                    generate_span.end()
+                if cancelled and save_partial is not None and full_content_parts:
+                    await save_partial(session_id, "".join(full_content_parts))
+
+            # finally内でyieldするとキャンセルやacloseを握りつぶすため、正常終了時だけここで流す
+            if not error_occurred and not complete_event_sent:
+                full_content = "".join(full_content_parts)
+                if full_content:
+                    await cache_drawio(session_id, full_content)
+
+                yield self._format_chunk(
+                    {
+                        "type": "complete",
+                        "fullContent": full_content,
+                        "totalChunks": chunk_count,
+                        "usage": usage_payload,
+                    }
+                )
 
         return generator()
 
+    def _record_usage(
+        self, session_id: str | None, model: str, usage: TokenUsage, started_at: float
+    ) -> Dict[str, Any]:
+        """使用量を集計へ記録し、completeイベントへ添付するusageを返します。
+
+        Args:
+            session_id: セッションID。非ストリーミング呼び出しではNone。
+            model: 応答したモデル名。
+            usage: トークン使用量。
+            started_at: リクエスト送信前の時刻（time.perf_counter）。
+
+        Returns:
+            Dict[str, Any]: camelCaseのusage（モデル名と概算コストを含む）。
+        """
+        cost_usd = usage.cost_usd(self.model_config.pricing)
+        duration_seconds = time.perf_counter() - started_at
+        get_usage_ledger_singleton().record(session_id, model, usage, cost_usd, duration_seconds)
+        return build_usage_payload(model, usage, cost_usd, duration_seconds)
+
     def _build_payload(self, system_prompt: str, user_prompt: str, stream: bool) -> Dict[str, Any]:
         """Claude APIへ送信するリクエストペイロードを生成します。
 
@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Any, AsyncGenerator, Awaitable, Callable, Dict
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
 
 
 CacheCallback = Callable[[str, str], Awaitable[None]]
@@ -23,5 +23,6 @@ class BaseLLMClient(ABC):
         user_prompt: str,
         session_id: str,
         cache_drawio: CacheCallback,
+        save_partial: Optional[CacheCallback] = None,
     ) -> AsyncGenerator[bytes, None]:
         """LLMからのストリーム結果を生成する。"""
@@ -0,0 +1,55 @@
+"""Structured models exchanged by the help desk agent sample."""
+
+from __future__ import annotations
+
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class SearchOutput(BaseModel):
+    """検索ツールが返す1件分の結果。"""
+
+    file_name: str = Field(..., description="検索結果のファイル名")
+    content: str = Field(..., description="検索結果の本文")
+
+
+class Plan(BaseModel):
+    """質問に回答するためのサブタスク計画。"""
+
+    subtasks: List[str] = Field(..., description="問題を解決するためのサブタスクリスト")
+
+
+class ToolResult(BaseModel):
+    """1回のツール呼び出しの結果。"""
+
+    tool_name: str = Field(..., description="ツールの名前")
+    args: str = Field(..., description="ツールの引数（JSON文字列）")
+    results: List[SearchOutput] = Field(..., description="ツールの結果")
+
+
+class ReflectionResult(BaseModel):
+    """サブタスク回答に対する内省の結果。"""
+
+    advice: str = Field(..., description="回答が不十分な場合の改善アドバイス")
+    is_completed: bool = Field(..., description="サブタスクの回答が完了しているかどうか")
+
+
+class Subtask(BaseModel):
+    """1つのサブタスクの実行結果。"""
+
+    task_name: str = Field(..., description="サブタスクの名前")
+    tool_results: List[List[ToolResult]] = Field(..., description="試行ごとのツールの結果")
+    reflection_results: List[ReflectionResult] = Field(..., description="内省の結果")
+    is_completed: bool = Field(..., description="サブタスクが完了しているかどうか")
+    subtask_answer: str = Field(..., description="サブタスクの回答")
+    challenge_count: int = Field(..., description="サブタスクの試行回数")
+
+
+class AgentResult(BaseModel):
+    """run_agent / arun_agentの最終結果。"""
+
+    question: str = Field(..., description="ユーザーの元の質問")
+    plan: Plan = Field(..., description="回答のための計画")
+    subtasks: List[Subtask] = Field(..., description="サブタスクの実行結果")
+    answer: str = Field(..., description="最終回答")
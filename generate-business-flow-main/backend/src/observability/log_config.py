@@ -0,0 +1,232 @@
+"""Queue-based logging with JSON records and per-logger sampling."""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.observability.tracing import current_trace_id
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+# LogRecordの標準属性。これ以外の属性（extra指定）はJSONの追加フィールドとして出力する
+_RESERVED_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None)).keys()
+) | {"message", "asctime", "trace_id", "suppressed"}
+
+
+@dataclass(frozen=True)
+class LogRule:
+    """ロガー単位のサンプリング・レート制限の設定。"""
+
+    sample_rate: float = 1.0
+    max_per_second: Optional[float] = None
+
+
+def parse_log_rules(spec: str) -> Dict[str, LogRule]:
+    """``logger=rate[/max_per_second]`` をカンマ区切りで並べた設定を解釈します。
+
+    例: ``"httpx=0.1,src.api.routes=1/20"`` はhttpxのログを10%だけ残し、
+    src.api.routesのログを毎秒20件までに制限します。
+
+    Args:
+        spec: 設定文字列。空文字の場合は制限なし。
+
+    Returns:
+        Dict[str, LogRule]: ロガー名と設定の対応。
+
+    Raises:
+        ValueError: 書式が不正な場合。
+    """
+    rules: Dict[str, LogRule] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, separator, value = item.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"ログのサンプリング設定が不正です: {item}")
+        rate, _, limit = value.partition("/")
+        rules[name.strip()] = LogRule(
+            sample_rate=float(rate) if rate else 1.0,
+            max_per_second=float(limit) if limit else None,
+        )
+    return rules
+
+
+class SamplingFilter(logging.Filter):
+    """ロガー名の前方一致でルールを選び、サンプリングとレート制限を適用します。
+
+    WARNING以上のレコードは常に通過させます。間引いた件数は、同じロガーで次に
+    通過したレコードの ``suppressed`` 属性に記録します。
+    """
+
+    def __init__(self, rules: Dict[str, LogRule]) -> None:
+        """ルールを受け取り初期化します。
+
+        Args:
+            rules: ロガー名（前方一致）と設定の対応。
+        """
+        super().__init__()
+        self._rules = rules
+        self._resolved: Dict[str, Optional[Tuple[str, LogRule]]] = {}
+        # ルールごとのトークンバケット（残量, 最終補充時刻）と間引いた件数
+        self._buckets: Dict[str, List[float]] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """レコードを出力するかどうかを判定します。"""
+        if record.levelno >= logging.WARNING:
+            return True
+        matched = self._resolve(record.name)
+        if matched is None:
+            return True
+        key, rule = matched
+        with self._lock:
+            if self._admit(key, rule):
+                suppressed = self._suppressed.pop(key, 0)
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+    def _resolve(self, name: str) -> Optional[Tuple[str, LogRule]]:
+        """ロガー名に最も長く一致するルールを返します（結果はキャッシュする）。"""
+        if name in self._resolved:
+            return self._resolved[name]
+        candidates = [
+            key for key in self._rules if name == key or name.startswith(key + ".")
+        ]
+        matched = None
+        if candidates:
+            key = max(candidates, key=len)
+            matched = (key, self._rules[key])
+        self._resolved[name] = matched
+        return matched
+
+    def _admit(self, key: str, rule: LogRule) -> bool:
+        """サンプリング率とトークンバケットで通過可否を決めます。"""
+        if rule.sample_rate < 1.0 and random.random() >= rule.sample_rate:
+            return False
+        if rule.max_per_second is None:
+            return True
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(key, [rule.max_per_second, now])
+        bucket[0] = min(rule.max_per_second, bucket[0] + (now - bucket[1]) * rule.max_per_second)
+        bucket[1] = now
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+
+class TraceContextFilter(logging.Filter):
+    """出力元のコンテキストにあるトレースIDをレコードへ付与します。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """trace_id属性を設定し、常に通過させます。"""
+        record.trace_id = current_trace_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONへ変換します。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """レコードをJSON文字列にします。"""
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["traceId"] = trace_id
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """整形の大半をリスナースレッドへ任せるQueueHandler。
+
+    標準のQueueHandlerはキューへ積む前にフォーマッターで整形し、レコードを複製します。
+    ここでは%書式の展開と例外の文字列化だけを行い、時刻の整形やJSON化はリスナー側で行います。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """スレッドをまたいでも安全なように、引数と例外情報だけを文字列へ固定します。"""
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_queue_logging(
+    log_file: Path,
+    level: int = logging.INFO,
+    json_format: bool = True,
+    rules: Optional[Dict[str, LogRule]] = None,
+) -> QueueListener:
+    """ルートロガーの出力をキュー経由でバックグラウンドスレッドへ移します。
+
+    ルートロガーにはQueueHandlerだけを付け、ファイル（日次ローテーション）と標準エラーへの
+    書き込みはQueueListenerのスレッドで行います。イベントループ上ではレコードをキューへ
+    積むだけになります。
+
+    Args:
+        log_file: ログファイルのパス。
+        level: ルートロガーのレベル。
+        json_format: ファイル出力をJSON Linesにするかどうか。Falseの場合はテキスト形式。
+        rules: ロガー単位のサンプリング・レート制限。
+
+    Returns:
+        QueueListener: 開始済みのリスナー。終了時にstop()を呼び出してください。
+    """
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    file_handler = TimedRotatingFileHandler(
+        log_file,
+        when="midnight",
+        interval=1,
+        backupCount=7,
+        encoding="utf-8",
+    )
+    file_handler.suffix = "%Y%m%d"
+    file_handler.setFormatter(
+        JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    )
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(rules or {}))
+    queue_handler.addFilter(TraceContextFilter())
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    return listener
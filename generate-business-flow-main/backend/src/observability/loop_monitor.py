@@ -0,0 +1,199 @@
+"""Event-loop lag monitor with stack capture for blocking calls."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+from src.observability.metrics import get_metrics_singleton
+
+LOGGER = logging.getLogger("observability.loop_monitor")
+_LOOP_MONITOR_SINGLETON: Optional["LoopMonitor"] = None
+
+LAG_QUANTILES = (0.5, 0.9, 0.99)
+# スタックは呼び出し元に近い側だけを残す
+MAX_STACK_FRAMES = 30
+MAX_BLOCKED_EVENTS = 20
+
+
+class LoopMonitor:
+    """イベントループの遅延を継続的に計測し、ループを止めている処理のスタックを記録します。
+
+    ループ上のタスクが一定間隔でスリープし、予定より遅れて起きた時間を遅延として記録します。
+    別スレッドのウォッチドッグはタスクの最終起床時刻を監視し、しきい値を超えて起きない場合に
+    その時点のループスレッドのスタックを取得します（ループが止まっている間に取れるのは
+    別スレッドだけのため）。
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = 100.0,
+        block_threshold_ms: float = 250.0,
+        window_seconds: float = 60.0,
+    ) -> None:
+        """計測間隔としきい値を受け取り初期化します。
+
+        Args:
+            interval_ms: 遅延を計測する間隔（ミリ秒）。
+            block_threshold_ms: スタックを取得する遅延のしきい値（ミリ秒）。
+            window_seconds: パーセンタイルを計算する直近の期間（秒）。
+        """
+        self.interval = max(0.01, interval_ms / 1000)
+        self.block_threshold = max(0.01, block_threshold_ms / 1000)
+        self._lags: Deque[float] = deque(maxlen=max(1, int(window_seconds / self.interval)))
+        self._blocked: Deque[Dict[str, Any]] = deque(maxlen=MAX_BLOCKED_EVENTS)
+        self._blocked_total = 0
+        self._last_tick = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # ウォッチドッグが取得したスタック（同じ停止を二重に記録しないよう最終起床時刻で識別）
+        self._pending: Optional[Dict[str, Any]] = None
+
+    async def start(self) -> None:
+        """計測タスクとウォッチドッグスレッドを開始します。"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        LOGGER.info(
+            "Loop monitor started: interval=%sms threshold=%sms",
+            round(self.interval * 1000),
+            round(self.block_threshold * 1000),
+        )
+
+    async def stop(self) -> None:
+        """計測を停止します。"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        metrics = get_metrics_singleton()
+        ticks = 0
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self._last_tick = now
+                self._lags.append(lag)
+                pending, self._pending = self._pending, None
+            metrics.loop_lag.observe(lag)
+            if pending is not None:
+                # 停止が明けた時点で実際の遅延が分かるため、ここで確定して記録する
+                pending["blockedMs"] = round(lag * 1000, 1)
+                with self._lock:
+                    self._blocked.append(pending)
+                    self._blocked_total += 1
+                metrics.loop_blocked.inc()
+                LOGGER.warning(
+                    "Event loop blocked for %.0fms; stack at detection:\n%s",
+                    lag * 1000,
+                    "".join(pending["stack"]),
+                )
+            ticks += 1
+            if ticks % max(1, int(1 / self.interval)) == 0:
+                for quantile, value in self.percentiles().items():
+                    metrics.loop_lag_window.labels(quantile).set(value)
+
+    def _watch(self) -> None:
+        """ループが止まっている間にループスレッドのスタックを取得します。"""
+        # ループは通常interval秒ごとに起きるため、それに加えてしきい値を超えたら停止とみなす
+        limit = self.interval + self.block_threshold
+        captured_tick = None
+        while not self._stopping.wait(self.block_threshold / 4):
+            with self._lock:
+                last_tick = self._last_tick
+            stalled = time.monotonic() - last_tick
+            if stalled < limit or captured_tick == last_tick:
+                continue
+            captured_tick = last_tick
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            frame = frames.get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)[-MAX_STACK_FRAMES:]
+            with self._lock:
+                self._pending = {
+                    "detectedAt": datetime.now(timezone.utc).isoformat(),
+                    "blockedMs": round((stalled - self.interval) * 1000, 1),
+                    "stack": stack,
+                }
+
+    def percentiles(self) -> Dict[str, float]:
+        """直近の期間の遅延パーセンタイル（秒）を返します。"""
+        with self._lock:
+            lags = sorted(self._lags)
+        if not lags:
+            return {str(quantile): 0.0 for quantile in LAG_QUANTILES}
+        return {
+            str(quantile): lags[min(len(lags) - 1, math.ceil(quantile * len(lags)) - 1)]
+            for quantile in LAG_QUANTILES
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """/health向けの遅延パーセンタイルと直近の停止情報を返します。"""
+        percentiles = self.percentiles()
+        with self._lock:
+            lags = list(self._lags)
+            last_blocked = self._blocked[-1] if self._blocked else None
+            blocked_total = self._blocked_total
+        return {
+            "running": self._task is not None,
+            "lagMs": {
+                **{f"p{round(float(q) * 100)}": round(v * 1000, 2) for q, v in percentiles.items()},
+                "max": round(max(lags) * 1000, 2) if lags else 0.0,
+            },
+            "samples": len(lags),
+            "blockedTotal": blocked_total,
+            "lastBlocked": (
+                {
+                    "detectedAt": last_blocked["detectedAt"],
+                    "blockedMs": last_blocked["blockedMs"],
+                    # 末尾（ループを止めていた処理）に近いフレームだけを返す
+                    "stack": [line.strip() for line in last_blocked["stack"][-5:]],
+                }
+                if last_blocked
+                else None
+            ),
+        }
+
+
+def set_loop_monitor_singleton(monitor: LoopMonitor) -> None:
+    """create_appで生成したLoopMonitorインスタンスを共有レジストリに登録。"""
+    global _LOOP_MONITOR_SINGLETON
+    _LOOP_MONITOR_SINGLETON = monitor
+
+
+def get_loop_monitor_singleton() -> LoopMonitor:
+    """登録済みのLoopMonitorを返却し、未登録なら新規生成する（開始はしない）。"""
+    global _LOOP_MONITOR_SINGLETON
+    if _LOOP_MONITOR_SINGLETON is None:
+        _LOOP_MONITOR_SINGLETON = LoopMonitor()
+    return _LOOP_MONITOR_SINGLETON
@@ -0,0 +1,346 @@
+"""In-process metrics exposed in the Prometheus text format."""
+
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_METRICS_SINGLETON: Optional["GenerationMetrics"] = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "bit_flow_"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+FIRST_BYTE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_SECOND_BUCKETS = (5.0, 10.0, 20.0, 40.0, 60.0, 80.0, 100.0, 150.0, 200.0, 300.0)
+CHUNK_BUCKETS = (1.0, 10.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# メトリクスの更新はすべてイベントループのスレッドから行う前提で、ロックを取らずに
+# 単純な加算だけで済ませる（チャンクごとの呼び出しでもオーバーヘッドを増やさないため）
+
+
+def _format_value(value: float) -> str:
+    """Prometheusのテキスト形式に合わせて数値を文字列化します。"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    """ラベル値のバックスラッシュ・ダブルクォート・改行をエスケープします。"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """ラベル名と値の組を ``{name="value",...}`` 形式へ変換します。"""
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """ラベルの組み合わせごとに子メトリクスを保持する基底クラス。"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        """メトリクス名と説明、ラベル名を受け取り初期化します。
+
+        Args:
+            name: メトリクス名（接頭辞なし）。
+            documentation: HELP行に出力する説明。
+            label_names: ラベル名の一覧。
+        """
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # ラベルなしのメトリクスは子を事前に生成し、更新時の辞書引きを省く
+        self._default = None if self.label_names else self.labels()
+
+    def labels(self, *values: str):
+        """ラベル値に対応する子メトリクスを返します（初回のみ生成）。
+
+        Args:
+            values: label_namesと同じ順序のラベル値。
+
+        Returns:
+            ラベル値に対応する子メトリクス。
+
+        Raises:
+            ValueError: ラベル値の数がラベル名と一致しない場合。
+        """
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name}のラベル数が一致しません: {key}")
+            child = self._children.get(key) or self._new_child()
+            self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """HELP/TYPE行とサンプル行を返します。"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    """カウンタ・ゲージの子メトリクス。"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """値を加算します。"""
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """値を減算します。"""
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        """値を上書きします。"""
+        self.value = value
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ。"""
+
+    type_name = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """ラベルなしのカウンタを加算します。"""
+        self._default.inc(amount)
+
+    def _render_child(self, values: Tuple[str, ...], child: _Value) -> Iterable[str]:
+        yield f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    """増減する現在値。"""
+
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1.0) -> None:
+        """ラベルなしのゲージを減算します。"""
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        """ラベルなしのゲージを上書きします。"""
+        self._default.set(value)
+
+    def value(self) -> float:
+        """ラベルなしのゲージの現在値を返します。"""
+        return self._default.value
+
+
+class _HistogramValue:
+    """バケット境界ごとの件数を保持する子ヒストグラム。"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # 末尾は+Infバケット。件数は累積せずに保持し、出力時に累積する
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """観測値を該当バケットへ加算します。"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """事前に定義したバケットで分布を集計するヒストグラム。"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        label_names: Sequence[str] = (),
+    ) -> None:
+        """バケット境界を受け取り初期化します。
+
+        Args:
+            name: メトリクス名（接頭辞なし）。
+            documentation: HELP行に出力する説明。
+            buckets: 昇順のバケット上限値。+Infは自動で追加します。
+            label_names: ラベル名の一覧。
+        """
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, documentation, label_names)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """ラベルなしのヒストグラムへ観測値を追加します。"""
+        self._default.observe(value)
+
+    def _render_child(self, values: Tuple[str, ...], child: _HistogramValue) -> Iterable[str]:
+        names = self.label_names + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            labels = _format_labels(names, values + (_format_value(bound),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.label_names, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class GenerationMetrics:
+    """業務フロー生成パイプラインのメトリクス一式。"""
+
+    def __init__(self) -> None:
+        """各メトリクスを登録します。"""
+        self.request_duration = Histogram(
+            "flow_request_duration_seconds",
+            "Time from receiving a flow generation request until its response stream ends.",
+            LATENCY_BUCKETS,
+            ("outcome",),
+        )
+        self.active_streams = Gauge(
+            "flow_active_streams", "Flow generation response streams currently open."
+        )
+        self.upstream_first_byte = Histogram(
+            "upstream_time_to_first_byte_seconds",
+            "Time from sending the upstream request until its response headers arrive.",
+            FIRST_BYTE_BUCKETS,
+        )
+        self.upstream_first_content = Histogram(
+            "upstream_time_to_first_content_seconds",
+            "Time from sending the upstream request until the first content delta.",
+            FIRST_BYTE_BUCKETS,
+        )
+        self.tokens_per_second = Histogram(
+            "upstream_output_tokens_per_second",
+            "Output tokens per second between the first content delta and message_stop.",
+            TOKENS_PER_SECOND_BUCKETS,
+        )
+        self.chunks_per_stream = Histogram(
+            "upstream_chunks_per_stream",
+            "Content chunks relayed per upstream stream.",
+            CHUNK_BUCKETS,
+        )
+        self.upstream_responses = Counter(
+            "upstream_responses_total",
+            "Upstream HTTP responses by status code (\"error\" when no response was received).",
+            ("status",),
+        )
+        self.session_cache = Counter(
+            "session_drawio_cache_total",
+            "SessionManager drawio cache lookups by result.",
+            ("result",),
+        )
+        self.upstream_tokens = Counter(
+            "upstream_tokens_total",
+            "Tokens reported by upstream usage, by model and kind "
+            "(input, output, cache_read, cache_write).",
+            ("model", "kind"),
+        )
+        self.loop_lag = Histogram(
+            "event_loop_lag_seconds",
+            "Delay between the scheduled and actual wake-up of the event-loop monitor.",
+            LOOP_LAG_BUCKETS,
+        )
+        self.loop_lag_window = Gauge(
+            "event_loop_lag_window_seconds",
+            "Event-loop lag percentiles over the monitor's rolling window.",
+            ("quantile",),
+        )
+        self.loop_blocked = Counter(
+            "event_loop_blocked_total",
+            "Times the event loop was held past the blocking threshold.",
+        )
+        self.cancelled_streams = Counter(
+            "upstream_streams_cancelled_total",
+            "Upstream streams closed before message_stop because no client was listening.",
+        )
+        self.cancelled_tokens = Counter(
+            "upstream_cancelled_tokens_total",
+            "Tokens billed for upstream streams cancelled before completion, by kind "
+            "(output is estimated from the relayed text when the final usage never arrived).",
+            ("kind",),
+        )
+        self.coalesced_requests = Counter(
+            "flow_requests_coalesced_total",
+            "Flow generation requests served by joining an identical in-flight generation.",
+        )
+        # ゲージは0件でも出力されるよう初期化しておく
+        self.active_streams.set(0)
+        self._metrics: List[_Metric] = [
+            self.request_duration,
+            self.active_streams,
+            self.upstream_first_byte,
+            self.upstream_first_content,
+            self.tokens_per_second,
+            self.chunks_per_stream,
+            self.upstream_responses,
+            self.session_cache,
+            self.upstream_tokens,
+            self.loop_lag,
+            self.loop_lag_window,
+            self.loop_blocked,
+            self.cancelled_streams,
+            self.cancelled_tokens,
+            self.coalesced_requests,
+        ]
+
+    def register(self, metric: _Metric) -> _Metric:
+        """追加のメトリクスを出力対象へ登録します。
+
+        Args:
+            metric: 登録するメトリクス。
+
+        Returns:
+            _Metric: 登録したメトリクス（そのまま変数へ代入できるよう返す）。
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """全メトリクスをPrometheusのテキスト形式で返します。"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def set_metrics_singleton(metrics: GenerationMetrics) -> None:
+    """create_appで生成したGenerationMetricsインスタンスを共有レジストリに登録。"""
+    global _METRICS_SINGLETON
+    _METRICS_SINGLETON = metrics
+
+
+def get_metrics_singleton() -> GenerationMetrics:
+    """登録済みのGenerationMetricsを返却し、未登録なら新規生成する。"""
+    global _METRICS_SINGLETON
+    if _METRICS_SINGLETON is None:
+        _METRICS_SINGLETON = GenerationMetrics()
+    return _METRICS_SINGLETON
@@ -0,0 +1,320 @@
+"""Opt-in per-request stack sampling profiler."""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+
+LOGGER = logging.getLogger("observability.profiling")
+_ACTIVE_PROFILE: ContextVar[Optional["ProfileSession"]] = ContextVar(
+    "active_profile", default=None
+)
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# 終わらないストリームで標本化スレッドが残り続けないよう、1回の計測時間に上限を設ける
+MAX_PROFILE_SECONDS = 300.0
+REPORT_TOP_FUNCTIONS = 40
+
+
+class ProfilingDenied(Exception):
+    """プロファイル要求を受け付けられない場合の例外。"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None) -> None:
+        """HTTPステータスと理由を受け取り初期化します。
+
+        Args:
+            status_code: 返却するHTTPステータスコード。
+            detail: クライアントへ返すメッセージ。
+            retry_after: 再試行までの秒数。レート制限時のみ指定。
+        """
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ProfileSession:
+    """1リクエスト分のスタック標本化。
+
+    イベントループのスレッドのスタックを一定間隔で読み取り、その時点でループが実行していた
+    タスクがこのリクエストに属する場合だけ集計します。同じループで並行して動く他のリクエストの
+    処理は ``other`` として件数だけ数えます。to_thread等で別スレッドへ逃がした処理は対象外です。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        loop: asyncio.AbstractEventLoop,
+        interval_seconds: float,
+        output_dir: Path,
+    ) -> None:
+        """計測対象のループと出力先を受け取り初期化します。
+
+        Args:
+            name: レポートのファイル名（拡張子なし）。トレースIDを含めます。
+            label: レポートに記載するリクエストの説明。
+            loop: 計測するイベントループ。
+            interval_seconds: 標本化の間隔（秒）。
+            output_dir: レポートの出力先ディレクトリ。
+        """
+        self.name = name
+        self.label = label
+        self.interval_seconds = interval_seconds
+        self.output_dir = output_dir
+        # このリクエストのコンテキストで生成されたタスク（タスクファクトリーが登録する）
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stacks: Counter[Tuple[str, ...]] = Counter()
+        self._other_samples = 0
+        self._idle_samples = 0
+        self._started_at = time.perf_counter()
+        self._elapsed = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{name}", daemon=True)
+        self._on_finished = None
+
+    def start(self, on_finished=None) -> None:
+        """標本化スレッドを開始します。
+
+        Args:
+            on_finished: レポートの書き出し後に呼ぶコールバック。
+        """
+        self._on_finished = on_finished
+        self._thread.start()
+
+    def stop(self) -> None:
+        """標本化を終了します。レポートは標本化スレッドが書き出します。"""
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        deadline = self._started_at + MAX_PROFILE_SECONDS
+        try:
+            while not self._stop_event.wait(self.interval_seconds):
+                if time.perf_counter() >= deadline:
+                    LOGGER.warning(
+                        "Profile %s reached %ss and was cut off", self.name, MAX_PROFILE_SECONDS
+                    )
+                    break
+                self._sample()
+            self._elapsed = time.perf_counter() - self._started_at
+            self._write_report()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Profile %s failed", self.name)
+        finally:
+            if self._on_finished is not None:
+                self._on_finished(self)
+
+    def _sample(self) -> None:
+        """ループが実行中のタスクとスタックを1回読み取ります。"""
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            self._idle_samples += 1
+            return
+        if task not in self.tasks:
+            self._other_samples += 1
+            return
+        frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+        stack: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        self._stacks[tuple(stack)] += 1
+
+    def _write_report(self) -> None:
+        """集計結果をテキストの要約と折りたたみ形式のスタックとして書き出します。
+
+        ``.folded`` はflamegraph.plやspeedscopeでそのまま読み込める形式です。
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with (self.output_dir / f"{self.name}.folded").open("w", encoding="utf-8") as output:
+            for stack, count in self._stacks.most_common():
+                output.write(f"{';'.join(stack)} {count}\n")
+
+        request_samples = sum(self._stacks.values())
+        self_counts: Counter[str] = Counter()
+        inclusive_counts: Counter[str] = Counter()
+        for stack, count in self._stacks.items():
+            self_counts[stack[-1]] += count
+            for frame in set(stack):
+                inclusive_counts[frame] += count
+
+        lines = [
+            f"request: {self.label}",
+            f"profile: {self.name}",
+            f"duration_seconds: {self._elapsed:.3f}",
+            f"interval_ms: {self.interval_seconds * 1000:g}",
+            (
+                f"samples: request={request_samples} other_tasks={self._other_samples} "
+                f"idle={self._idle_samples}"
+            ),
+            "",
+        ]
+        for title, counts in (("self", self_counts), ("inclusive", inclusive_counts)):
+            lines.append(f"top functions ({title}):")
+            for frame, count in counts.most_common(REPORT_TOP_FUNCTIONS):
+                share = count / request_samples * 100 if request_samples else 0.0
+                lines.append(f"  {count:>7} {share:6.1f}%  {frame}")
+            lines.append("")
+        (self.output_dir / f"{self.name}.txt").write_text("\n".join(lines), encoding="utf-8")
+        LOGGER.info(
+            "Profile %s written: %s request samples in %.2fs",
+            self.name,
+            request_samples,
+            self._elapsed,
+        )
+
+
+def _short_path(filename: str) -> str:
+    """site-packagesや標準ライブラリのパスを短く表示します。"""
+    for marker in ("site-packages" + os.sep, "backend" + os.sep):
+        index = filename.rfind(marker)
+        if index >= 0:
+            return filename[index + len(marker):]
+    return os.path.basename(filename)
+
+
+class RequestProfiler:
+    """認証付きヘッダーで要求されたリクエストだけを標本化プロファイラーで計測します。
+
+    同時に計測するのは1リクエストまでとし、1時間あたりの計測回数にも上限を設けます。
+    """
+
+    def __init__(
+        self,
+        token: str,
+        output_dir: Path,
+        max_per_hour: int = 6,
+        interval_ms: float = 5.0,
+    ) -> None:
+        """認証トークンと出力先を受け取り初期化します。
+
+        Args:
+            token: ``X-Profile-Token`` ヘッダーと照合するトークン。空文字の場合は無効。
+            output_dir: レポートの出力先ディレクトリ。
+            max_per_hour: 直近1時間に開始できる計測の上限。
+            interval_ms: 標本化の間隔（ミリ秒）。
+        """
+        self.token = token
+        self.output_dir = output_dir
+        self.max_per_hour = max(1, max_per_hour)
+        self.interval_seconds = max(0.001, interval_ms / 1000)
+        self._started: Deque[float] = deque()
+        self._active: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """トークンが設定されているかどうかを返します。"""
+        return bool(self.token)
+
+    def start(self, token: str, label: str, trace_id: Optional[str]) -> ProfileSession:
+        """トークンとレート制限を確認し、計測を開始します。
+
+        イベントループのスレッドから呼び出してください。
+
+        Args:
+            token: リクエストヘッダーで渡されたトークン。
+            label: レポートに記載するリクエストの説明。
+            trace_id: レポート名に含めるトレースID。
+
+        Returns:
+            ProfileSession: 開始したセッション。
+
+        Raises:
+            ProfilingDenied: トークン不一致、計測中、またはレート制限に達した場合。
+        """
+        if not self.enabled or not hmac.compare_digest(token.encode(), self.token.encode()):
+            raise ProfilingDenied(403, "プロファイルのトークンが不正です")
+
+        now = time.monotonic()
+        with self._lock:
+            if self._active is not None:
+                raise ProfilingDenied(429, "他のリクエストを計測中です", retry_after=10)
+            while self._started and now - self._started[0] >= 3600:
+                self._started.popleft()
+            if len(self._started) >= self.max_per_hour:
+                retry_after = int(3600 - (now - self._started[0])) + 1
+                raise ProfilingDenied(
+                    429, "プロファイルの実行回数が上限に達しました", retry_after=retry_after
+                )
+            self._started.append(now)
+
+            loop = asyncio.get_running_loop()
+            _install_task_factory(loop)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{trace_id or os.urandom(8).hex()}"
+            session = ProfileSession(name, label, loop, self.interval_seconds, self.output_dir)
+            self._active = session
+        session.start(on_finished=self._finished)
+        LOGGER.info("Profile %s started for %s", name, label)
+        return session
+
+    def _finished(self, session: ProfileSession) -> None:
+        with self._lock:
+            if self._active is session:
+                self._active = None
+
+
+@contextmanager
+def activate_profile(session: ProfileSession) -> Iterator[ProfileSession]:
+    """ブロック内で生成されるタスクを計測対象にします。
+
+    現在のタスクも計測対象に加えます。ブロック内で生成されたタスクはコンテキストを引き継ぐため、
+    その先で生成されるタスクも対象になります。
+
+    Args:
+        session: 計測中のセッション。
+
+    Yields:
+        ProfileSession: 渡したセッション。
+    """
+    task = asyncio.current_task()
+    if task is not None:
+        session.tasks.add(task)
+    token = _ACTIVE_PROFILE.set(session)
+    try:
+        yield session
+    finally:
+        _ACTIVE_PROFILE.reset(token)
+
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop) -> None:
+    """計測中のリクエストから生成されたタスクを記録するタスクファクトリーを設定します。
+
+    既存のファクトリーがある場合はそれを呼び出してから記録します。計測していない間の
+    オーバーヘッドはContextVarの参照1回です。
+    """
+    previous = loop.get_task_factory()
+    if getattr(previous, "_records_profiled_tasks", False):
+        return
+
+    def factory(loop, coro, **kwargs):  # type: ignore[no-untyped-def]
+        if previous is not None:
+            task = previous(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        session = (
+            context.get(_ACTIVE_PROFILE) if context is not None else _ACTIVE_PROFILE.get()
+        )
+        if session is not None:
+            session.tasks.add(task)
+        return task
+
+    factory._records_profiled_tasks = True  # type: ignore[attr-defined]
+    loop.set_task_factory(factory)
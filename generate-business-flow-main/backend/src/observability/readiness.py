@@ -0,0 +1,169 @@
+"""Load-aware readiness evaluation for load balancer health checks."""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.observability.loop_monitor import get_loop_monitor_singleton
+from src.observability.metrics import get_metrics_singleton
+
+_READINESS_SINGLETON: Optional["ReadinessChecker"] = None
+
+# 上流の遅延は直近の実トラフィックだけで判断し、件数が少ないうちは判定に使わない
+MIN_UPSTREAM_SAMPLES = 5
+UPSTREAM_QUANTILE = 0.9
+MAX_WINDOW_VALUES = 10000
+
+
+class RollingWindow:
+    """直近一定時間の観測値を保持し、パーセンタイルをキャッシュ付きで返します。"""
+
+    def __init__(self, window_seconds: float, cache_seconds: float = 5.0) -> None:
+        """保持期間とキャッシュ期間を受け取り初期化します。
+
+        Args:
+            window_seconds: 観測値を保持する秒数。
+            cache_seconds: パーセンタイルを再計算するまでの秒数。
+        """
+        self.window_seconds = window_seconds
+        self.cache_seconds = cache_seconds
+        self._values: Deque[Tuple[float, float]] = deque(maxlen=MAX_WINDOW_VALUES)
+        self._cached_at = -math.inf
+        self._cached: Tuple[int, Optional[float]] = (0, None)
+
+    def observe(self, value: float) -> None:
+        """観測値を追加し、保持期間を過ぎた値を捨てます。"""
+        now = time.monotonic()
+        self._prune(now)
+        self._values.append((now, value))
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._values and self._values[0][0] < cutoff:
+            self._values.popleft()
+
+    def quantile(self, quantile: float) -> Tuple[int, Optional[float]]:
+        """保持期間内の件数とパーセンタイルを返します。
+
+        Args:
+            quantile: 求めるパーセンタイル（0.0〜1.0）。
+
+        Returns:
+            Tuple[int, Optional[float]]: 件数と値。観測値がない場合の値はNone。
+        """
+        now = time.monotonic()
+        if now - self._cached_at < self.cache_seconds:
+            return self._cached
+        self._prune(now)
+        values = sorted(value for _, value in self._values)
+        result = None
+        if values:
+            result = values[min(len(values) - 1, math.ceil(quantile * len(values)) - 1)]
+        self._cached_at = now
+        self._cached = (len(values), result)
+        return self._cached
+
+
+@dataclass(frozen=True)
+class ReadinessThresholds:
+    """not-readyと判定するしきい値。"""
+
+    max_streams: int = 100
+    max_loop_lag_ms: float = 500.0
+    max_session_cache_mb: float = 512.0
+    max_upstream_ttft_ms: float = 20000.0
+
+
+class ReadinessChecker:
+    """同時ストリーム数・ループ遅延・セッションキャッシュ・上流の応答開始時間で受付可否を判定します。"""
+
+    def __init__(
+        self,
+        thresholds: ReadinessThresholds,
+        session_cache_bytes: Optional[Callable[[], int]] = None,
+        upstream_window_seconds: float = 300.0,
+    ) -> None:
+        """しきい値と計測元を受け取り初期化します。
+
+        Args:
+            thresholds: 判定のしきい値。
+            session_cache_bytes: セッションキャッシュの使用量（バイト）を返す関数。
+            upstream_window_seconds: 上流の応答開始時間を集計する直近の秒数。
+        """
+        self.thresholds = thresholds
+        self._session_cache_bytes = session_cache_bytes
+        self.upstream_first_content = RollingWindow(upstream_window_seconds)
+
+    def observe_upstream_first_content(self, seconds: float) -> None:
+        """上流へのリクエスト送信から最初のコンテンツ受信までの秒数を記録します。"""
+        self.upstream_first_content.observe(seconds)
+
+    def evaluate(self) -> Tuple[bool, Dict[str, Any]]:
+        """現在の状態を評価します。
+
+        Returns:
+            Tuple[bool, Dict[str, Any]]: 受付可能かどうかと、各項目の値・しきい値・理由。
+        """
+        thresholds = self.thresholds
+        reasons: List[str] = []
+
+        active_streams = int(get_metrics_singleton().active_streams.value())
+        if active_streams >= thresholds.max_streams:
+            reasons.append("streams_at_capacity")
+
+        loop_lag_ms = get_loop_monitor_singleton().percentiles()["0.9"] * 1000
+        if loop_lag_ms > thresholds.max_loop_lag_ms:
+            reasons.append("event_loop_lagging")
+
+        cache_bytes = self._session_cache_bytes() if self._session_cache_bytes else 0
+        cache_mb = cache_bytes / (1024 * 1024)
+        if cache_mb > thresholds.max_session_cache_mb:
+            reasons.append("session_cache_full")
+
+        samples, ttft = self.upstream_first_content.quantile(UPSTREAM_QUANTILE)
+        ttft_ms = ttft * 1000 if ttft is not None else None
+        if (
+            ttft_ms is not None
+            and samples >= MIN_UPSTREAM_SAMPLES
+            and ttft_ms > thresholds.max_upstream_ttft_ms
+        ):
+            reasons.append("upstream_slow")
+
+        return not reasons, {
+            "status": "not_ready" if reasons else "ready",
+            "reasons": reasons,
+            "checks": {
+                "activeStreams": {"value": active_streams, "limit": thresholds.max_streams},
+                "eventLoopLagP90Ms": {
+                    "value": round(loop_lag_ms, 2),
+                    "limit": thresholds.max_loop_lag_ms,
+                },
+                "sessionCacheMb": {
+                    "value": round(cache_mb, 2),
+                    "limit": thresholds.max_session_cache_mb,
+                },
+                "upstreamTimeToFirstTokenP90Ms": {
+                    "value": round(ttft_ms, 1) if ttft_ms is not None else None,
+                    "samples": samples,
+                    "limit": thresholds.max_upstream_ttft_ms,
+                },
+            },
+        }
+
+
+def set_readiness_singleton(checker: ReadinessChecker) -> None:
+    """create_appで生成したReadinessCheckerインスタンスを共有レジストリに登録。"""
+    global _READINESS_SINGLETON
+    _READINESS_SINGLETON = checker
+
+
+def get_readiness_singleton() -> ReadinessChecker:
+    """登録済みのReadinessCheckerを返却し、未登録なら既定のしきい値で新規生成する。"""
+    global _READINESS_SINGLETON
+    if _READINESS_SINGLETON is None:
+        _READINESS_SINGLETON = ReadinessChecker(ReadinessThresholds())
+    return _READINESS_SINGLETON
@@ -0,0 +1,344 @@
+"""Lightweight request tracing exported as OTLP/JSON lines."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+LOGGER = logging.getLogger("observability.tracing")
+_TRACER_SINGLETON: Optional["Tracer"] = None
+_CURRENT_SPAN: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+TRACE_ID_HEADER = "X-Trace-Id"
+SERVICE_NAME = "bit-flow-backend"
+SCOPE_NAME = "src.observability.tracing"
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclass
+class Span:
+    """1区間の処理時間と属性。"""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    sampled: bool
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: int = STATUS_UNSET
+    status_message: str = ""
+    # 同じトレースのスパンを集める共有リスト。ルートの終了時にまとめて出力する
+    _trace_spans: List["Span"] = field(default_factory=list, repr=False)
+    _tracer: Optional["Tracer"] = field(default=None, repr=False)
+
+    @property
+    def is_root(self) -> bool:
+        """トレースのルートスパンかどうかを返します。"""
+        return self.parent_span_id is None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """スパンへ属性を追加します。"""
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        """スパンをエラー状態にします。"""
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self) -> None:
+        """スパンを終了します。2回目以降の呼び出しは無視します。"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled and self._tracer is not None:
+            self._tracer._finish(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSONのspanオブジェクトへ変換します。"""
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """属性値をOTLP/JSONのAnyValue形式へ変換します。"""
+    if isinstance(value, bool):
+        typed: Dict[str, Any] = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class OTLPJsonFileExporter:
+    """スパンをOTLP/JSON（1行1リクエスト）でファイルへ書き出します。
+
+    書き込みは専用スレッドで行い、イベントループ上ではキューへ積むだけにします。
+    出力はOpenTelemetry CollectorのfileexporterやotlpjsonfilereceiverとJSON形式が互換です。
+    """
+
+    def __init__(self, path: Path) -> None:
+        """出力先を受け取り初期化します。
+
+        Args:
+            path: JSON Linesの出力先ファイル。
+        """
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[List[Span]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        """スパン群を書き込みキューへ追加します。"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="otlp-json-exporter", daemon=True
+                    )
+                    self._thread.start()
+        self._queue.put(spans)
+
+    def shutdown(self) -> None:
+        """キューに残ったスパンを書き出してからスレッドを停止します。"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as output:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    return
+                try:
+                    output.write(json.dumps(_to_otlp_request(spans), ensure_ascii=False) + "\n")
+                    # 後続がなければフラッシュし、連続して届く間はまとめて書く
+                    if self._queue.empty():
+                        output.flush()
+                except (OSError, TypeError, ValueError):
+                    LOGGER.exception("Failed to export spans")
+
+
+def _to_otlp_request(spans: List[Span]) -> Dict[str, Any]:
+    """スパン群をOTLPのExportTraceServiceRequest相当の辞書へ変換します。"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [
+                    {"scope": {"name": SCOPE_NAME}, "spans": [span.to_otlp() for span in spans]}
+                ],
+            }
+        ]
+    }
+
+
+class Tracer:
+    """サンプリング付きでスパンを生成し、トレース単位でエクスポートします。"""
+
+    def __init__(self, sample_rate: float, exporter: Optional[OTLPJsonFileExporter]) -> None:
+        """サンプリング率とエクスポーターを受け取り初期化します。
+
+        Args:
+            sample_rate: 記録するトレースの割合（0.0〜1.0）。
+            exporter: スパンの出力先。Noneの場合は記録しません。
+        """
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.exporter = exporter
+
+    def start_trace(self, name: str, **attributes: Any) -> Span:
+        """新しいトレースのルートスパンを開始します。
+
+        サンプリング対象外でもトレースIDは払い出すため、レスポンスヘッダーとログの突き合わせに
+        利用できます（スパンは出力されません）。
+
+        Args:
+            name: スパン名。
+            attributes: スパンの属性。
+
+        Returns:
+            Span: ルートスパン。
+        """
+        sampled = self.exporter is not None and random.random() < self.sample_rate
+        span = Span(
+            name=name,
+            trace_id=os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_span_id=None,
+            sampled=sampled,
+            attributes=dict(attributes) if sampled else {},
+            _tracer=self,
+        )
+        span._trace_spans.append(span)
+        return span
+
+    def start_span(
+        self, name: str, parent: Optional[Span] = None, **attributes: Any
+    ) -> Optional[Span]:
+        """現在のスパン（またはparent）の子スパンを開始します。
+
+        Args:
+            name: スパン名。
+            parent: 親スパン。省略時はコンテキスト上の現在のスパン。
+            attributes: スパンの属性。
+
+        Returns:
+            Optional[Span]: 子スパン。親がない、またはサンプリング対象外の場合はNone。
+        """
+        parent = parent or _CURRENT_SPAN.get()
+        if parent is None or not parent.sampled:
+            return None
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id,
+            span_id=os.urandom(8).hex(),
+            parent_span_id=parent.span_id,
+            sampled=True,
+            attributes=dict(attributes),
+            _trace_spans=parent._trace_spans,
+            _tracer=self,
+        )
+        parent._trace_spans.append(span)
+        return span
+
+    def _finish(self, span: Span) -> None:
+        """ルートの終了時にトレース全体を、ルート終了後に閉じたスパンは単体で出力します。"""
+        if self.exporter is None:
+            return
+        if span.is_root:
+            finished = [item for item in span._trace_spans if item.end_ns is not None]
+            self.exporter.export(finished)
+        elif span._trace_spans[0].end_ns is not None:
+            self.exporter.export([span])
+
+    def shutdown(self) -> None:
+        """エクスポーターを停止します。"""
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def httpx_trace_extension(span: Span):
+    """httpxの ``trace`` 拡張へ渡すコールバックを返します。
+
+    接続確立・TLS・リクエスト送信・レスポンスヘッダー受信の各完了時点を、スパン開始からの
+    経過ミリ秒としてスパンの属性へ記録します。
+
+    Args:
+        span: 記録先のスパン。
+
+    Returns:
+        httpxの非同期クライアントで利用できる非同期コールバック。
+    """
+
+    async def on_event(name: str, _info: Dict[str, Any]) -> None:
+        if span.end_ns is None and name.endswith((".complete", ".failed")):
+            span.set_attribute(f"{name}_ms", round((time.time_ns() - span.start_ns) / 1e6, 2))
+
+    return on_event
+
+
+def current_span() -> Optional[Span]:
+    """コンテキスト上の現在のスパンを返します。"""
+    return _CURRENT_SPAN.get()
+
+
+def current_trace_id() -> Optional[str]:
+    """コンテキスト上の現在のトレースIDを返します。"""
+    span = _CURRENT_SPAN.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def use_span(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """スパンを現在のスパンとしてコンテキストへ設定します（終了はしません）。
+
+    Args:
+        span: 設定するスパン。Noneの場合は何もしません。
+
+    Yields:
+        Optional[Span]: 設定したスパン。
+    """
+    if span is None:
+        yield None
+        return
+    token = _CURRENT_SPAN.set(span)
+    try:
+        yield span
+    finally:
+        _CURRENT_SPAN.reset(token)
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """現在のスパンの子スパンを開始し、ブロックの終了時に閉じます。
+
+    ブロック内ではこのスパンが現在のスパンになるため、入れ子のtrace_spanは子になります。
+    例外が送出された場合はスパンをエラー状態にして再送出します。
+
+    Args:
+        name: スパン名。
+        attributes: スパンの属性。
+
+    Yields:
+        Optional[Span]: 開始したスパン。サンプリング対象外の場合はNone。
+    """
+    span = get_tracer_singleton().start_span(name, **attributes)
+    if span is None:
+        yield None
+        return
+    token = _CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.set_error(f"{type(exc).__name__}: {exc}")
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        span.end()
+
+
+def set_tracer_singleton(tracer: Tracer) -> None:
+    """create_appで生成したTracerインスタンスを共有レジストリに登録。"""
+    global _TRACER_SINGLETON
+    _TRACER_SINGLETON = tracer
+
+
+def get_tracer_singleton() -> Tracer:
+    """登録済みのTracerを返却し、未登録ならスパンを記録しないTracerを生成する。"""
+    global _TRACER_SINGLETON
+    if _TRACER_SINGLETON is None:
+        _TRACER_SINGLETON = Tracer(sample_rate=0.0, exporter=None)
+    return _TRACER_SINGLETON
@@ -0,0 +1,285 @@
+"""Token usage accounting aggregated per session and per model."""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional
+
+from src.observability.metrics import get_metrics_singleton
+from src.settings.settings import TokenPricing
+
+_USAGE_LEDGER_SINGLETON: Optional["UsageLedger"] = None
+
+# Anthropicのusageのキーと、メトリクスのkindラベルの対応
+_METRIC_KINDS = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_write",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算します。
+
+    日本語などの非ASCII文字は1文字1トークン、ASCII文字は4文字1トークンとして数えます。
+
+    Args:
+        text: 対象テキスト。
+
+    Returns:
+        int: 概算トークン数。
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 0x7F)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+@dataclass
+class TokenUsage:
+    """1回のLLM呼び出し（または集計）のトークン数。"""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """キャッシュ分を含む全トークン数を返します。"""
+        return (
+            self.input_tokens
+            + self.output_tokens
+            + self.cache_read_input_tokens
+            + self.cache_creation_input_tokens
+        )
+
+    def update(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Anthropicのusageオブジェクトで値を更新します。
+
+        message_startとmessage_deltaのusageはどちらも呼び出し開始からの累積値のため、
+        含まれているキーだけを上書きします。
+
+        Args:
+            usage: APIレスポンスまたはストリームイベントのusage。
+        """
+        if not usage:
+            return
+        for key in _METRIC_KINDS:
+            value = usage.get(key)
+            if isinstance(value, int):
+                setattr(self, key, value)
+
+    def add(self, other: "TokenUsage") -> None:
+        """別のTokenUsageを加算します。"""
+        for item in fields(self):
+            setattr(self, item.name, getattr(self, item.name) + getattr(other, item.name))
+
+    def cost_usd(self, pricing: Optional[TokenPricing]) -> Optional[float]:
+        """料金表から概算コスト（USD）を計算します。
+
+        Args:
+            pricing: 100万トークンあたりの料金。Noneの場合は計算しません。
+
+        Returns:
+            Optional[float]: 概算コスト。料金表がない場合はNone。
+        """
+        if pricing is None:
+            return None
+        return (
+            self.input_tokens * pricing.input
+            + self.output_tokens * pricing.output
+            + self.cache_read_input_tokens * pricing.cache_read
+            + self.cache_creation_input_tokens * pricing.cache_write
+        ) / 1_000_000
+
+    def to_dict(self) -> Dict[str, int]:
+        """APIレスポンス用のcamelCase辞書へ変換します。"""
+        return {
+            "inputTokens": self.input_tokens,
+            "outputTokens": self.output_tokens,
+            "cacheReadInputTokens": self.cache_read_input_tokens,
+            "cacheCreationInputTokens": self.cache_creation_input_tokens,
+        }
+
+
+@dataclass
+class UsageTotals:
+    """呼び出し回数・トークン数・コスト・所要時間の合計。"""
+
+    requests: int = 0
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    cost_usd: float = 0.0
+    # 料金表がなくコストを計算できなかった呼び出しの数
+    unpriced_requests: int = 0
+    duration_seconds: float = 0.0
+
+    def add(self, usage: TokenUsage, cost_usd: Optional[float], duration_seconds: float) -> None:
+        """1回分の呼び出しを加算します。"""
+        self.requests += 1
+        self.usage.add(usage)
+        if cost_usd is None:
+            self.unpriced_requests += 1
+        else:
+            self.cost_usd += cost_usd
+        self.duration_seconds += duration_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        """APIレスポンス用のcamelCase辞書へ変換します。"""
+        return {
+            "requests": self.requests,
+            **self.usage.to_dict(),
+            "totalTokens": self.usage.total_tokens,
+            "costUsd": round(self.cost_usd, 6),
+            "unpricedRequests": self.unpriced_requests,
+            "durationSeconds": round(self.duration_seconds, 3),
+        }
+
+
+class UsageLedger:
+    """LLM呼び出しのトークン使用量をセッション単位・モデル単位でメモリ上に集計します。
+
+    セッションは最後に記録した順に保持し、上限を超えたら最も古いセッションから破棄します。
+    モデル単位と全体の合計は破棄の影響を受けません。
+    """
+
+    def __init__(self, max_sessions: int = 1000) -> None:
+        """保持するセッション数の上限を受け取り初期化します。
+
+        Args:
+            max_sessions: 集計を保持するセッション数の上限。
+        """
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Dict[str, UsageTotals]]" = OrderedDict()
+        self._models: Dict[str, UsageTotals] = {}
+        self._totals = UsageTotals()
+        self._evicted_sessions = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        session_id: Optional[str],
+        model: str,
+        usage: TokenUsage,
+        cost_usd: Optional[float],
+        duration_seconds: float,
+    ) -> None:
+        """1回分のLLM呼び出しを集計へ加えます。
+
+        Args:
+            session_id: セッションID。Noneの場合はモデル単位と全体の合計だけに加えます。
+            model: 応答したモデル名。
+            usage: トークン使用量。
+            cost_usd: 概算コスト。料金表がない場合はNone。
+            duration_seconds: リクエスト送信からストリーム終了までの秒数。
+        """
+        with self._lock:
+            self._totals.add(usage, cost_usd, duration_seconds)
+            self._models.setdefault(model, UsageTotals()).add(usage, cost_usd, duration_seconds)
+            if session_id is not None:
+                by_model = self._sessions.pop(session_id, None) or {}
+                by_model.setdefault(model, UsageTotals()).add(usage, cost_usd, duration_seconds)
+                self._sessions[session_id] = by_model
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._evicted_sessions += 1
+
+        metrics = get_metrics_singleton()
+        for key, kind in _METRIC_KINDS.items():
+            value = getattr(usage, key)
+            if value:
+                metrics.upstream_tokens.labels(model, kind).inc(value)
+
+    def session_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """セッションの集計を返します。
+
+        Args:
+            session_id: セッションID。
+
+        Returns:
+            Optional[Dict[str, Any]]: セッション合計とモデル別の内訳。記録がない場合はNone。
+        """
+        with self._lock:
+            by_model = self._sessions.get(session_id)
+            if by_model is None:
+                return None
+            return {"sessionId": session_id, **_summarize(by_model)}
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        """全体・モデル別の合計と、トークン消費の多いセッションを返します。
+
+        Args:
+            top: 返すセッション数。コスト、次いで合計トークン数の降順。
+
+        Returns:
+            Dict[str, Any]: 集計結果。
+        """
+        with self._lock:
+            sessions = [
+                {"sessionId": session_id, **_summarize(by_model)}
+                for session_id, by_model in self._sessions.items()
+            ]
+            data = {
+                "totals": self._totals.to_dict(),
+                "byModel": {model: totals.to_dict() for model, totals in self._models.items()},
+                "trackedSessions": len(self._sessions),
+                "evictedSessions": self._evicted_sessions,
+            }
+        sessions.sort(
+            key=lambda item: (item["totals"]["costUsd"], item["totals"]["totalTokens"]),
+            reverse=True,
+        )
+        data["topSessions"] = sessions[:top]
+        return data
+
+
+def _summarize(by_model: Dict[str, UsageTotals]) -> Dict[str, Any]:
+    """モデル別の集計からセッション合計と内訳の辞書を作ります。"""
+    totals = UsageTotals()
+    for item in by_model.values():
+        totals.requests += item.requests
+        totals.usage.add(item.usage)
+        totals.cost_usd += item.cost_usd
+        totals.unpriced_requests += item.unpriced_requests
+        totals.duration_seconds += item.duration_seconds
+    return {
+        "totals": totals.to_dict(),
+        "byModel": {model: item.to_dict() for model, item in by_model.items()},
+    }
+
+
+def build_usage_payload(
+    model: str, usage: TokenUsage, cost_usd: Optional[float], duration_seconds: float
+) -> Dict[str, Any]:
+    """completeイベントへ添付するusageを生成します。
+
+    Args:
+        model: 応答したモデル名。
+        usage: トークン使用量。
+        cost_usd: 概算コスト。料金表がない場合はNone。
+        duration_seconds: リクエスト送信からの秒数。
+
+    Returns:
+        Dict[str, Any]: camelCaseのusage。
+    """
+    return {
+        "model": model,
+        **usage.to_dict(),
+        "costUsd": round(cost_usd, 6) if cost_usd is not None else None,
+        "durationMs": round(duration_seconds * 1000),
+    }
+
+
+def set_usage_ledger_singleton(ledger: UsageLedger) -> None:
+    """create_appで生成したUsageLedgerインスタンスを共有レジストリに登録。"""
+    global _USAGE_LEDGER_SINGLETON
+    _USAGE_LEDGER_SINGLETON = ledger
+
+
+def get_usage_ledger_singleton() -> UsageLedger:
+    """登録済みのUsageLedgerを返却し、未登録なら新規生成する。"""
+    global _USAGE_LEDGER_SINGLETON
+    if _USAGE_LEDGER_SINGLETON is None:
+        _USAGE_LEDGER_SINGLETON = UsageLedger()
+    return _USAGE_LEDGER_SINGLETON
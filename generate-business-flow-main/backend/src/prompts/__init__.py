@@ -1 +1,5 @@
 """Prompt template assets."""
+
+from src.prompts.help_desk_agent import HelpDeskAgentPrompts
+
+__all__ = ["HelpDeskAgentPrompts"]
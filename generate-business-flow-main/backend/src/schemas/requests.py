@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -13,10 +13,12 @@ class LLMMessageRequest(BaseModel):
     user_prompt: str
     streaming: Optional[bool] = True
     use_agent_mode: Optional[bool] = False
+    # 未指定の場合はセッションに登録済みの添付をすべて利用する
+    attachment_ids: Optional[List[str]] = None
 
 
 class LLMBatchRequest(BaseModel):
-    """バッチメッセージエンドポイントの入力スキーマ。"""
+    """一括生成ジョブ投入エンドポイントの入力スキーマ。"""
 
-    user_prompt: str
-    sessionId: Optional[str] = "default"
+    prompts: List[str]
+    user_label: Optional[str] = None
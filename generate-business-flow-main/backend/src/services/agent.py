@@ -10,6 +10,7 @@ from langgraph.graph import START, StateGraph, END
 from langgraph.pregel import Pregel
 
 from src.llm.base_llm_client import BaseLLMClient
+from src.observability.tracing import trace_span
 from src.schemas.requests import LLMMessageRequest
 from src.services.prompt_builder import PromptBuilder
 from src.services.session_manager import get_session_manager_singleton, SessionManager
@@ -34,6 +35,7 @@ class FlowAgentState(TypedDict, total=False):
 
     user_prompt: str
     generator: AsyncGenerator[bytes, None]
+    is_first_request: bool
 
 
 class FlowAgent:
@@ -56,17 +58,22 @@ class FlowAgent:
         self.session_manager = get_session_manager_singleton()
     
     async def set_parameter(self):
-        self.settings = Settings.load()
-        self.prompt_builder = PromptBuilder(
-            self.settings.read_flow_prompt(),
-            self.settings.read_flow_modification_prompt(),
-        )
-        self.is_first, self.previous_drawio = await self.session_manager.register_request(self.session_id)
-        self.system_prompt = self.prompt_builder.build_prompt(self.is_first, self.previous_drawio, self.session_id)
-        self.client = AnthropicLLMClient(
-            api_key=self.settings.api_key,
-            api_url=self.settings.api_url,
-        )
+        with trace_span("Settings.load"):
+            self.settings = Settings.load()
+        with trace_span("PromptBuilder.load_templates"):
+            self.prompt_builder = PromptBuilder(
+                self.settings.read_flow_prompt(),
+                self.settings.read_flow_modification_prompt(),
+            )
+        with trace_span("SessionManager.register_request"):
+            self.is_first, self.previous_drawio = await self.session_manager.register_request(self.session_id)
+        with trace_span("PromptBuilder.build_prompt", is_first=self.is_first):
+            self.system_prompt = self.prompt_builder.build_prompt(self.is_first, self.previous_drawio, self.session_id)
+        with trace_span("AnthropicLLMClient.init"):
+            self.client = AnthropicLLMClient(
+                api_key=self.settings.api_key,
+                api_url=self.settings.api_url,
+            )
         LOGGER.info(f"self.is_first: {self.is_first}")
 
     async def handle_flow_request(
@@ -192,8 +199,13 @@ class FlowAgent:
             self.user_prompt,
             self.session_id,
             cache_drawio=self.session_manager.cache_drawio_if_present,
+            save_partial=(
+                self.session_manager.save_partial_content
+                if self.settings.persist_partial_on_cancel
+                else None
+            ),
         )
-        return {"generator": generator}
+        return {"generator": generator, "is_first_request": self.is_first}
 
     def _finalize_result(self, state: FlowAgentState) -> Dict[str, FlowAgentResult]:
         """LangGraph結果からFlowAgentResultを生成します。
@@ -221,5 +233,7 @@ async def define_flow_agent(
         Pregel: コンパイル済みのオブジェクト。
     """
     agent = FlowAgent(session_id, user_prompt)
-    await agent.set_parameter()
-    return agent.create_graph()
+    with trace_span("FlowAgent.set_parameter"):
+        await agent.set_parameter()
+    with trace_span("FlowAgent.create_graph"):
+        return agent.create_graph()
@@ -0,0 +1,392 @@
+"""Server-side text extraction for office and PDF attachments."""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import re
+import signal
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+from xml.etree import ElementTree
+
+from src.services.attachments import AttachmentError, StoredAttachment
+
+LOGGER = logging.getLogger("services.attachment_extraction")
+_ATTACHMENT_EXTRACTOR_SINGLETON: Optional["AttachmentTextExtractor"] = None
+
+MAX_CACHED_TEXTS = 512
+# 展開後のXMLや抽出結果がこれを超える場合はzip bomb等とみなして打ち切る
+MAX_UNCOMPRESSED_BYTES = 100 * 1024 * 1024
+MAX_EXTRACTED_CHARS = 2_000_000
+DEFAULT_EXTRACTION_TIMEOUT_SECONDS = 20.0
+DEFAULT_EXTRACTION_WORKERS = 2
+
+KIND_DOCX = "docx"
+KIND_XLSX = "xlsx"
+KIND_PPTX = "pptx"
+KIND_PDF = "pdf"
+
+_EXTENSION_KINDS = {
+    ".docx": KIND_DOCX,
+    ".xlsx": KIND_XLSX,
+    ".xlsm": KIND_XLSX,
+    ".pptx": KIND_PPTX,
+    ".pdf": KIND_PDF,
+}
+_MIME_KINDS = {
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": KIND_DOCX,
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": KIND_XLSX,
+    "application/vnd.ms-excel.sheet.macroenabled.12": KIND_XLSX,
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": KIND_PPTX,
+    "application/pdf": KIND_PDF,
+}
+
+_NS_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_NS_SHEET = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_DRAWING = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+class ExtractionTimeoutError(AttachmentError):
+    """テキスト抽出が制限時間を超えた場合の例外。"""
+
+
+def detect_kind(name: str, content_type: str) -> Optional[str]:
+    """ファイル名とMIMEタイプから抽出方式を判定します。
+
+    Args:
+        name: 添付ファイル名。
+        content_type: 添付のMIMEタイプ。
+
+    Returns:
+        Optional[str]: docx/xlsx/pptx/pdfのいずれか。対象外の場合はNone。
+    """
+    kind = _MIME_KINDS.get(content_type.lower())
+    if kind:
+        return kind
+    match = re.search(r"\.[^.]+$", name.lower())
+    return _EXTENSION_KINDS.get(match.group(0)) if match else None
+
+
+def extract_text(kind: str, data: bytes, timeout_seconds: float) -> str:
+    """子プロセス上で添付からテキストを抽出します。
+
+    Unixではタイマーシグナルで処理時間を制限し、超過時はTimeoutErrorを送出します。
+
+    Args:
+        kind: detect_kindで判定した抽出方式。
+        data: 添付ファイル本体。
+        timeout_seconds: 1ファイルあたりの制限時間。
+
+    Returns:
+        str: 抽出したテキスト。
+
+    Raises:
+        TimeoutError: 制限時間を超えた場合。
+        ValueError: ファイルが壊れている、または展開サイズが上限を超えた場合。
+    """
+    use_timer = hasattr(signal, "setitimer")
+    if use_timer:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        if kind == KIND_DOCX:
+            text = _extract_docx(data)
+        elif kind == KIND_XLSX:
+            text = _extract_xlsx(data)
+        elif kind == KIND_PPTX:
+            text = _extract_pptx(data)
+        elif kind == KIND_PDF:
+            text = _extract_pdf(data)
+        else:
+            raise ValueError(f"unsupported attachment kind: {kind}")
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return text[:MAX_EXTRACTED_CHARS]
+
+
+def _raise_timeout(signum, frame) -> None:  # pylint: disable=unused-argument
+    raise TimeoutError("attachment extraction timed out")
+
+
+def _read_member(archive: zipfile.ZipFile, member: str) -> bytes:
+    info = archive.getinfo(member)
+    if info.file_size > MAX_UNCOMPRESSED_BYTES:
+        raise ValueError(f"{member} is too large when uncompressed")
+    return archive.read(member)
+
+
+def _paragraphs(root: ElementTree.Element, paragraph_tag: str, text_tag: str) -> List[str]:
+    lines = []
+    for paragraph in root.iter(paragraph_tag):
+        line = "".join(node.text or "" for node in paragraph.iter(text_tag))
+        if line.strip():
+            lines.append(line)
+    return lines
+
+
+def _extract_docx(data: bytes) -> str:
+    # フロントエンドのJSZip実装と同じく word/document.xml の段落を改行区切りで連結する
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = ElementTree.fromstring(_read_member(archive, "word/document.xml"))
+    return "\n".join(_paragraphs(root, f"{_NS_WORD}p", f"{_NS_WORD}t"))
+
+
+def _extract_pptx(data: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        slides = sorted(
+            (
+                name
+                for name in archive.namelist()
+                if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)
+            ),
+            key=lambda name: int(re.search(r"(\d+)\.xml$", name).group(1)),
+        )
+        sections = []
+        for index, slide in enumerate(slides, start=1):
+            root = ElementTree.fromstring(_read_member(archive, slide))
+            lines = _paragraphs(root, f"{_NS_DRAWING}p", f"{_NS_DRAWING}t")
+            sections.append(f"## スライド{index}\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def _extract_xlsx(data: bytes) -> str:
+    # フロントエンドの xlsx 実装に合わせ、シートごとにタブ区切りテキストへ変換する
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        shared_strings: List[str] = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            root = ElementTree.fromstring(_read_member(archive, "xl/sharedStrings.xml"))
+            for item in root.iter(f"{_NS_SHEET}si"):
+                shared_strings.append("".join(node.text or "" for node in item.iter(f"{_NS_SHEET}t")))
+
+        workbook = ElementTree.fromstring(_read_member(archive, "xl/workbook.xml"))
+        relations = ElementTree.fromstring(_read_member(archive, "xl/_rels/workbook.xml.rels"))
+        targets = {
+            relation.get("Id"): relation.get("Target", "")
+            for relation in relations
+        }
+
+        sections = []
+        for sheet in workbook.iter(f"{_NS_SHEET}sheet"):
+            target = targets.get(sheet.get(f"{_NS_REL}id"), "")
+            path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            if path not in archive.namelist():
+                continue
+            root = ElementTree.fromstring(_read_member(archive, path))
+            rows = []
+            for row in root.iter(f"{_NS_SHEET}row"):
+                values = _row_values(row, shared_strings)
+                if any(value.strip() for value in values):
+                    rows.append("\t".join(values))
+            sections.append(f"## シート: {sheet.get('name', '')}\n" + "\n".join(rows))
+    return "\n\n".join(sections)
+
+
+def _row_values(row: ElementTree.Element, shared_strings: List[str]) -> List[str]:
+    values: List[str] = []
+    for cell in row.iter(f"{_NS_SHEET}c"):
+        column = _column_index(cell.get("r", ""))
+        if column is not None:
+            while len(values) < column:
+                values.append("")
+        cell_type = cell.get("t")
+        if cell_type == "inlineStr":
+            value = "".join(node.text or "" for node in cell.iter(f"{_NS_SHEET}t"))
+        else:
+            raw = cell.findtext(f"{_NS_SHEET}v") or ""
+            if cell_type == "s" and raw.isdigit() and int(raw) < len(shared_strings):
+                value = shared_strings[int(raw)]
+            else:
+                value = raw
+        values.append(value)
+    return values
+
+
+def _column_index(reference: str) -> Optional[int]:
+    letters = re.match(r"[A-Z]+", reference)
+    if not letters:
+        return None
+    index = 0
+    for letter in letters.group(0):
+        index = index * 26 + (ord(letter) - ord("A") + 1)
+    return index - 1
+
+
+def _extract_pdf(data: bytes) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise ValueError("PDFの抽出にはpypdfのインストールが必要です") from exc
+
+    reader = PdfReader(io.BytesIO(data))
+    pages = []
+    for index, page in enumerate(reader.pages, start=1):
+        pages.append(f"## ページ{index}\n{(page.extract_text() or '').strip()}")
+    text = "\n\n".join(pages)
+    if not text.replace("## ページ", "").strip("0123456789\n "):
+        raise ValueError("PDFからテキストを抽出できませんでした（画像のみのPDFの可能性があります）")
+    return text
+
+
+class AttachmentTextExtractor:
+    """添付のテキスト抽出をプロセスプールで実行し、SHA-256単位でキャッシュします。"""
+
+    def __init__(self, max_bytes: int, timeout_seconds: float, max_workers: int) -> None:
+        """抽出の上限値を受け取り初期化します。
+
+        Args:
+            max_bytes: 抽出対象とする1ファイルあたりの最大バイト数。
+            timeout_seconds: 1ファイルあたりの抽出制限時間。
+            max_workers: プロセスプールのワーカー数。
+        """
+        self.max_bytes = max_bytes
+        self.timeout_seconds = timeout_seconds
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[str]"] = {}
+
+    def supports(self, attachment: StoredAttachment) -> bool:
+        """サーバー側で抽出できる形式かを返します。"""
+        return detect_kind(attachment.name, attachment.content_type) is not None
+
+    async def extract(self, attachment: StoredAttachment) -> Optional[str]:
+        """添付からテキストを抽出します。同一内容のファイルはキャッシュを返します。
+
+        Args:
+            attachment: 抽出対象の添付。
+
+        Returns:
+            Optional[str]: 抽出テキスト。抽出対象外の形式の場合はNone。
+
+        Raises:
+            AttachmentError: サイズ超過・タイムアウト・ファイル破損の場合。
+        """
+        kind = detect_kind(attachment.name, attachment.content_type)
+        if kind is None:
+            return None
+
+        cached = self._cache.get(attachment.sha256)
+        if cached is not None:
+            self._cache.move_to_end(attachment.sha256)
+            return cached
+
+        if attachment.size > self.max_bytes:
+            raise AttachmentError(
+                f"{attachment.name} は抽出可能なサイズ（{self.max_bytes}バイト）を超えています"
+            )
+
+        inflight = self._inflight.get(attachment.sha256)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._run(kind, attachment))
+            self._inflight[attachment.sha256] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(attachment.sha256, None))
+        return await asyncio.shield(inflight)
+
+    async def extract_many(self, attachments: List[StoredAttachment]) -> Dict[str, str]:
+        """複数の添付を並行に抽出します。
+
+        Args:
+            attachments: 抽出対象の添付一覧。
+
+        Returns:
+            Dict[str, str]: 抽出できた添付IDとテキストの対応。
+        """
+        texts = await asyncio.gather(*(self.extract(attachment) for attachment in attachments))
+        return {
+            attachment.attachment_id: text
+            for attachment, text in zip(attachments, texts)
+            if text is not None
+        }
+
+    def prefetch(self, attachments: List[StoredAttachment]) -> None:
+        """アップロード直後に抽出をバックグラウンドで開始し、キャッシュを温めます。
+
+        Args:
+            attachments: 抽出対象の添付一覧。
+        """
+        for attachment in attachments:
+            if self.supports(attachment):
+                task = asyncio.ensure_future(self.extract(attachment))
+                task.add_done_callback(_log_prefetch_failure)
+
+    def shutdown(self) -> None:
+        """プロセスプールを停止します。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, kind: str, attachment: StoredAttachment) -> str:
+        loop = asyncio.get_running_loop()
+        data = attachment.read_bytes()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        executor = self._executor
+
+        started = loop.time()
+        try:
+            # 子プロセス側のタイマーで止まらない環境向けに、待機側にも猶予付きの上限を設ける
+            text = await asyncio.wait_for(
+                loop.run_in_executor(executor, extract_text, kind, data, self.timeout_seconds),
+                timeout=self.timeout_seconds + 5,
+            )
+        except (TimeoutError, asyncio.TimeoutError) as exc:
+            raise ExtractionTimeoutError(
+                f"{attachment.name} のテキスト抽出が制限時間（{self.timeout_seconds}秒）を超えました"
+            ) from exc
+        except BrokenProcessPool as exc:
+            # ワーカーが異常終了（OOM killなど）したプールは再利用できないため、次回作り直す
+            LOGGER.error("Extraction worker pool broke while processing %s", attachment.name)
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise AttachmentError(
+                f"{attachment.name} のテキスト抽出中にワーカーが異常終了しました"
+            ) from exc
+        except Exception as exc:  # pylint: disable=broad-except
+            # 壊れたファイルの例外はライブラリごとに異なる（pypdfのPdfReadErrorなど）ため、まとめて扱う
+            raise AttachmentError(f"{attachment.name} からテキストを抽出できませんでした: {exc}") from exc
+
+        self._cache[attachment.sha256] = text
+        while len(self._cache) > MAX_CACHED_TEXTS:
+            self._cache.popitem(last=False)
+        LOGGER.info(
+            "Extracted %s text from %s: %s chars in %.2fs",
+            kind,
+            attachment.attachment_id,
+            len(text),
+            loop.time() - started,
+        )
+        return text
+
+
+def _log_prefetch_failure(task: "asyncio.Future[Optional[str]]") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        LOGGER.warning("Attachment prefetch failed: %s", task.exception())
+
+
+def set_attachment_extractor_singleton(extractor: AttachmentTextExtractor) -> None:
+    """create_appで生成したAttachmentTextExtractorインスタンスを共有レジストリに登録。"""
+    global _ATTACHMENT_EXTRACTOR_SINGLETON
+    _ATTACHMENT_EXTRACTOR_SINGLETON = extractor
+
+
+def get_attachment_extractor_singleton() -> AttachmentTextExtractor:
+    """登録済みのAttachmentTextExtractorを返却し、未登録なら既定値で新規生成する。"""
+    global _ATTACHMENT_EXTRACTOR_SINGLETON
+    if _ATTACHMENT_EXTRACTOR_SINGLETON is None:
+        from src.services.attachments import DEFAULT_ATTACHMENT_MAX_BYTES
+
+        _ATTACHMENT_EXTRACTOR_SINGLETON = AttachmentTextExtractor(
+            max_bytes=DEFAULT_ATTACHMENT_MAX_BYTES,
+            timeout_seconds=DEFAULT_EXTRACTION_TIMEOUT_SECONDS,
+            max_workers=DEFAULT_EXTRACTION_WORKERS,
+        )
+    return _ATTACHMENT_EXTRACTOR_SINGLETON
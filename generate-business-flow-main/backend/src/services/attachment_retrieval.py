@@ -0,0 +1,319 @@
+"""Lexical chunk retrieval for trimming large attachments."""
+
+from __future__ import annotations
+
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.observability.usage import estimate_tokens
+from src.services.attachments import StoredAttachment
+
+LOGGER = logging.getLogger("services.attachment_retrieval")
+_ATTACHMENT_RETRIEVER_SINGLETON: Optional["AttachmentRetriever"] = None
+
+DEFAULT_TOKEN_BUDGET = 8000
+DEFAULT_TOP_K = 8
+CHUNK_MAX_CHARS = 800
+NGRAM_SIZE = 2
+MAX_INDEXED_SESSIONS = 128
+BM25_K1 = 1.5
+BM25_B = 0.75
+# drawioやXML/JSONは断片化すると意味をなさないため、抜粋せず全文を送る
+STRUCTURED_EXTENSION_PATTERN = re.compile(r"\.(drawio|xml|svg|json|plantuml|pu|uml)$", re.I)
+_WORD_PATTERN = re.compile(r"[0-9a-z]+|[^\x00-\x7f\u3000-\u303f]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25用にテキストをトークンへ分割します。
+
+    英数字は単語単位、日本語などの非ASCII文字列は文字n-gram（既定2文字）へ分割します。
+    形態素解析器を使わずに、分かち書きのない日本語でも部分一致を拾えるようにするためです。
+
+    Args:
+        text: 対象テキスト。
+
+    Returns:
+        List[str]: トークン列。
+    """
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for word in _WORD_PATTERN.findall(normalized):
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) <= NGRAM_SIZE:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + NGRAM_SIZE] for i in range(len(word) - NGRAM_SIZE + 1))
+    return tokens
+
+
+@dataclass
+class AttachmentChunk:
+    """添付テキストを分割したチャンク。"""
+
+    attachment_id: str
+    name: str
+    index: int
+    text: str
+    tokens: int
+    terms: Counter = field(repr=False)
+    score: float = 0.0
+
+    def to_dict(self) -> Dict[str, object]:
+        """クライアントへ返す辞書へ変換します。"""
+        return {
+            "attachmentId": self.attachment_id,
+            "name": self.name,
+            "chunk": self.index + 1,
+            "tokens": self.tokens,
+            "score": round(self.score, 4),
+        }
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """テキストを行境界でおおよそmax_chars以内のチャンクへ分割します。
+
+    抽出テキストの見出し（"## シート" や "## ページ" など）では必ずチャンクを区切ります。
+
+    Args:
+        text: 分割対象のテキスト。
+        max_chars: 1チャンクの目安文字数。
+
+    Returns:
+        List[str]: チャンクの一覧。
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        starts_section = line.startswith("## ")
+        if current and (starts_section or size + len(line) > max_chars):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        # 1行だけでmax_charsを超える場合は文字数で切り出す
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        current.append(line)
+        size += len(line) + 1
+    if current and "\n".join(current).strip():
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class BM25Index:
+    """チャンク集合に対するOkapi BM25の転置インデックス。"""
+
+    def __init__(self, chunks: Sequence[AttachmentChunk]) -> None:
+        """チャンクから文書頻度と平均長を計算します。
+
+        Args:
+            chunks: 索引対象のチャンク。
+        """
+        self.chunks = list(chunks)
+        self._lengths = [sum(chunk.terms.values()) for chunk in self.chunks]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, chunk in enumerate(self.chunks):
+            for term, frequency in chunk.terms.items():
+                self._postings.setdefault(term, []).append((position, frequency))
+
+    def search(self, query: str) -> List[Tuple[float, AttachmentChunk]]:
+        """クエリに対するスコアの高い順にチャンクを返します。
+
+        Args:
+            query: 検索クエリ（ユーザーの指示文）。
+
+        Returns:
+            List[Tuple[float, AttachmentChunk]]: スコアとチャンクの組。スコア0のチャンクは含みません。
+        """
+        total = len(self.chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = 1 - BM25_B + BM25_B * self._lengths[position] / (self._average_length or 1)
+                scores[position] = scores.get(position, 0.0) + idf * (
+                    frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                )
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, self.chunks[position]) for position, score in ranked]
+
+
+@dataclass
+class RetrievalResult:
+    """チャンク選択の結果。"""
+
+    texts: Dict[str, str]
+    selected: List[AttachmentChunk]
+    total_chunks: int
+
+    def to_event(self) -> Dict[str, object]:
+        """ストリームへ流す選択結果イベントを返します。"""
+        return {
+            "type": "attachments",
+            "selectedChunks": [chunk.to_dict() for chunk in self.selected],
+            "totalChunks": self.total_chunks,
+        }
+
+
+class AttachmentRetriever:
+    """セッションごとに添付チャンクの索引を保持し、指示に関連するチャンクだけを選びます。
+
+    分割・索引作成・検索はCPU負荷が高いため、呼び出し側はasyncio.to_threadでワーカースレッドから
+    呼び出します。キャッシュの読み書きはロックで保護し、索引の作成はロックの外で行います。
+    """
+
+    def __init__(self, token_budget: int, top_k: int) -> None:
+        """選択の上限値を受け取り初期化します。
+
+        Args:
+            token_budget: 添付テキスト全体に割り当てる概算トークン数。
+            top_k: 関連度順に採用するチャンク数の上限。
+        """
+        self.token_budget = token_budget
+        self.top_k = max(1, top_k)
+        self._chunks_by_hash: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._indexes: "OrderedDict[str, Tuple[Tuple[str, ...], BM25Index]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def select(
+        self,
+        session_id: str,
+        query: str,
+        attachments: List[StoredAttachment],
+        texts: Dict[str, str],
+    ) -> Optional[RetrievalResult]:
+        """添付テキストが予算を超える場合に、関連チャンクだけへ絞り込みます。
+
+        Args:
+            session_id: 索引をキャッシュするセッションID。
+            query: 今回のユーザー指示。
+            attachments: リクエストで参照された添付一覧。
+            texts: 添付IDとテキストの対応。テキスト化できない添付は含みません。
+
+        Returns:
+            Optional[RetrievalResult]: 絞り込んだ結果。予算内で全文を送れる場合はNone。
+        """
+        targets = [
+            attachment
+            for attachment in attachments
+            if attachment.attachment_id in texts
+            and not STRUCTURED_EXTENSION_PATTERN.search(attachment.name)
+        ]
+        if not targets:
+            return None
+        total_tokens = sum(estimate_tokens(texts[a.attachment_id]) for a in targets)
+        if total_tokens <= self.token_budget:
+            return None
+
+        index = self._get_index(session_id, targets, texts)
+        ranked = index.search(query) if query else []
+        selected: List[AttachmentChunk] = []
+        used = 0
+        for score, chunk in ranked[: self.top_k]:
+            if used + chunk.tokens > self.token_budget:
+                continue
+            # 索引のチャンクは他リクエストと共有するため、スコアは複製側へ記録する
+            selected.append(replace(chunk, score=score))
+            used += chunk.tokens
+        if not selected:
+            # 指示文が空、または一致する語がない場合は先頭から予算分を採用する
+            for chunk in index.chunks:
+                if used + chunk.tokens > self.token_budget:
+                    break
+                selected.append(chunk)
+                used += chunk.tokens
+
+        trimmed: Dict[str, str] = {}
+        for attachment in targets:
+            chunks = sorted(
+                (c for c in selected if c.attachment_id == attachment.attachment_id),
+                key=lambda c: c.index,
+            )
+            count = sum(1 for c in index.chunks if c.attachment_id == attachment.attachment_id)
+            header = f"（関連部分のみ抜粋: {len(chunks)}/{count}チャンク）"
+            body = "\n…\n".join(f"[チャンク{c.index + 1}]\n{c.text}" for c in chunks)
+            trimmed[attachment.attachment_id] = f"{header}\n{body}" if chunks else header
+
+        LOGGER.info(
+            "Trimmed attachments for %s: %s -> %s tokens (%s/%s chunks)",
+            session_id,
+            total_tokens,
+            used,
+            len(selected),
+            len(index.chunks),
+        )
+        return RetrievalResult(texts=trimmed, selected=selected, total_chunks=len(index.chunks))
+
+    def _get_index(
+        self, session_id: str, attachments: List[StoredAttachment], texts: Dict[str, str]
+    ) -> BM25Index:
+        """セッションの添付構成が変わっていなければ既存の索引を再利用します。"""
+        signature = tuple(f"{a.attachment_id}:{a.sha256}" for a in attachments)
+        with self._lock:
+            cached = self._indexes.get(session_id)
+            if cached is not None and cached[0] == signature:
+                self._indexes.move_to_end(session_id)
+                return cached[1]
+
+        chunks: List[AttachmentChunk] = []
+        for attachment in attachments:
+            for position, text in enumerate(
+                self._chunk(attachment.sha256, texts[attachment.attachment_id])
+            ):
+                chunks.append(
+                    AttachmentChunk(
+                        attachment_id=attachment.attachment_id,
+                        name=attachment.name,
+                        index=position,
+                        text=text,
+                        tokens=estimate_tokens(text),
+                        terms=Counter(tokenize(text)),
+                    )
+                )
+        index = BM25Index(chunks)
+        with self._lock:
+            self._indexes[session_id] = (signature, index)
+            while len(self._indexes) > MAX_INDEXED_SESSIONS:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _chunk(self, sha256: str, text: str) -> List[str]:
+        """同一内容のファイルは分割結果を使い回します。"""
+        with self._lock:
+            chunks = self._chunks_by_hash.get(sha256)
+            if chunks is not None:
+                self._chunks_by_hash.move_to_end(sha256)
+                return chunks
+        chunks = chunk_text(text)
+        with self._lock:
+            self._chunks_by_hash[sha256] = chunks
+            while len(self._chunks_by_hash) > MAX_INDEXED_SESSIONS * 4:
+                self._chunks_by_hash.popitem(last=False)
+        return chunks
+
+
+def set_attachment_retriever_singleton(retriever: AttachmentRetriever) -> None:
+    """create_appで生成したAttachmentRetrieverインスタンスを共有レジストリに登録。"""
+    global _ATTACHMENT_RETRIEVER_SINGLETON
+    _ATTACHMENT_RETRIEVER_SINGLETON = retriever
+
+
+def get_attachment_retriever_singleton() -> AttachmentRetriever:
+    """登録済みのAttachmentRetrieverを返却し、未登録なら既定値で新規生成する。"""
+    global _ATTACHMENT_RETRIEVER_SINGLETON
+    if _ATTACHMENT_RETRIEVER_SINGLETON is None:
+        _ATTACHMENT_RETRIEVER_SINGLETON = AttachmentRetriever(
+            token_budget=DEFAULT_TOKEN_BUDGET, top_k=DEFAULT_TOP_K
+        )
+    return _ATTACHMENT_RETRIEVER_SINGLETON
@@ -0,0 +1,474 @@
+"""Attachment upload storage and prompt assembly."""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import re
+import tempfile
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+LOGGER = logging.getLogger("services.attachments")
+_ATTACHMENT_STORE_SINGLETON: Optional["AttachmentStore"] = None
+
+# この容量を超えた添付はメモリではなく一時ファイルへ退避する
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+MAX_STORED_ATTACHMENTS = 256
+DEFAULT_ATTACHMENT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ATTACHMENT_MAX_FILES = 10
+TEXT_EXTENSION_PATTERN = re.compile(r"\.(txt|md|csv|json|xml|drawio|plantuml|pu|uml|svg)$", re.I)
+TEXT_MIME_TYPES = {"application/json", "application/xml", "text/xml", "image/svg+xml"}
+
+
+class AttachmentError(ValueError):
+    """添付ファイルのアップロードや参照が不正な場合の例外。"""
+
+
+class AttachmentTooLargeError(AttachmentError):
+    """添付ファイルがサイズ上限を超えた場合の例外。"""
+
+
+@dataclass
+class StoredAttachment:
+    """アップロード済み添付ファイルのメタデータと本体。"""
+
+    attachment_id: str
+    name: str
+    content_type: str
+    size: int
+    sha256: str
+    file: tempfile.SpooledTemporaryFile = field(repr=False)
+
+    def read_bytes(self) -> bytes:
+        """添付ファイルの内容を先頭から読み込みます。
+
+        Returns:
+            bytes: ファイル本体。
+        """
+        self.file.seek(0)
+        return self.file.read()
+
+    @property
+    def is_textual(self) -> bool:
+        """MIMEタイプと拡張子からテキストとして扱えるかを判定します。"""
+        if self.content_type.startswith("text/") or self.content_type in TEXT_MIME_TYPES:
+            return True
+        return bool(TEXT_EXTENSION_PATTERN.search(self.name))
+
+    def to_dict(self) -> Dict[str, object]:
+        """APIレスポンス用の辞書へ変換します。"""
+        return {
+            "attachmentId": self.attachment_id,
+            "name": self.name,
+            "contentType": self.content_type,
+            "size": self.size,
+            "sha256": self.sha256,
+        }
+
+
+class AttachmentStore:
+    """アップロードされた添付ファイルをID単位で保持します。
+
+    本体はSHA-256をキーに1つだけ保持し、同じ内容のファイルはセッションをまたいで共有します。
+    """
+
+    def __init__(self, max_bytes: int, max_files: int) -> None:
+        """サイズ上限を受け取り初期化します。
+
+        Args:
+            max_bytes: 1ファイルあたりの最大バイト数。
+            max_files: 1リクエストで受け付ける最大ファイル数。
+        """
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._attachments: "OrderedDict[str, StoredAttachment]" = OrderedDict()
+        self._blobs: Dict[str, tempfile.SpooledTemporaryFile] = {}
+        self._blob_refs: Dict[str, int] = {}
+        self._sessions: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def add(self, attachment: StoredAttachment) -> StoredAttachment:
+        """添付を登録し、上限を超えた古い添付から破棄します。
+
+        同じ内容の本体が既にあれば新しい一時ファイルは閉じ、既存の本体を参照させます。
+
+        Args:
+            attachment: 登録する添付ファイル。
+
+        Returns:
+            StoredAttachment: 登録した添付。
+        """
+        blob = self._blobs.get(attachment.sha256)
+        if blob is None:
+            self._blobs[attachment.sha256] = attachment.file
+        elif blob is not attachment.file:
+            attachment.file.close()
+            attachment.file = blob
+        self._blob_refs[attachment.sha256] = self._blob_refs.get(attachment.sha256, 0) + 1
+
+        self._attachments[attachment.attachment_id] = attachment
+        while len(self._attachments) > MAX_STORED_ATTACHMENTS:
+            _, evicted = self._attachments.popitem(last=False)
+            self._release_blob(evicted.sha256)
+            LOGGER.info("Evicted attachment %s", evicted.attachment_id)
+        return attachment
+
+    def get(self, attachment_id: str) -> Optional[StoredAttachment]:
+        """IDに対応する添付を返します。
+
+        Args:
+            attachment_id: アップロード時に払い出したID。
+
+        Returns:
+            Optional[StoredAttachment]: 添付。存在しない場合はNone。
+        """
+        attachment = self._attachments.get(attachment_id)
+        if attachment is not None:
+            self._attachments.move_to_end(attachment_id)
+        return attachment
+
+    def resolve(self, attachment_ids: List[str]) -> List[StoredAttachment]:
+        """ID一覧を添付一覧へ変換します。
+
+        Args:
+            attachment_ids: リクエストで参照された添付ID。
+
+        Returns:
+            List[StoredAttachment]: 指定順の添付一覧。
+
+        Raises:
+            AttachmentError: 存在しないIDが含まれる場合。
+        """
+        attachments = []
+        for attachment_id in attachment_ids:
+            attachment = self.get(attachment_id)
+            if attachment is None:
+                raise AttachmentError(f"添付ファイルが見つかりません: {attachment_id}")
+            attachments.append(attachment)
+        return attachments
+
+    def register_session(
+        self, session_id: str, attachments: List[StoredAttachment]
+    ) -> List[StoredAttachment]:
+        """添付をセッションに紐づけます。同じ名前・内容の添付は既存のものを返します。
+
+        重複した添付はこのセッションに紐づけないだけで、ストアからは削除しません。
+        同じIDを他のセッションが参照している場合があるため、本体の破棄は参照数に任せます。
+
+        Args:
+            session_id: 紐づけ先のセッションID。
+            attachments: 紐づける添付一覧。
+
+        Returns:
+            List[StoredAttachment]: セッションに紐づいた添付一覧（重複は既存の添付）。
+        """
+        attachment_ids = self._sessions.setdefault(session_id, [])
+        self._sessions.move_to_end(session_id)
+        existing = {
+            (attachment.name, attachment.sha256): attachment
+            for attachment in self.session_attachments(session_id)
+        }
+        registered = []
+        for attachment in attachments:
+            duplicate = existing.get((attachment.name, attachment.sha256))
+            if duplicate is not None and duplicate is not attachment:
+                registered.append(duplicate)
+                continue
+            if attachment.attachment_id not in attachment_ids:
+                attachment_ids.append(attachment.attachment_id)
+            existing[(attachment.name, attachment.sha256)] = attachment
+            registered.append(attachment)
+
+        while len(self._sessions) > MAX_STORED_ATTACHMENTS:
+            self._sessions.popitem(last=False)
+        return registered
+
+    def session_attachments(self, session_id: str) -> List[StoredAttachment]:
+        """セッションに紐づく添付を登録順に返します。破棄済みの添付は除外します。
+
+        Args:
+            session_id: 対象のセッションID。
+
+        Returns:
+            List[StoredAttachment]: セッションの添付一覧。
+        """
+        attachment_ids = self._sessions.get(session_id, [])
+        attachments = [self.get(attachment_id) for attachment_id in attachment_ids]
+        alive = [attachment for attachment in attachments if attachment is not None]
+        if len(alive) != len(attachment_ids):
+            self._sessions[session_id] = [attachment.attachment_id for attachment in alive]
+        return alive
+
+    def _release_blob(self, sha256: str) -> None:
+        """本体の参照数を減らし、0になったら一時ファイルを閉じます。"""
+        refs = self._blob_refs.get(sha256, 0) - 1
+        if refs > 0:
+            self._blob_refs[sha256] = refs
+            return
+        self._blob_refs.pop(sha256, None)
+        blob = self._blobs.pop(sha256, None)
+        if blob is not None:
+            blob.close()
+
+    async def receive_multipart(
+        self,
+        content_type: str,
+        body: AsyncIterator[bytes],
+        session_id: Optional[str] = None,
+    ) -> List[StoredAttachment]:
+        """multipart/form-dataのボディを逐次パースし、各ファイルを保存します。
+
+        ボディ全体をメモリへ展開せず、受信したチャンクをそのまま一時ファイルへ書き込み、
+        同時にSHA-256を計算します。サイズ上限は受信中に判定します。
+
+        Args:
+            content_type: リクエストのContent-Typeヘッダー。
+            body: リクエストボディのチャンクを返す非同期イテレーター。
+            session_id: 指定した場合、保存した添付をこのセッションに紐づけます。
+
+        Returns:
+            List[StoredAttachment]: 保存した添付一覧。
+
+        Raises:
+            AttachmentError: multipart形式でない場合やファイル数が上限を超えた場合。
+            AttachmentTooLargeError: ファイルサイズが上限を超えた場合。
+        """
+        mime_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if mime_type != b"multipart/form-data" or not boundary:
+            raise AttachmentError("multipart/form-data形式で送信してください")
+
+        parser_state = _MultipartState(self.max_bytes, self.max_files)
+        parser = MultipartParser(boundary, parser_state.callbacks())
+        try:
+            async for chunk in body:
+                parser.write(chunk)
+                parser_state.raise_if_failed()
+            parser.finalize()
+            parser_state.raise_if_failed()
+        except Exception:
+            parser_state.discard()
+            raise
+
+        stored = []
+        for attachment in parser_state.completed:
+            stored.append(self.add(attachment))
+            LOGGER.info(
+                "Stored attachment %s name=%s size=%s sha256=%s",
+                attachment.attachment_id,
+                attachment.name,
+                attachment.size,
+                attachment.sha256,
+            )
+        if session_id is not None:
+            stored = self.register_session(session_id, stored)
+        return stored
+
+
+class _MultipartState:
+    """MultipartParserのコールバックから各パートを一時ファイルへ書き出す状態。"""
+
+    def __init__(self, max_bytes: int, max_files: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.completed: List[StoredAttachment] = []
+        self.error: Optional[Exception] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._file: Optional[tempfile.SpooledTemporaryFile] = None
+        self._hasher = hashlib.sha256()
+        self._size = 0
+        self._name = ""
+        self._content_type = ""
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def raise_if_failed(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        for attachment in self.completed:
+            attachment.file.close()
+        self.completed = []
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._file = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = disposition.get(b"filename")
+        if filename is None:
+            # ファイル以外のフォーム項目は読み捨てる
+            return
+        if len(self.completed) >= self.max_files:
+            self.error = AttachmentError(f"添付ファイルは最大{self.max_files}件までです")
+            return
+
+        self._name = filename.decode("utf-8", errors="replace")
+        self._content_type = self._headers.get(
+            b"content-type", b"application/octet-stream"
+        ).decode("latin-1")
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+        self._hasher = hashlib.sha256()
+        self._size = 0
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._file is None or self.error is not None:
+            return
+        self._size += end - start
+        if self._size > self.max_bytes:
+            self.error = AttachmentTooLargeError(
+                f"{self._name} は最大サイズ（{self.max_bytes}バイト）を超えています"
+            )
+            return
+        chunk = data[start:end]
+        self._file.write(chunk)
+        self._hasher.update(chunk)
+
+    def _on_part_end(self) -> None:
+        if self._file is None or self.error is not None:
+            return
+        self._file.seek(0)
+        self.completed.append(
+            StoredAttachment(
+                attachment_id=uuid.uuid4().hex,
+                name=self._name,
+                content_type=self._content_type,
+                size=self._size,
+                sha256=self._hasher.hexdigest(),
+                file=self._file,
+            )
+        )
+        self._file = None
+
+
+def format_bytes(size: int) -> str:
+    """フロントエンドと同じ表記でバイト数を整形します。
+
+    Args:
+        size: バイト数。
+
+    Returns:
+        str: B/KB/MB単位の文字列。
+    """
+    if size < 1024:
+        return f"{size}B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f}KB"
+    return f"{size / (1024 * 1024):.1f}MB"
+
+
+def collect_attachment_texts(
+    attachments: List[StoredAttachment], extracted_texts: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """テキストとして埋め込める添付の本文を集めます。
+
+    サーバー側で抽出済みのテキストを優先し、それ以外はUTF-8として読めるテキスト添付のみ含めます。
+
+    Args:
+        attachments: 対象の添付一覧。
+        extracted_texts: 添付IDと抽出済みテキストの対応。
+
+    Returns:
+        Dict[str, str]: 添付IDとテキストの対応。
+    """
+    extracted_texts = extracted_texts or {}
+    texts: Dict[str, str] = {}
+    for attachment in attachments:
+        content = extracted_texts.get(attachment.attachment_id)
+        if content is None and attachment.is_textual:
+            try:
+                content = attachment.read_bytes().decode("utf-8")
+            except UnicodeDecodeError:
+                content = None
+        if content is not None:
+            texts[attachment.attachment_id] = content
+    return texts
+
+
+def build_prompt_with_attachments(
+    user_prompt: str,
+    attachments: List[StoredAttachment],
+    extracted_texts: Optional[Dict[str, str]] = None,
+) -> str:
+    """ユーザープロンプトへ添付内容を結合します。
+
+    フロントエンドの preparePrompt と同じ書式で、テキストは生のまま、
+    サーバー側で抽出済みのものは抽出テキストを、それ以外はbase64で埋め込みます。
+
+    Args:
+        user_prompt: トリム済みのユーザープロンプト。
+        attachments: 埋め込む添付一覧。
+        extracted_texts: 添付IDとテキストの対応。抜粋済みのテキストを渡すこともできます。
+
+    Returns:
+        str: LLMへ送信するユーザープロンプト。
+    """
+    if not attachments:
+        return user_prompt
+
+    texts = collect_attachment_texts(attachments, extracted_texts)
+    details = []
+    for index, attachment in enumerate(attachments, start=1):
+        content = texts.get(attachment.attachment_id)
+        encoding = "text" if content is not None else "base64"
+        if content is None:
+            content = base64.b64encode(attachment.read_bytes()).decode("ascii")
+        descriptor = (
+            f"【添付{index}: {attachment.name} | {format_bytes(attachment.size)} | {encoding}】"
+        )
+        details.append(f"{descriptor}\n{content}")
+
+    attachment_details = "\n\n".join(details)
+    if user_prompt:
+        return f"{user_prompt}\n\n--- 添付ファイル詳細 ---\n{attachment_details}"
+    return (
+        "以下の添付ファイルをもとに業務フロー図を生成してください。"
+        f"\n\n--- 添付ファイル詳細 ---\n{attachment_details}"
+    )
+
+
+def set_attachment_store_singleton(store: AttachmentStore) -> None:
+    """create_appで生成したAttachmentStoreインスタンスを共有レジストリに登録。"""
+    global _ATTACHMENT_STORE_SINGLETON
+    _ATTACHMENT_STORE_SINGLETON = store
+
+
+def get_attachment_store_singleton() -> AttachmentStore:
+    """登録済みのAttachmentStoreを返却し、未登録なら既定の上限で新規生成する。"""
+    global _ATTACHMENT_STORE_SINGLETON
+    if _ATTACHMENT_STORE_SINGLETON is None:
+        _ATTACHMENT_STORE_SINGLETON = AttachmentStore(
+            max_bytes=DEFAULT_ATTACHMENT_MAX_BYTES, max_files=DEFAULT_ATTACHMENT_MAX_FILES
+        )
+    return _ATTACHMENT_STORE_SINGLETON
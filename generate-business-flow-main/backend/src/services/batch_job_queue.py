@@ -0,0 +1,341 @@
+"""In-process worker pool for batch flow generation jobs."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.db.models import FlowBatchJob
+from src.db.repository import add_flow_request, get_or_create_flow_session
+from src.db.session import get_session_factory
+from src.llm.base_llm_client import BaseLLMClient
+from src.services.prompt_builder import PromptBuilder
+from src.services.session_manager import extract_drawio
+
+LOGGER = logging.getLogger("services.batch_job_queue")
+_BATCH_JOB_QUEUE_SINGLETON: Optional["BatchJobQueue"] = None
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+BATCH_SESSION_PREFIX = "batch-"
+
+
+class BatchJobQueue:
+    """一括生成ジョブをDBへ永続化し、同時実行数を制限したワーカーで処理します。"""
+
+    def __init__(
+        self,
+        llm_client: BaseLLMClient,
+        prompt_builder: PromptBuilder,
+        concurrency: int,
+        max_batch_size: int = 50,
+        session_factory: Callable[[], sessionmaker[Session]] = get_session_factory,
+    ) -> None:
+        """ジョブ処理に必要な依存を受け取り初期化します。
+
+        Args:
+            llm_client: フロー生成に利用するLLMクライアント。
+            prompt_builder: 初回生成用system promptを組み立てるビルダー。
+            concurrency: 同時に実行するワーカー数の上限。
+            max_batch_size: 1回のsubmitで登録できるプロンプト数の上限。
+            session_factory: DBセッションファクトリを返す関数。
+        """
+        self.llm_client = llm_client
+        self.prompt_builder = prompt_builder
+        self.concurrency = max(1, concurrency)
+        self.max_batch_size = max(1, max_batch_size)
+        self._session_factory = session_factory
+        self._queue: Optional[asyncio.Queue[str]] = None
+        self._workers: List[asyncio.Task[None]] = []
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """ワーカーを起動し、未完了のまま残っているジョブを再投入します。"""
+        async with self._start_lock:
+            if self._workers:
+                return
+
+            self._queue = asyncio.Queue()
+            try:
+                pending = await asyncio.to_thread(self._load_pending_job_keys)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to recover pending batch jobs")
+                pending = []
+
+            for job_key in pending:
+                self._queue.put_nowait(job_key)
+
+            self._workers = [
+                asyncio.create_task(self._worker(index)) for index in range(self.concurrency)
+            ]
+            LOGGER.info(
+                "Batch job workers started: concurrency=%s recovered=%s",
+                self.concurrency,
+                len(pending),
+            )
+
+    async def stop(self) -> None:
+        """実行中のワーカーを停止します。処理中のジョブは次回起動時に再投入されます。"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def submit(
+        self, prompts: List[str], user_label: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """プロンプト群をジョブとして登録し、キューへ投入します。
+
+        Args:
+            prompts: 生成対象のユーザープロンプト一覧。
+            user_label: ジョブと生成セッションに付与する任意ラベル。
+
+        Returns:
+            List[Dict[str, Any]]: 登録したジョブの状態一覧。
+        """
+        await self.start()
+        jobs = await asyncio.to_thread(self._insert_jobs, prompts, user_label)
+        assert self._queue is not None
+        for job in jobs:
+            self._queue.put_nowait(job["jobId"])
+        return jobs
+
+    async def get_job(self, job_key: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を取得します。
+
+        Args:
+            job_key: submitで払い出したジョブID。
+
+        Returns:
+            Optional[Dict[str, Any]]: ジョブ状態。存在しない場合はNone。
+        """
+        return await asyncio.to_thread(self._fetch_job, job_key, False)
+
+    async def get_result(self, job_key: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態と生成されたdrawioを取得します。
+
+        Args:
+            job_key: submitで払い出したジョブID。
+
+        Returns:
+            Optional[Dict[str, Any]]: 状態とdrawioを含む辞書。存在しない場合はNone。
+        """
+        return await asyncio.to_thread(self._fetch_job, job_key, True)
+
+    async def _worker(self, worker_index: int) -> None:
+        """キューからジョブを取り出して順に処理し続けます。
+
+        Args:
+            worker_index: ログ出力用のワーカー番号。
+        """
+        assert self._queue is not None
+        while True:
+            job_key = await self._queue.get()
+            try:
+                await self._run_job(job_key)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Batch worker %s failed on job %s", worker_index, job_key)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_key: str) -> None:
+        """1ジョブ分のフロー生成を行い、結果をFlowRequestとして保存します。
+
+        Args:
+            job_key: 処理対象のジョブID。
+        """
+        user_prompt = await asyncio.to_thread(self._claim_job, job_key)
+        if user_prompt is None:
+            return
+
+        LOGGER.info("Batch job %s started", job_key)
+        try:
+            content, usage = await self._generate(job_key, user_prompt)
+            drawio = extract_drawio(content)
+            if not drawio:
+                raise RuntimeError("レスポンスにdrawioが含まれていませんでした")
+            await asyncio.to_thread(self._complete_job, job_key, user_prompt, drawio, usage)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.exception("Batch job %s failed", job_key)
+            await asyncio.to_thread(self._fail_job, job_key, str(exc))
+            return
+
+        LOGGER.info("Batch job %s succeeded", job_key)
+
+    async def _generate(
+        self, job_key: str, user_prompt: str
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """ストリーミングAPIで生成し、全文とトークン使用量を返します。
+
+        長時間の生成でも読み取りタイムアウトにかからないよう、非ストリーミングではなく
+        stream_messageを最後まで消費して全文を受け取ります。
+
+        Args:
+            job_key: ログとキャッシュコールバックに渡すジョブID。
+            user_prompt: ユーザープロンプト。
+
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: LLMが返した全文と、completeイベントのusage。
+
+        Raises:
+            RuntimeError: ストリームがエラーイベントを返した場合。
+        """
+        captured: Dict[str, str] = {}
+        usage: Optional[Dict[str, Any]] = None
+
+        async def capture(_session_id: str, content: str) -> None:
+            captured["content"] = content
+
+        system_prompt = self.prompt_builder.build_prompt(True, None, job_key)
+        stream = self.llm_client.stream_message(
+            system_prompt, user_prompt, job_key, cache_drawio=capture
+        )
+        async for chunk in stream:
+            event = json.loads(chunk)
+            if event.get("type") == "error":
+                raise RuntimeError(event.get("error") or "ストリーミングエラー")
+            if event.get("type") == "complete":
+                usage = event.get("usage")
+        return captured.get("content", ""), usage
+
+    def _insert_jobs(self, prompts: List[str], user_label: Optional[str]) -> List[Dict[str, Any]]:
+        """ジョブ行をqueued状態で作成します。"""
+        with self._session_factory()() as db:
+            jobs = [
+                FlowBatchJob(
+                    job_key=uuid.uuid4().hex,
+                    status=JOB_STATUS_QUEUED,
+                    user_prompt=prompt,
+                    user_label=user_label,
+                )
+                for prompt in prompts
+            ]
+            db.add_all(jobs)
+            db.commit()
+            return [_serialize_job(job) for job in jobs]
+
+    def _load_pending_job_keys(self) -> List[str]:
+        """前回プロセスで完了しなかったジョブをqueuedへ戻し、そのIDを返します。"""
+        with self._session_factory()() as db:
+            db.execute(
+                update(FlowBatchJob)
+                .where(FlowBatchJob.status == JOB_STATUS_RUNNING)
+                .values(status=JOB_STATUS_QUEUED, started_at=None)
+            )
+            db.commit()
+            return list(
+                db.scalars(
+                    select(FlowBatchJob.job_key)
+                    .where(FlowBatchJob.status == JOB_STATUS_QUEUED)
+                    .order_by(FlowBatchJob.id)
+                )
+            )
+
+    def _claim_job(self, job_key: str) -> Optional[str]:
+        """queuedのジョブをrunningへ遷移させ、そのプロンプトを返します。
+
+        既に他ワーカーが取得済み、または完了済みの場合はNoneを返します。
+        """
+        with self._session_factory()() as db:
+            result = db.execute(
+                update(FlowBatchJob)
+                .where(FlowBatchJob.job_key == job_key, FlowBatchJob.status == JOB_STATUS_QUEUED)
+                .values(status=JOB_STATUS_RUNNING, started_at=func.now())
+            )
+            if result.rowcount != 1:
+                db.rollback()
+                return None
+            db.commit()
+            return db.scalar(
+                select(FlowBatchJob.user_prompt).where(FlowBatchJob.job_key == job_key)
+            )
+
+    def _complete_job(
+        self,
+        job_key: str,
+        user_prompt: str,
+        drawio: str,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """生成結果をジョブ専用セッションのFlowRequestとして保存し、ジョブを完了にします。"""
+        with self._session_factory()() as db:
+            job = db.scalar(select(FlowBatchJob).where(FlowBatchJob.job_key == job_key))
+            if job is None:
+                return
+            flow_session = get_or_create_flow_session(
+                db, f"{BATCH_SESSION_PREFIX}{job_key}", job.user_label
+            )
+            flow_request = add_flow_request(
+                db, flow_session, user_prompt, drawio, is_initial=True, usage=usage
+            )
+            job.request_id = flow_request.id
+            job.status = JOB_STATUS_SUCCEEDED
+            job.error = None
+            job.finished_at = func.now()
+            db.commit()
+
+    def _fail_job(self, job_key: str, error: str) -> None:
+        """ジョブを失敗状態にし、エラー内容を記録します。"""
+        with self._session_factory()() as db:
+            db.execute(
+                update(FlowBatchJob)
+                .where(FlowBatchJob.job_key == job_key)
+                .values(status=JOB_STATUS_FAILED, error=error, finished_at=func.now())
+            )
+            db.commit()
+
+    def _fetch_job(self, job_key: str, include_result: bool) -> Optional[Dict[str, Any]]:
+        """ジョブを読み込み、レスポンス用の辞書へ変換します。"""
+        with self._session_factory()() as db:
+            job = db.scalar(select(FlowBatchJob).where(FlowBatchJob.job_key == job_key))
+            if job is None:
+                return None
+            data = _serialize_job(job)
+            if include_result:
+                data["drawio"] = job.request.drawio_xml if job.request else None
+            return data
+
+
+def _serialize_job(job: FlowBatchJob) -> Dict[str, Any]:
+    """FlowBatchJobをAPIレスポンス用の辞書へ変換します。
+
+    Args:
+        job: 変換対象のジョブ。
+
+    Returns:
+        Dict[str, Any]: camelCaseキーのジョブ情報。
+    """
+    return {
+        "jobId": job.job_key,
+        "status": job.status,
+        "userLabel": job.user_label,
+        "requestId": job.request_id,
+        "error": job.error,
+        "createdAt": _isoformat(job.created_at),
+        "startedAt": _isoformat(job.started_at),
+        "finishedAt": _isoformat(job.finished_at),
+    }
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    """日時をISO8601文字列へ変換します。未設定やSQL式の場合はNoneを返します。"""
+    return value.isoformat() if hasattr(value, "isoformat") else None
+
+
+def set_batch_job_queue_singleton(queue: BatchJobQueue) -> None:
+    """create_appで生成したBatchJobQueueインスタンスを共有レジストリに登録。"""
+    global _BATCH_JOB_QUEUE_SINGLETON
+    _BATCH_JOB_QUEUE_SINGLETON = queue
+
+
+def get_batch_job_queue_singleton() -> Optional[BatchJobQueue]:
+    """登録済みのBatchJobQueueを返却する。未登録の場合はNone。"""
+    return _BATCH_JOB_QUEUE_SINGLETON
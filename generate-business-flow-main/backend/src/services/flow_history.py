@@ -0,0 +1,135 @@
+"""Persistence of interactive flow generations as FlowRequest rows."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.db.repository import add_flow_request, get_or_create_flow_session
+from src.db.session import get_session_factory
+from src.services.session_manager import extract_drawio
+
+LOGGER = logging.getLogger("services.flow_history")
+_FLOW_HISTORY_RECORDER_SINGLETON: Optional["FlowHistoryRecorder"] = None
+
+COMPLETE_EVENT_PREFIX = b'{"type": "complete"'
+
+
+class FlowHistoryRecorder:
+    """対話的な生成（PUT /sessions/{session_id}/flows）の結果をFlowRequestとして保存します。
+
+    一括生成ジョブと同じく、completeイベントのusageと抽出したdrawioを1行にまとめ、
+    `GET /sessions/{session_id}/requests` の履歴に載せます。保存に失敗してもストリームは止めません。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        session_factory: Callable[[], sessionmaker[Session]] = get_session_factory,
+    ) -> None:
+        """保存の有効・無効とDBセッションファクトリを受け取り初期化します。
+
+        Args:
+            enabled: Falseの場合はストリームをそのまま返し、何も保存しません。
+            session_factory: DBセッションファクトリを返す関数。
+        """
+        self.enabled = enabled
+        self._session_factory = session_factory
+
+    def record_stream(
+        self,
+        stream: AsyncIterator[bytes],
+        session_id: str,
+        user_prompt: str,
+        is_initial: bool,
+    ) -> AsyncIterator[bytes]:
+        """ストリームを透過的に流し、completeイベントを受け取った時点で履歴を保存します。
+
+        Args:
+            stream: 1行1イベントのNDJSONストリーム。
+            session_id: 生成したセッションID（FlowSession.session_key）。
+            user_prompt: 添付を展開する前のユーザープロンプト。
+            is_initial: セッションの初回生成かどうか。
+
+        Returns:
+            AsyncIterator[bytes]: 元と同じチャンクを流すストリーム。無効時は元のストリーム。
+        """
+        if not self.enabled:
+            return stream
+        return self._record_on_complete(stream, session_id, user_prompt, is_initial)
+
+    async def _record_on_complete(
+        self,
+        stream: AsyncIterator[bytes],
+        session_id: str,
+        user_prompt: str,
+        is_initial: bool,
+    ) -> AsyncGenerator[bytes, None]:
+        async for chunk in stream:
+            # 全チャンクをパースしないよう、completeイベントだけを先頭の一致で見分ける
+            if chunk.startswith(COMPLETE_EVENT_PREFIX):
+                event = json.loads(chunk)
+                await self.record(
+                    session_id,
+                    user_prompt,
+                    event.get("fullContent") or "",
+                    event.get("usage"),
+                    is_initial,
+                )
+            yield chunk
+
+    async def record(
+        self,
+        session_id: str,
+        user_prompt: str,
+        content: str,
+        usage: Optional[Dict[str, Any]],
+        is_initial: bool,
+    ) -> None:
+        """生成結果を1件のFlowRequestとして保存します。
+
+        Args:
+            session_id: 生成したセッションID。
+            user_prompt: ユーザープロンプト。
+            content: LLMが返した全文。drawioを抽出できない場合はdrawioなしで保存します。
+            usage: completeイベントのusage。
+            is_initial: セッションの初回生成かどうか。
+        """
+        try:
+            await asyncio.to_thread(
+                self._insert, session_id, user_prompt, extract_drawio(content), usage, is_initial
+            )
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Failed to record flow request for session %s", session_id)
+
+    def _insert(
+        self,
+        session_id: str,
+        user_prompt: str,
+        drawio: Optional[str],
+        usage: Optional[Dict[str, Any]],
+        is_initial: bool,
+    ) -> None:
+        """FlowSessionを取得または作成し、FlowRequestを追加します。"""
+        with self._session_factory()() as db:
+            flow_session = get_or_create_flow_session(db, session_id)
+            add_flow_request(db, flow_session, user_prompt, drawio, is_initial, usage=usage)
+            db.commit()
+
+
+def set_flow_history_recorder_singleton(recorder: FlowHistoryRecorder) -> None:
+    """create_appで生成したFlowHistoryRecorderインスタンスを共有レジストリに登録。"""
+    global _FLOW_HISTORY_RECORDER_SINGLETON
+    _FLOW_HISTORY_RECORDER_SINGLETON = recorder
+
+
+def get_flow_history_recorder_singleton() -> FlowHistoryRecorder:
+    """登録済みのFlowHistoryRecorderを返却し、未登録なら新規生成する。"""
+    global _FLOW_HISTORY_RECORDER_SINGLETON
+    if _FLOW_HISTORY_RECORDER_SINGLETON is None:
+        _FLOW_HISTORY_RECORDER_SINGLETON = FlowHistoryRecorder()
+    return _FLOW_HISTORY_RECORDER_SINGLETON
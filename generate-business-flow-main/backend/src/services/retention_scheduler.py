@@ -0,0 +1,72 @@
+"""In-process scheduler for the flow request retention job."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from src.db.retention import archive_expired_requests
+
+LOGGER = logging.getLogger("services.retention_scheduler")
+
+
+class RetentionScheduler:
+    """一定間隔でリテンション処理をワーカースレッドで実行します。"""
+
+    def __init__(
+        self,
+        older_than_days: int,
+        interval_seconds: float,
+        batch_size: int,
+        pause_seconds: float = 0.05,
+    ) -> None:
+        """実行間隔と移動条件を受け取り初期化します。
+
+        Args:
+            older_than_days: 保持日数。
+            interval_seconds: 実行間隔（秒）。
+            batch_size: 1バッチで移動する行数。
+            pause_seconds: バッチ間の待機秒数。
+        """
+        self.older_than = timedelta(days=older_than_days)
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def start(self) -> None:
+        """定期実行タスクを起動します。"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            LOGGER.info(
+                "Retention scheduler started: older_than=%s interval=%ss",
+                self.older_than,
+                self.interval_seconds,
+            )
+
+    async def stop(self) -> None:
+        """定期実行タスクを停止します。実行中のバッチはコミット済みの分まで反映されます。"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def run_once(self) -> None:
+        """リテンション処理を1回実行し、結果をログへ出力します。"""
+        report = await asyncio.to_thread(
+            archive_expired_requests,
+            self.older_than,
+            batch_size=self.batch_size,
+            pause_seconds=self.pause_seconds,
+        )
+        LOGGER.info("Retention finished: %s", report.summary())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Retention job failed")
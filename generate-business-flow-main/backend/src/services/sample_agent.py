@@ -1,12 +1,17 @@
+import asyncio
 import operator
 import json
-from typing import Annotated, Literal, Sequence, TypedDict
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Annotated, Any, Callable, Literal, Sequence, TypedDict
 
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langgraph.constants import Send
 from langgraph.graph import END, START, StateGraph
 from langgraph.pregel import Pregel
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from openai.types.chat import ChatCompletionMessageParam
 
 from src.configs import Settings
@@ -19,19 +24,68 @@ from src.models import (
     Subtask,
     ToolResult,
 )
+from src.observability.usage import estimate_tokens
 from src.prompts import HelpDeskAgentPrompts
 
 MAX_CHALLENGE_COUNT = 3
+MAX_CONCURRENT_SUBTASKS = 4
+MAX_TOOL_WORKERS = 8
+TOOL_TIMEOUT_SECONDS = 30.0
+HISTORY_TOKEN_BUDGET = 6000
 
 logger = setup_logger(__file__)
 
 
+def _estimate_tokens(messages: list) -> int:
+    # 本文はアプリ共通の概算を使い、メッセージごとのオーバーヘッドとして1トークンを加える
+    return sum(estimate_tokens(str(message.get("content") or "")) + 1 for message in messages)
+
+
+class ToolCallCache:
+    """1回のrun_agent実行内で同一の(tool, args)呼び出しを共有するキャッシュ
+
+    実行中の呼び出しもFuture/Taskとして保持するため、並行するサブタスクから
+    同じ呼び出しが来た場合も実行は1回になる。失敗した呼び出しはキャッシュしない。
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tool_name: str, tool_args: str) -> tuple[str, str]:
+        # 引数はJSON文字列なので、キー順や空白の違いを吸収して比較する
+        try:
+            normalized = json.dumps(json.loads(tool_args), sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            normalized = str(tool_args)
+        return tool_name, normalized
+
+    def get_or_start(self, key: tuple[str, str], start: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = start()
+                self._entries[key] = entry
+                entry.add_done_callback(partial(self._discard_failed, key))
+            else:
+                logger.info(f"Tool call cache hit: {key[0]}")
+            return entry
+
+    def _discard_failed(self, key: tuple[str, str], entry: Any) -> None:
+        if entry.cancelled() or entry.exception() is not None:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+
+
 class AgentState(TypedDict):
     question: str
     plan: list[str]
     current_step: int
     subtask_results: Annotated[Sequence[Subtask], operator.add]
     last_answer: str
+    tool_cache: ToolCallCache
 
 
 class AgentSubGraphState(TypedDict):
@@ -44,6 +98,7 @@ class AgentSubGraphState(TypedDict):
     tool_results: Annotated[Sequence[Sequence[SearchOutput]], operator.add]
     reflection_results: Annotated[Sequence[ReflectionResult], operator.add]
     subtask_answer: str
+    tool_cache: ToolCallCache
 
 
 class HelpDeskAgent:
@@ -52,12 +107,23 @@ class HelpDeskAgent:
         settings: Settings,
         tools: list = [],
         prompts: HelpDeskAgentPrompts = HelpDeskAgentPrompts(),
+        tool_timeout: float = TOOL_TIMEOUT_SECONDS,
+        tool_timeouts: dict[str, float] = {},
+        history_token_budget: int = HISTORY_TOKEN_BUDGET,
     ) -> None:
         self.settings = settings
         self.tools = tools
         self.tool_map = {tool.name: tool for tool in tools}
         self.prompts = prompts
         self.client = OpenAI(api_key=self.settings.openai_api_key)
+        # ツールごとのタイムアウト（秒）。未指定のツールはtool_timeoutを使う
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = dict(tool_timeouts)
+        self.tool_executor = ThreadPoolExecutor(
+            max_workers=MAX_TOOL_WORKERS, thread_name_prefix="helpdesk-tool"
+        )
+        # リトライ時にサブタスクごとに送信するメッセージの概算トークン上限
+        self.history_token_budget = history_token_budget
 
     def create_plan(self, state: AgentState) -> dict:
         """計画を作成する
@@ -70,24 +136,7 @@ class HelpDeskAgent:
         """
 
         logger.info("🚀 Starting plan generation process...")
-
-        # tool定義を渡しシステムプロンプトを生成
-        system_prompt = self.prompts.planner_system_prompt
-
-        # ユーザーの質問を渡しユーザープロンプトを生成
-        user_prompt = self.prompts.planner_user_prompt.format(
-            question=state["question"],
-        )
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        # logger.info(f"Final prompt messages: {messages}", json.dumps(messages, indent=2, ensure_ascii=False))
-        logger.info(
-            "INFO Final prompt messages:\n%s",
-            json.dumps(messages, indent=2, ensure_ascii=False)
-        )
-
+        messages = self._build_plan_messages(state)
 
         # OpenAIにリクエストを送信
         try:
@@ -112,6 +161,34 @@ class HelpDeskAgent:
         # 生成した計画を返し、状態を更新する
         return {"plan": plan.subtasks}
 
+    def _build_plan_messages(self, state: AgentState) -> list:
+        """計画作成用のメッセージを組み立てる
+
+        Args:
+            state (AgentState): 入力の状態
+
+        Returns:
+            list: OpenAIへ送信するメッセージ
+        """
+
+        # tool定義を渡しシステムプロンプトを生成
+        system_prompt = self.prompts.planner_system_prompt
+
+        # ユーザーの質問を渡しユーザープロンプトを生成
+        user_prompt = self.prompts.planner_user_prompt.format(
+            question=state["question"],
+        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        # logger.info(f"Final prompt messages: {messages}", json.dumps(messages, indent=2, ensure_ascii=False))
+        logger.info(
+            "INFO Final prompt messages:\n%s",
+            json.dumps(messages, indent=2, ensure_ascii=False)
+        )
+        return messages
+
     def select_tools(self, state: AgentSubGraphState) -> dict:
         """ツールを選択する
 
@@ -127,73 +204,7 @@ class HelpDeskAgent:
         # OpenAI対応のtool定義に書き換える
         logger.info("Converting tools for OpenAI format...")
         openai_tools = [convert_to_openai_tool(tool) for tool in self.tools] # メモ：tool群はおおもとのインスタンス化時に注入
-
-        # リトライされたかどうかでプロンプトを切り替える
-        if state["challenge_count"] == 0:
-            logger.info("Creating user prompt for tool selection...")
-            user_prompt = self.prompts.subtask_tool_selection_user_prompt.format(
-                # メモ：プロンプトを組み立てるときのインターフェースはこれ
-                question=state["question"], # おおもとの質問も渡している！
-                plan=state["plan"], 
-                subtask=state["subtask"],
-            )
-
-            messages = [
-                {"role": "system", "content": self.prompts.subtask_system_prompt},
-                {"role": "user", "content": user_prompt},
-                # user_prompt
-                    # SUBTASK_TOOL_EXECUTION_USER_PROMPT = """
-                    # ユーザーの元の質問: {question}
-                    # 回答のための計画: {plan}
-                    # サブタスク: {subtask}
-
-                    # サブタスク実行を開始します。
-                    # 1.ツール選択・実行, 2サブタスク回答を実行してください
-                    # """
-
-                # SUBTASK_SYSTEM_PROMPT = """
-                #     あなたはXYZというシステムの質問応答のためにサブタスク実行を担当するエージェントです。
-                #     回答までの全体の流れは計画立案 → サブタスク実行 [ツール実行 → サブタスク回答 → リフレクション] → 最終回答となります。
-                #     サブタスクはユーザーの質問に回答するために考えられた計画の一つです。
-                #     最終的な回答は全てのサブタスクの結果を組み合わせて別エージェントが作成します。
-                #     あなたは以下の1~3のステップを指示に従ってそれぞれ実行します。各ステップは指示があったら実行し、同時に複数ステップの実行は行わないでください。
-                #     なおリフレクションの結果次第で所定の回数までツール選択・実行を繰り返します。
-
-                #     1. ツール選択・実行
-                #     サブタスク回答のためのツール選択と選択されたツールの実行を行います。
-                #     2回目以降はリフレクションのアドバイスに従って再実行してください。
-
-                #     2. サブタスク回答
-                #     ツールの実行結果はあなたしか観測できません。
-                #     ツールの実行結果から得られた回答に必要なことは言語化し、最後の回答用エージェントに引き継げるようにしてください。
-                #     例えば、概要を知るサブタスクならば、ツールの実行結果から概要を言語化してください。
-                #     手順を知るサブタスクならば、ツールの実行結果から手順を言語化してください。
-                #     回答できなかった場合は、その旨を言語化してください。
-
-                #     3. リフレクション
-                #     ツールの実行結果と回答から、サブタスクに対して正しく回答できているかを評価します。
-                #     回答がわからない、情報が見つからないといった内容の場合は評価をNGにし、やり直すようにしてください。
-                #     評価がNGの場合は、別のツールを試す、別の文言でツールを試すなど、なぜNGなのかとどうしたら改善できるかを考えアドバイスを作成してください。
-                #     アドバイスの内容は過去のアドバイスと計画内の他のサブタスクと重複しないようにしてください。
-                #     アドバイスの内容をもとにツール選択・実行からやり直します。
-                #     評価がOKの場合は、サブタスク回答を終了します。
-
-                #     """
-            ]
-
-        else:
-            logger.info("Creating user prompt for tool retry...")
-
-            # リトライされた場合は過去の対話情報にプロンプトを追加する
-            messages: list = state["messages"]
-
-            # NOTE: トークン数節約のため過去の検索結果は除く
-            # roleがtoolまたはtool_callsを持つものは除く
-            messages = [message for message in messages if message["role"] != "tool" or "tool_calls" not in message]
-
-            user_retry_prompt = self.prompts.subtask_retry_answer_user_prompt
-            user_message = {"role": "user", "content": user_retry_prompt}
-            messages.append(user_message)
+        messages = self._build_tool_selection_messages(state)
 
         try:
             logger.info("Sending request to OpenAI...")
@@ -211,6 +222,143 @@ class HelpDeskAgent:
             logger.error(f"Error during OpenAI request: {e}")
             raise
 
+        return self._build_tool_selection_update(messages, response)
+
+    def _build_tool_selection_messages(self, state: AgentSubGraphState) -> list:
+        """ツール選択用のメッセージを組み立てる
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+
+        Returns:
+            list: OpenAIへ送信するメッセージ
+        """
+
+        # 初回・リトライとも、システムプロンプトとサブタスクの指示から組み立てる
+        user_prompt = self.prompts.subtask_tool_selection_user_prompt.format(
+            # メモ：プロンプトを組み立てるときのインターフェースはこれ
+            question=state["question"], # おおもとの質問も渡している！
+            plan=state["plan"],
+            subtask=state["subtask"],
+        )
+
+        messages = [
+            {"role": "system", "content": self.prompts.subtask_system_prompt},
+            {"role": "user", "content": user_prompt},
+            # user_prompt
+                # SUBTASK_TOOL_EXECUTION_USER_PROMPT = """
+                # ユーザーの元の質問: {question}
+                # 回答のための計画: {plan}
+                # サブタスク: {subtask}
+
+                # サブタスク実行を開始します。
+                # 1.ツール選択・実行, 2サブタスク回答を実行してください
+                # """
+
+            # SUBTASK_SYSTEM_PROMPT = """
+            #     あなたはXYZというシステムの質問応答のためにサブタスク実行を担当するエージェントです。
+            #     回答までの全体の流れは計画立案 → サブタスク実行 [ツール実行 → サブタスク回答 → リフレクション] → 最終回答となります。
+            #     サブタスクはユーザーの質問に回答するために考えられた計画の一つです。
+            #     最終的な回答は全てのサブタスクの結果を組み合わせて別エージェントが作成します。
+            #     あなたは以下の1~3のステップを指示に従ってそれぞれ実行します。各ステップは指示があったら実行し、同時に複数ステップの実行は行わないでください。
+            #     なおリフレクションの結果次第で所定の回数までツール選択・実行を繰り返します。
+
+            #     1. ツール選択・実行
+            #     サブタスク回答のためのツール選択と選択されたツールの実行を行います。
+            #     2回目以降はリフレクションのアドバイスに従って再実行してください。
+
+            #     2. サブタスク回答
+            #     ツールの実行結果はあなたしか観測できません。
+            #     ツールの実行結果から得られた回答に必要なことは言語化し、最後の回答用エージェントに引き継げるようにしてください。
+            #     例えば、概要を知るサブタスクならば、ツールの実行結果から概要を言語化してください。
+            #     手順を知るサブタスクならば、ツールの実行結果から手順を言語化してください。
+            #     回答できなかった場合は、その旨を言語化してください。
+
+            #     3. リフレクション
+            #     ツールの実行結果と回答から、サブタスクに対して正しく回答できているかを評価します。
+            #     回答がわからない、情報が見つからないといった内容の場合は評価をNGにし、やり直すようにしてください。
+            #     評価がNGの場合は、別のツールを試す、別の文言でツールを試すなど、なぜNGなのかとどうしたら改善できるかを考えアドバイスを作成してください。
+            #     アドバイスの内容は過去のアドバイスと計画内の他のサブタスクと重複しないようにしてください。
+            #     アドバイスの内容をもとにツール選択・実行からやり直します。
+            #     評価がOKの場合は、サブタスク回答を終了します。
+
+            #     """
+        ]
+
+        # リトライされたかどうかでプロンプトを切り替える
+        if state["challenge_count"] == 0:
+            logger.info("Creating user prompt for tool selection...")
+        else:
+            logger.info("Creating user prompt for tool retry...")
+
+            # NOTE: 過去の対話をそのまま積むとリトライごとにプロンプトが伸びるため、
+            # 生のツール結果は捨て、要約済みのサブタスク回答とリフレクションのアドバイスだけを残す
+            user_retry_prompt = self.prompts.subtask_retry_answer_user_prompt
+            user_message = {"role": "user", "content": user_retry_prompt}
+            messages.extend(self._compact_history(state, messages + [user_message]))
+            messages.append(user_message)
+
+        return messages
+
+    def _compact_history(self, state: AgentSubGraphState, fixed_messages: list) -> list:
+        """リトライ用に過去の試行を圧縮したメッセージを作成する
+
+        ツール結果はサブタスク回答として要約済みのため直前の回答のみを残し、
+        リフレクションはアドバイスのみを残す。history_token_budgetを超えないよう
+        回答は予算の半分までに切り詰め、アドバイスは古いものから削る。
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+            fixed_messages (list): 圧縮対象外で必ず送信するメッセージ
+
+        Returns:
+            list: 圧縮した過去の試行のメッセージ
+        """
+
+        budget = self.history_token_budget - _estimate_tokens(fixed_messages)
+
+        history = []
+        previous_answer = state.get("subtask_answer")
+        if previous_answer:
+            # 直前の回答は予算の半分までに収め、残りをアドバイスに充てる
+            answer_budget = max(budget // 2, 0)
+            prefix = "前回のサブタスク回答: "
+            suffix = "…(省略)"
+            content = prefix + previous_answer
+            if _estimate_tokens([{"content": content}]) > answer_budget:
+                keep = max(answer_budget - len(prefix) - len(suffix) - 1, 0)
+                content = prefix + previous_answer[:keep] + suffix
+            history.append({"role": "assistant", "content": content})
+
+        advices = [
+            {"role": "assistant", "content": f"リフレクション{index}回目のアドバイス: {result.advice}"}
+            for index, result in enumerate(state.get("reflection_results", []), start=1)
+            if result.advice
+        ]
+        while advices and _estimate_tokens(history + advices) > budget:
+            advices.pop(0)
+
+        history.extend(advices)
+        logger.info(
+            f"Compacted history: {len(state.get('messages', []))} messages -> {len(history)} "
+            f"(~{_estimate_tokens(fixed_messages + history)} tokens, budget {self.history_token_budget})"
+        )
+        return history
+
+    def _build_tool_selection_update(self, messages: list, response) -> dict:
+        """ツール選択のレスポンスから状態の更新分を作成する
+
+        Args:
+            messages (list): 送信したメッセージ
+            response: OpenAIのレスポンス
+
+        Raises:
+            ValueError: tool callsがNoneの場合
+
+        Returns:
+            dict: 更新された状態
+        """
+
         if response.choices[0].message.tool_calls is None:
             raise ValueError("Tool calls are None")
 
@@ -240,24 +388,104 @@ class HelpDeskAgent:
 
         logger.info("🚀 Starting tool execution process...")
         messages = state["messages"]
+        tool_calls = self._get_tool_calls(messages)
+        tool_cache = state.get("tool_cache") or ToolCallCache()
 
-        # 最後のメッセージからツールの呼び出しを取得
-        tool_calls = messages[-1]["tool_calls"]
+        # 独立したツール呼び出しはスレッドプールで同時に実行する
+        futures: list[Future] = []
+        timeouts: list[float] = []
+        deadlines: list[float] = []
+        for tool_call in tool_calls:
+            tool_name = tool_call["function"]["name"]
+            tool_args = tool_call["function"]["arguments"]
+            tool = self.tool_map[tool_name]
+            futures.append(
+                tool_cache.get_or_start(
+                    ToolCallCache.make_key(tool_name, tool_args),
+                    partial(self.tool_executor.submit, self._invoke_tool, tool, tool_args),
+                )
+            )
+            # 期限は投入時点で確定させ、先に待った呼び出しの待ち時間を後の呼び出しに加算しない
+            timeouts.append(self._get_tool_timeout(tool_name))
+            deadlines.append(time.monotonic() + timeouts[-1])
 
-        # 最後のメッセージからツールの呼び出しか確認
-        if tool_calls is None:
-            logger.error("Tool calls are None")
-            logger.error(f"Messages: {messages}")
-            raise ValueError("Tool calls are None")
+        outputs = self._wait_tool_outputs(futures, timeouts, deadlines)
+        return self._build_tool_execution_update(messages, tool_calls, outputs)
+
+    @staticmethod
+    def _wait_tool_outputs(
+        futures: list[Future], timeouts: list[float], deadlines: list[float]
+    ) -> list:
+        """投入時に記録した期限までにツールの結果を待つ
+
+        すべての呼び出しをまとめて待つため、待ち時間の合計は最も長いタイムアウトで頭打ちになる。
+
+        Args:
+            futures (list[Future]): ツール呼び出しのFuture
+            timeouts (list[float]): 各呼び出しのタイムアウト（秒）
+            deadlines (list[float]): 各呼び出しの期限（time.monotonic基準）
+
+        Returns:
+            list: 各呼び出しの結果。期限を過ぎた呼び出しはTimeoutError
+        """
+
+        outputs: list = [None] * len(futures)
+        pending = dict(enumerate(futures))
+        while pending:
+            for index, future in list(pending.items()):
+                if future.done():
+                    outputs[index] = future.result()
+                    del pending[index]
+                elif deadlines[index] <= time.monotonic():
+                    outputs[index] = TimeoutError(timeouts[index])
+                    del pending[index]
+            if pending:
+                next_deadline = min(deadlines[index] for index in pending)
+                wait(
+                    set(pending.values()),
+                    timeout=max(0.0, next_deadline - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+        return outputs
+
+    @staticmethod
+    def _invoke_tool(tool, tool_args: str):
+        # 非同期のみのツールはワーカースレッド上で専用のイベントループを回して実行する
+        if getattr(tool, "func", None) is None and getattr(tool, "coroutine", None) is not None:
+            return asyncio.run(tool.ainvoke(tool_args))
+        return tool.invoke(tool_args)
+
+    def _get_tool_timeout(self, tool_name: str) -> float:
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    def _build_tool_execution_update(self, messages: list, tool_calls: list, outputs: list) -> dict:
+        """ツールの実行結果から状態の更新分を作成する
+
+        結果はtool_callsの順に並べ、tool_call_idとの対応を保つ。
+        タイムアウトしたツールは空の結果として扱い、その旨をtoolメッセージで伝える。
+
+        Args:
+            messages (list): サブタスクのメッセージ
+            tool_calls (list): ツールの呼び出し
+            outputs (list): 各呼び出しの結果。タイムアウト時はTimeoutError
+
+        Returns:
+            dict: 更新された状態
+        """
 
         tool_results = []
 
-        for tool_call in tool_calls:
+        for tool_call, output in zip(tool_calls, outputs):
             tool_name = tool_call["function"]["name"]
             tool_args = tool_call["function"]["arguments"]
 
-            tool = self.tool_map[tool_name]
-            tool_result: list[SearchOutput] = tool.invoke(tool_args)
+            if isinstance(output, TimeoutError):
+                logger.warning(f"Tool {tool_name} timed out after {output.args[0]}s")
+                tool_result: list[SearchOutput] = []
+                content = f"ツール{tool_name}の実行が{output.args[0]}秒でタイムアウトしました。"
+            else:
+                tool_result = output
+                content = str(tool_result)
 
             tool_results.append(
                 ToolResult(
@@ -270,13 +498,37 @@ class HelpDeskAgent:
             messages.append(
                 {
                     "role": "tool",
-                    "content": str(tool_result),
+                    "content": content,
                     "tool_call_id": tool_call["id"],
                 }
             )
         logger.info("Tool execution complete!")
         return {"messages": messages, "tool_results": [tool_results]}
 
+    def _get_tool_calls(self, messages: list) -> list:
+        """最後のメッセージからツールの呼び出しを取得する
+
+        Args:
+            messages (list): サブタスクのメッセージ
+
+        Raises:
+            ValueError: tool callsがNoneの場合
+
+        Returns:
+            list: ツールの呼び出し
+        """
+
+        # 最後のメッセージからツールの呼び出しを取得
+        tool_calls = messages[-1]["tool_calls"]
+
+        # 最後のメッセージからツールの呼び出しか確認
+        if tool_calls is None:
+            logger.error("Tool calls are None")
+            logger.error(f"Messages: {messages}")
+            raise ValueError("Tool calls are None")
+
+        return tool_calls
+
     def create_subtask_answer(self, state: AgentSubGraphState) -> dict:
         """サブタスク回答を作成する
 
@@ -303,6 +555,19 @@ class HelpDeskAgent:
             logger.error(f"Error during OpenAI request: {e}")
             raise
 
+        return self._build_subtask_answer_update(messages, response)
+
+    def _build_subtask_answer_update(self, messages: list, response) -> dict:
+        """サブタスク回答のレスポンスから状態の更新分を作成する
+
+        Args:
+            messages (list): 送信したメッセージ
+            response: OpenAIのレスポンス
+
+        Returns:
+            dict: 更新された状態
+        """
+
         subtask_answer = response.choices[0].message.content
 
         ai_message = {"role": "assistant", "content": subtask_answer}
@@ -349,6 +614,23 @@ class HelpDeskAgent:
             logger.error(f"Error during OpenAI request: {e}")
             raise
 
+        return self._build_reflection_update(state, messages, response)
+
+    def _build_reflection_update(self, state: AgentSubGraphState, messages: list, response) -> dict:
+        """内省のレスポンスから状態の更新分を作成する
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+            messages (list): 送信したメッセージ
+            response: OpenAIのレスポンス
+
+        Raises:
+            ValueError: reflection resultがNoneの場合
+
+        Returns:
+            dict: 更新された状態
+        """
+
         reflection_result = response.choices[0].message.parsed
         if reflection_result is None:
             raise ValueError("Reflection result is None")
@@ -384,19 +666,7 @@ class HelpDeskAgent:
         """
 
         logger.info("🚀 Starting final answer creation process...")
-        system_prompt = self.prompts.create_last_answer_system_prompt
-
-        # サブタスク結果のうちタスク内容と回答のみを取得
-        subtask_results = [(result.task_name, result.subtask_answer) for result in state["subtask_results"]]
-        user_prompt = self.prompts.create_last_answer_user_prompt.format(
-            question=state["question"],
-            plan=state["plan"],
-            subtask_results=str(subtask_results),
-        )
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
+        messages = self._build_answer_messages(state)
 
         try:
             logger.info("Sending request to OpenAI...")
@@ -415,9 +685,37 @@ class HelpDeskAgent:
 
         return {"last_answer": response.choices[0].message.content}
 
+    def _build_answer_messages(self, state: AgentState) -> list:
+        """最終回答用のメッセージを組み立てる
+
+        Args:
+            state (AgentState): 入力の状態
+
+        Returns:
+            list: OpenAIへ送信するメッセージ
+        """
+
+        system_prompt = self.prompts.create_last_answer_system_prompt
+
+        # サブタスク結果のうちタスク内容と回答のみを取得
+        subtask_results = [(result.task_name, result.subtask_answer) for result in state["subtask_results"]]
+        user_prompt = self.prompts.create_last_answer_user_prompt.format(
+            question=state["question"],
+            plan=state["plan"],
+            subtask_results=str(subtask_results),
+        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        return messages
+
     def _execute_subgraph(self, state: AgentState):
         subgraph = self._create_subgraph()
+        result = subgraph.invoke(self._build_subgraph_input(state))
+        return {"subtask_results": [self._build_subtask_result(result)]}
 
+    def _build_subgraph_input(self, state: AgentState) -> dict:
         dict_input =  {
             "question": state["question"],# 親グラフのquestionをそのまま
             "plan": state["plan"], # 親グラフのplanをそのままもってきた形
@@ -431,12 +729,12 @@ class HelpDeskAgent:
             "INFO Final prompt messages:\n%s",
             json.dumps(dict_input, indent=2, ensure_ascii=False)
         )
+        # ツール呼び出しのキャッシュはrun_agent単位で全サブタスクに共有する
+        dict_input["tool_cache"] = state.get("tool_cache") or ToolCallCache()
+        return dict_input
 
-        result = subgraph.invoke(dict_input)
-        
-
-
-        subtask_result = Subtask(
+    def _build_subtask_result(self, result: dict) -> Subtask:
+        return Subtask(
             task_name=result["subtask"],
             tool_results=result["tool_results"],
             reflection_results=result["reflection_results"],
@@ -445,8 +743,6 @@ class HelpDeskAgent:
             challenge_count=result["challenge_count"],
         )
 
-        return {"subtask_results": [subtask_result]}
-
     def _should_continue_exec_subtasks(self, state: AgentState) -> list:
         return [
             Send(
@@ -455,6 +751,7 @@ class HelpDeskAgent:
                     "question": state["question"],
                     "plan": state["plan"],
                     "current_step": idx,
+                    "tool_cache": state.get("tool_cache"),
                 },
             )
             for idx, _ in enumerate(state["plan"])
@@ -469,22 +766,37 @@ class HelpDeskAgent:
     def _create_subgraph(self) -> Pregel:
         """サブグラフを作成する
 
+        Returns:
+            Pregel: サブグラフ
+        """
+        return self._compile_subgraph(
+            self.select_tools,
+            self.execute_tools,
+            self.create_subtask_answer,
+            self.reflect_subtask,
+        )
+
+    def _compile_subgraph(
+        self, select_tools, execute_tools, create_subtask_answer, reflect_subtask
+    ) -> Pregel:
+        """各ノードの実装を受け取りサブグラフをコンパイルする
+
         Returns:
             Pregel: サブグラフ
         """
         workflow = StateGraph(AgentSubGraphState)
 
         # ツール選択ノードを追加
-        workflow.add_node("select_tools", self.select_tools)
+        workflow.add_node("select_tools", select_tools)
 
         # ツール実行ノードを追加
-        workflow.add_node("execute_tools", self.execute_tools)
+        workflow.add_node("execute_tools", execute_tools)
 
         # サブタスク回答作成ノードを追加
-        workflow.add_node("create_subtask_answer", self.create_subtask_answer)
+        workflow.add_node("create_subtask_answer", create_subtask_answer)
 
         # サブタスク内省ノードを追加
-        workflow.add_node("reflect_subtask", self.reflect_subtask)
+        workflow.add_node("reflect_subtask", reflect_subtask)
 
         # ツール選択からスタート
         workflow.add_edge(START, "select_tools")
@@ -508,18 +820,26 @@ class HelpDeskAgent:
     def create_graph(self) -> Pregel:
         """エージェントのメイングラフを作成する
 
+        Returns:
+            Pregel: エージェントのメイングラフ
+        """
+        return self._compile_graph(self.create_plan, self._execute_subgraph, self.create_answer)
+
+    def _compile_graph(self, create_plan, execute_subtasks, create_answer) -> Pregel:
+        """各ノードの実装を受け取りメイングラフをコンパイルする
+
         Returns:
             Pregel: エージェントのメイングラフ
         """
         workflow = StateGraph(AgentState)
 
         # Add the plan node
-        workflow.add_node("create_plan", self.create_plan) # AgentState全体を返してもよいし、追記したい部分のみを描いてもよいらしい
+        workflow.add_node("create_plan", create_plan) # AgentState全体を返してもよいし、追記したい部分のみを描いてもよいらしい
 
         # Add the execution step
-        workflow.add_node("execute_subtasks", self._execute_subgraph)
+        workflow.add_node("execute_subtasks", execute_subtasks)
 
-        workflow.add_node("create_answer", self.create_answer)
+        workflow.add_node("create_answer", create_answer)
 
         workflow.add_edge(START, "create_plan")
 
@@ -538,6 +858,13 @@ class HelpDeskAgent:
 
         return app
 
+    def close(self) -> None:
+        """ツール実行用のスレッドプールを停止する
+
+        実行中のツールは完了を待たずに、未開始の呼び出しは取り消して停止する。
+        """
+        self.tool_executor.shutdown(wait=False, cancel_futures=True)
+
     def run_agent(self, question: str) -> AgentResult:
         """エージェントを実行する
 
@@ -553,11 +880,286 @@ class HelpDeskAgent:
             {
                 "question": question, # 問い合わせ内容そのもの（UIに入力されたユーザークエリ）
                 "current_step": 0,
+                "tool_cache": ToolCallCache(),
             }
         )
+        return self._build_agent_result(question, result)
+
+    def _build_agent_result(self, question: str, result: dict) -> AgentResult:
         return AgentResult(
             question=question,
             plan=Plan(subtasks=result["plan"]),
             subtasks=result["subtask_results"],
             answer=result["last_answer"],
         )
+
+
+class AsyncHelpDeskAgent(HelpDeskAgent):
+    """HelpDeskAgentの非同期版
+
+    AsyncOpenAIとainvokeを利用し、イベントループをブロックせずに実行する。
+    計画内のサブタスクはセマフォで同時実行数を制限しつつ並行に実行する。
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        tools: list = [],
+        prompts: HelpDeskAgentPrompts = HelpDeskAgentPrompts(),
+        tool_timeout: float = TOOL_TIMEOUT_SECONDS,
+        tool_timeouts: dict[str, float] = {},
+        history_token_budget: int = HISTORY_TOKEN_BUDGET,
+        max_concurrent_subtasks: int = MAX_CONCURRENT_SUBTASKS,
+    ) -> None:
+        super().__init__(settings, tools, prompts, tool_timeout, tool_timeouts, history_token_budget)
+        self.async_client = AsyncOpenAI(api_key=self.settings.openai_api_key)
+        self.max_concurrent_subtasks = max(1, max_concurrent_subtasks)
+
+    async def acreate_plan(self, state: AgentState) -> dict:
+        """計画を作成する
+
+        Args:
+            state (AgentState): 入力の状態
+
+        Returns:
+            AgentState: 更新された状態
+        """
+
+        logger.info("🚀 Starting plan generation process...")
+        messages = self._build_plan_messages(state)
+
+        try:
+            logger.info("Sending request to OpenAI...")
+            response = await self.async_client.beta.chat.completions.parse(
+                model=self.settings.openai_model,
+                messages=messages,
+                response_format=Plan,
+                temperature=0,
+                seed=0,
+            )
+            logger.info("✅ Successfully received response from OpenAI.")
+        except Exception as e:
+            logger.error(f"Error during OpenAI request: {e}")
+            raise
+
+        plan = response.choices[0].message.parsed
+
+        logger.info("Plan generation complete!")
+
+        return {"plan": plan.subtasks}
+
+    async def aselect_tools(self, state: AgentSubGraphState) -> dict:
+        """ツールを選択する
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+
+        Returns:
+            dict: 更新された状態
+        """
+
+        logger.info("🚀 Starting tool selection process...")
+        openai_tools = [convert_to_openai_tool(tool) for tool in self.tools]
+        messages = self._build_tool_selection_messages(state)
+
+        try:
+            logger.info("Sending request to OpenAI...")
+            response = await self.async_client.chat.completions.create(
+                model=self.settings.openai_model,
+                messages=messages,
+                tools=openai_tools,  # type: ignore
+                temperature=0,
+                seed=0,
+            )
+            logger.info(response)
+        except Exception as e:
+            logger.error(f"Error during OpenAI request: {e}")
+            raise
+
+        return self._build_tool_selection_update(messages, response)
+
+    async def aexecute_tools(self, state: AgentSubGraphState) -> dict:
+        """ツールを実行する
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+
+        Raises:
+            ValueError: toolがNoneの場合
+
+        Returns:
+            dict: 更新された状態
+        """
+
+        logger.info("🚀 Starting tool execution process...")
+        messages = state["messages"]
+        tool_calls = self._get_tool_calls(messages)
+        tool_cache = state.get("tool_cache") or ToolCallCache()
+
+        # 非同期ツールはそのまま、同期ツールはスレッドプールで実行し、まとめてgatherする
+        outputs = await asyncio.gather(
+            *(self._arun_tool_call(tool_call, tool_cache) for tool_call in tool_calls)
+        )
+        return self._build_tool_execution_update(messages, tool_calls, list(outputs))
+
+    async def _arun_tool_call(self, tool_call: dict, tool_cache: ToolCallCache):
+        tool_name = tool_call["function"]["name"]
+        tool_args = tool_call["function"]["arguments"]
+        tool = self.tool_map[tool_name]
+
+        def start() -> asyncio.Future:
+            if getattr(tool, "coroutine", None) is not None:
+                return asyncio.ensure_future(tool.ainvoke(tool_args))
+            loop = asyncio.get_running_loop()
+            return loop.run_in_executor(self.tool_executor, tool.invoke, tool_args)
+
+        entry = tool_cache.get_or_start(ToolCallCache.make_key(tool_name, tool_args), start)
+        timeout = self._get_tool_timeout(tool_name)
+        try:
+            # 共有中の呼び出しを他のサブタスクのタイムアウトで取り消さないようshieldする
+            return await asyncio.wait_for(asyncio.shield(entry), timeout=timeout)
+        except asyncio.TimeoutError:
+            return TimeoutError(timeout)
+
+    async def acreate_subtask_answer(self, state: AgentSubGraphState) -> dict:
+        """サブタスク回答を作成する
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+
+        Returns:
+            dict: 更新された状態
+        """
+
+        logger.info("🚀 Starting subtask answer creation process...")
+        messages = state["messages"]
+
+        try:
+            logger.info("Sending request to OpenAI...")
+            response = await self.async_client.chat.completions.create(
+                model=self.settings.openai_model,
+                messages=messages,
+                temperature=0,
+                seed=0,
+            )
+            logger.info("✅ Successfully received response from OpenAI.")
+        except Exception as e:
+            logger.error(f"Error during OpenAI request: {e}")
+            raise
+
+        return self._build_subtask_answer_update(messages, response)
+
+    async def areflect_subtask(self, state: AgentSubGraphState) -> dict:
+        """サブタスク回答を内省する
+
+        Args:
+            state (AgentSubGraphState): 入力の状態
+
+        Returns:
+            dict: 更新された状態
+        """
+
+        logger.info("🚀 Starting reflection process...")
+        messages = state["messages"]
+        messages.append({"role": "user", "content": self.prompts.subtask_reflection_user_prompt})
+
+        try:
+            logger.info("Sending request to OpenAI...")
+            response = await self.async_client.beta.chat.completions.parse(
+                model=self.settings.openai_model,
+                messages=messages,
+                response_format=ReflectionResult,
+                temperature=0,
+                seed=0,
+            )
+            logger.info("✅ Successfully received response from OpenAI.")
+        except Exception as e:
+            logger.error(f"Error during OpenAI request: {e}")
+            raise
+
+        return self._build_reflection_update(state, messages, response)
+
+    async def acreate_answer(self, state: AgentState) -> dict:
+        """最終回答を作成する
+
+        Args:
+            state (AgentState): 入力の状態
+
+        Returns:
+            dict: 更新された状態
+        """
+
+        logger.info("🚀 Starting final answer creation process...")
+        messages = self._build_answer_messages(state)
+
+        try:
+            logger.info("Sending request to OpenAI...")
+            response = await self.async_client.chat.completions.create(
+                model=self.settings.openai_model,
+                messages=messages,
+                temperature=0,
+                seed=0,
+            )
+            logger.info("✅ Successfully received response from OpenAI.")
+        except Exception as e:
+            logger.error(f"Error during OpenAI request: {e}")
+            raise
+
+        logger.info("Final answer creation complete!")
+
+        return {"last_answer": response.choices[0].message.content}
+
+    async def _aexecute_subgraph(self, state: AgentState, semaphore: asyncio.Semaphore):
+        # Sendで分岐したサブタスクは同一ステップで並行実行されるため、セマフォで同時実行数を絞る
+        async with semaphore:
+            subgraph = self._create_async_subgraph()
+            result = await subgraph.ainvoke(self._build_subgraph_input(state))
+        return {"subtask_results": [self._build_subtask_result(result)]}
+
+    def _create_async_subgraph(self) -> Pregel:
+        """非同期ノードでサブグラフを作成する
+
+        Returns:
+            Pregel: サブグラフ
+        """
+        return self._compile_subgraph(
+            self.aselect_tools,
+            self.aexecute_tools,
+            self.acreate_subtask_answer,
+            self.areflect_subtask,
+        )
+
+    def create_async_graph(self) -> Pregel:
+        """非同期ノードでエージェントのメイングラフを作成する
+
+        セマフォは実行ごとのイベントループに紐づけるため、グラフ作成時に生成する。
+
+        Returns:
+            Pregel: エージェントのメイングラフ
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_subtasks)
+        return self._compile_graph(
+            self.acreate_plan,
+            partial(self._aexecute_subgraph, semaphore=semaphore),
+            self.acreate_answer,
+        )
+
+    async def arun_agent(self, question: str) -> AgentResult:
+        """エージェントを非同期に実行する
+
+        Args:
+            question (str): 入力の質問
+
+        Returns:
+            AgentResult: エージェントの実行結果（run_agentと同じ形式）
+        """
+
+        app = self.create_async_graph()
+        result = await app.ainvoke(
+            {
+                "question": question,
+                "current_step": 0,
+                "tool_cache": ToolCallCache(),
+            }
+        )
+        return self._build_agent_result(question, result)
@@ -8,6 +8,7 @@ import re
 from datetime import datetime, timezone
 from typing import Dict, Optional, Tuple
 
+from src.observability.metrics import get_metrics_singleton
 
 LOGGER = logging.getLogger("services.session_manager")
 _SESSION_MANAGER_SINGLETON: Optional["SessionManager"] = None
@@ -20,6 +21,10 @@ class SessionManager:
         """セッション状態とキャッシュ用のストレージを初期化します。"""
         self._session_data: Dict[str, Dict[str, object]] = {}
         self._drawio_cache: Dict[str, str] = {}
+        # クライアント切断で中断した生成の途中までの本文（PERSIST_PARTIAL_ON_CANCEL時のみ）
+        self._partial_content: Dict[str, Dict[str, str]] = {}
+        # readiness判定のため、キャッシュしたdrawioと途中までの本文の合計サイズを保持しておく
+        self._cache_bytes = 0
         self._lock = asyncio.Lock()
 
     async def register_request(self, session_id: str) -> Tuple[bool, Optional[str]]:
@@ -50,6 +55,9 @@ class SessionManager:
 
             previous_drawio = self._drawio_cache.get(session_id)
 
+        get_metrics_singleton().session_cache.labels(
+            "miss" if previous_drawio is None else "hit"
+        ).inc()
         LOGGER.info(
             "Session %s: requestCount=%s first=%s",
             session_id,
@@ -71,15 +79,66 @@ class SessionManager:
         Returns:
             None: 返り値は使用しません。
         """
+        # 最後まで生成できたため、以前に中断した生成の途中結果は不要になる
+        await self.discard_partial_content(session_id)
         drawio = self._extract_drawio(content)
         if not drawio:
             return
 
+        size = len(drawio.encode("utf-8"))
         async with self._lock:
+            previous = self._drawio_cache.get(session_id)
+            if previous is not None:
+                self._cache_bytes -= len(previous.encode("utf-8"))
             self._drawio_cache[session_id] = drawio
+            self._cache_bytes += size
 
         LOGGER.info("Cached drawio for session %s", session_id)
 
+    async def save_partial_content(self, session_id: str, content: str) -> None:
+        """クライアント切断で中断した生成の途中までの本文を保存します。
+
+        Args:
+            session_id: 中断した生成のセッションID。
+            content: 中断までに受信した本文。
+
+        Returns:
+            None: 返り値は使用しません。
+        """
+        async with self._lock:
+            previous = self._partial_content.get(session_id)
+            if previous is not None:
+                self._cache_bytes -= len(previous["content"].encode("utf-8"))
+            self._partial_content[session_id] = {
+                "content": content,
+                "savedAt": datetime.now(timezone.utc).isoformat(),
+            }
+            self._cache_bytes += len(content.encode("utf-8"))
+
+        LOGGER.info("Saved partial content for session %s: %s chars", session_id, len(content))
+
+    async def discard_partial_content(self, session_id: str) -> None:
+        """保存している途中までの本文を破棄します。"""
+        async with self._lock:
+            previous = self._partial_content.pop(session_id, None)
+            if previous is not None:
+                self._cache_bytes -= len(previous["content"].encode("utf-8"))
+
+    def get_partial_content(self, session_id: str) -> Optional[Dict[str, str]]:
+        """保存している途中までの本文と保存日時を返します。
+
+        Args:
+            session_id: セッションID。
+
+        Returns:
+            Optional[Dict[str, str]]: contentとsavedAt。保存していない場合はNone。
+        """
+        return self._partial_content.get(session_id)
+
+    def cache_size_bytes(self) -> int:
+        """キャッシュしているdrawioと途中までの本文の合計サイズ（UTF-8のバイト数）を返します。"""
+        return self._cache_bytes
+
     @staticmethod
     def _extract_drawio(content: str) -> Optional[str]:
         """テキストからdrawioのXML断片を抽出します。
@@ -90,10 +149,22 @@ class SessionManager:
         Returns:
             Optional[str]: 抽出したdrawioコード。該当しない場合はNone。
         """
-        if not content:
-            return None
-        match = re.search(r"<\?xml[\s\S]*?</mxfile>|<mxfile[\s\S]*?</mxfile>", content)
-        return match.group(0) if match else None
+        return extract_drawio(content)
+
+
+def extract_drawio(content: str) -> Optional[str]:
+    """テキストからdrawioのXML断片を抽出します。
+
+    Args:
+        content: Claudeレスポンス全文。
+
+    Returns:
+        Optional[str]: 抽出したdrawioコード。該当しない場合はNone。
+    """
+    if not content:
+        return None
+    match = re.search(r"<\?xml[\s\S]*?</mxfile>|<mxfile[\s\S]*?</mxfile>", content)
+    return match.group(0) if match else None
 
 
 def set_session_manager_singleton(manager: SessionManager) -> None:
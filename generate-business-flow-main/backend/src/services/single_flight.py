@@ -0,0 +1,128 @@
+"""Single-flight coalescing of identical concurrent flow generations."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional
+
+from src.services.stream_replay import ReplayableStream
+
+LOGGER = logging.getLogger("services.single_flight")
+_GENERATION_FLIGHTS_SINGLETON: Optional["GenerationFlights"] = None
+
+
+class GenerationFlights:
+    """同じセッション・同じ内容の生成リクエストを1回の上流呼び出しにまとめます。
+
+    最初のリクエストがキーを確保して生成を開始し、生成中に届いた同一のリクエストは
+    そのストリームを先頭から購読します。生成の準備（添付の抽出やエージェントの実行）中に
+    届いたリクエストも、準備が終わるまで待ってから同じストリームを購読します。
+    キーは生成が終わった時点で解放され、以降の同一リクエストは新しい生成になります。
+    """
+
+    def __init__(self) -> None:
+        """生成中のキーを保持する辞書を初期化します。"""
+        self._inflight: Dict[str, asyncio.Future[ReplayableStream]] = {}
+
+    def join(self, key: str) -> Optional[asyncio.Future[ReplayableStream]]:
+        """生成中（または準備中）の同一リクエストがあれば、そのストリームのFutureを返します。
+
+        Args:
+            key: flight_keyで計算したキー。
+
+        Returns:
+            Optional[asyncio.Future[ReplayableStream]]: 同一リクエストがない場合はNone。
+        """
+        return self._inflight.get(key)
+
+    def lead(self, key: str) -> asyncio.Future[ReplayableStream]:
+        """キーを確保し、以降の同一リクエストが待つFutureを返します。
+
+        Args:
+            key: flight_keyで計算したキー。
+
+        Returns:
+            asyncio.Future[ReplayableStream]: publishまたはabandonで完了させるFuture。
+        """
+        future: asyncio.Future[ReplayableStream] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def publish(
+        self,
+        key: str,
+        future: asyncio.Future[ReplayableStream],
+        stream: ReplayableStream,
+    ) -> ReplayableStream:
+        """開始したストリームを待機中のリクエストへ渡し、生成終了時にキーを解放します。
+
+        Args:
+            key: leadで確保したキー。
+            future: leadが返したFuture。
+            stream: 開始済みのストリーム。
+
+        Returns:
+            ReplayableStream: 渡したストリーム。
+        """
+        if not future.done():
+            future.set_result(stream)
+        stream.add_done_callback(lambda: self._release(key, future))
+        return stream
+
+    def abandon(
+        self, key: str, future: asyncio.Future[ReplayableStream], exc: BaseException
+    ) -> None:
+        """生成を開始できなかったことを待機中のリクエストへ伝え、キーを解放します。
+
+        Args:
+            key: leadで確保したキー。
+            future: leadが返したFuture。
+            exc: 準備中に発生した例外。待機中のリクエストにも同じ例外を送出します。
+        """
+        if not future.done():
+            if isinstance(exc, Exception):
+                future.set_exception(exc)
+                # 待機中のリクエストがいない場合に未取得の例外として警告されないようにする
+                future.exception()
+            else:
+                future.cancel()
+        self._release(key, future)
+
+    def _release(self, key: str, future: asyncio.Future[ReplayableStream]) -> None:
+        # 同じキーで後から確保された別の生成は解放しない
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            LOGGER.debug("Released generation flight %s", key[:12])
+
+
+def flight_key(session_id: str, user_prompt: str, attachment_hashes: Iterable[str]) -> str:
+    """セッションIDとリクエスト内容からsingle-flightのキーを計算します。
+
+    Args:
+        session_id: セッションID。
+        user_prompt: 添付を展開する前のユーザープロンプト。
+        attachment_hashes: リクエストで参照する添付のSHA-256。
+
+    Returns:
+        str: セッションIDとリクエスト内容のハッシュを連結したキー。
+    """
+    digest = hashlib.sha256(user_prompt.encode("utf-8"))
+    for attachment_hash in sorted(attachment_hashes):
+        digest.update(b"\0" + attachment_hash.encode("ascii"))
+    return f"{session_id}:{digest.hexdigest()}"
+
+
+def set_generation_flights_singleton(flights: GenerationFlights) -> None:
+    """create_appで生成したGenerationFlightsインスタンスを共有レジストリに登録。"""
+    global _GENERATION_FLIGHTS_SINGLETON
+    _GENERATION_FLIGHTS_SINGLETON = flights
+
+
+def get_generation_flights_singleton() -> GenerationFlights:
+    """登録済みのGenerationFlightsを返却し、未登録なら新規生成する。"""
+    global _GENERATION_FLIGHTS_SINGLETON
+    if _GENERATION_FLIGHTS_SINGLETON is None:
+        _GENERATION_FLIGHTS_SINGLETON = GenerationFlights()
+    return _GENERATION_FLIGHTS_SINGLETON
@@ -0,0 +1,500 @@
+"""Resumable generation streams backed by a bounded per-stream replay buffer."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional, Tuple
+
+LOGGER = logging.getLogger("services.stream_replay")
+_STREAM_REPLAY_REGISTRY_SINGLETON: Optional["StreamReplayRegistry"] = None
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# プロキシにアイドル切断されないよう、イベントが途切れたらコメント行を送る
+SSE_KEEPALIVE_SECONDS = 15.0
+SSE_RETRY_MS = 3000
+# クライアントの切断はイベントの送信とは別に、この間隔で確認する
+DISCONNECT_POLL_SECONDS = 1.0
+DEFAULT_BUFFER_BYTES = 16 * 1024 * 1024
+# 購読者の読み出しが遅れて未送信のイベントが押し出された場合に流すエラーイベント
+REPLAY_GAP_NDJSON = b'{"type": "error", "error": "replay_gap"}\n'
+
+DisconnectCheck = Callable[[], Awaitable[bool]]
+
+
+class ReplayGapError(Exception):
+    """再送に必要なイベントがリングバッファから押し出されている場合の例外。"""
+
+
+class ReplayableStream:
+    """生成ストリームをバックグラウンドで読み進め、番号付きイベントとして保持します。
+
+    クライアントの接続とは独立して上流のストリームを読み、直近のイベントを
+    リングバッファへ残します。再接続したクライアントは最後に受け取った番号の次から
+    再送を受け、そのまま以降のイベントを受け取ります。
+
+    購読者がいなくなった場合は上流の読み出しを止めます。SSEで購読されたストリームは
+    再接続を待つため、resume_grace_seconds秒待ってから止めます。
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        session_id: str,
+        buffer_events: int,
+        keep_all: bool = False,
+        resume_grace_seconds: float = 0.0,
+        buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+    ) -> None:
+        """ストリームIDとバッファ長を受け取り初期化します。
+
+        Args:
+            stream_id: Last-Event-IDに含めるストリーム識別子。
+            session_id: ストリームを生成したセッションID。
+            buffer_events: 再送用に保持するイベント数の上限。
+            keep_all: Trueの場合は生成中のイベントを件数で切り詰めずに保持し、読み終えた時点で
+                buffer_events件まで切り詰めます。buffer_bytesの上限は常に適用します。
+            resume_grace_seconds: SSEの購読者が全員切断した後、再接続を待つ秒数。
+            buffer_bytes: 再送用に保持するイベントの合計バイト数の上限。直近の1件は常に残します。
+        """
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.buffer_events = max(1, buffer_events)
+        self.buffer_bytes = max(1, buffer_bytes)
+        self._events: Deque[Tuple[int, bytes]] = deque()
+        self._buffered_bytes = 0
+        self._max_events: Optional[int] = None if keep_all else self.buffer_events
+        self._last_seq = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._done_callbacks: List[Callable[[], None]] = []
+        self._subscribers = 0
+        self._reserved = False
+        self.resume_grace_seconds = resume_grace_seconds
+        # allow_resumeが呼ばれるまでは、購読者がいなくなった時点で止める
+        self._cancel_grace_seconds = 0.0
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        """上流のストリームを読み終えたかどうかを返します。"""
+        return self.finished_at is not None
+
+    @property
+    def last_seq(self) -> int:
+        """最後に受け取ったイベントの番号を返します。"""
+        return self._last_seq
+
+    def start(self, source: AsyncIterator[bytes]) -> None:
+        """上流のストリームを読み進めるタスクを開始します。
+
+        Args:
+            source: 1チャンク1イベントとして扱う生成ストリーム。
+        """
+        self._task = asyncio.create_task(
+            self._pump(source), name=f"stream-replay-{self.stream_id}"
+        )
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        """上流のストリームを読み終えた時点で呼ぶコールバックを登録します。
+
+        すでに読み終えている場合はその場で呼び出します。
+        """
+        if self.done:
+            callback()
+        else:
+            self._done_callbacks.append(callback)
+
+    def reserve(self) -> None:
+        """生成を開始したリクエストの分の購読者を、購読を始める前に確保します。
+
+        確保しないと、先に合流したリクエストが購読してすぐ切断した時点で購読者が0になり、
+        生成を開始したリクエストが購読する前に上流の読み出しが止まります。
+        確保した分はsubscribe(reserved=True)で引き継ぐか、release_reservationで解放します。
+        """
+        if not self._reserved:
+            self._reserved = True
+            self._subscribers += 1
+
+    def release_reservation(self) -> None:
+        """reserveで確保した購読者がまだ購読していなければ解放します。"""
+        if self._reserved:
+            self._reserved = False
+            self._subscribers -= 1
+            self._on_unsubscribed()
+
+    def allow_resume(self) -> None:
+        """購読者が全員切断しても、再接続を待ってから上流の読み出しを止めるようにします。"""
+        self._cancel_grace_seconds = self.resume_grace_seconds
+
+    async def cancel(self) -> None:
+        """読み進めているタスクを停止します。"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _pump(self, source: AsyncIterator[bytes]) -> None:
+        try:
+            async for chunk in source:
+                self._last_seq += 1
+                self._events.append((self._last_seq, chunk))
+                self._buffered_bytes += len(chunk)
+                self._evict_events()
+                self._notify()
+        except Exception:  # pylint: disable=broad-except
+            # 上流側のエラーはソースがエラーイベントとして流すため、ここではログだけ残す
+            LOGGER.exception("Replayable stream %s failed", self.stream_id)
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.finished_at = time.monotonic()
+            self._notify()
+            self._trim_if_idle()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+            for callback in callbacks:
+                callback()
+            LOGGER.info("Replayable stream %s finished: events=%s", self.stream_id, self._last_seq)
+
+    def _notify(self) -> None:
+        # 待機中の購読者をすべて起こし、次の変更用に新しいEventへ差し替える
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _events_after(self, cursor: int) -> List[Tuple[int, bytes]]:
+        # 購読者はほぼ追いついているため、末尾から必要な分だけ読む
+        events = []
+        for event in reversed(self._events):
+            if event[0] <= cursor:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+
+    def _on_unsubscribed(self) -> None:
+        """購読者が抜けた時点で、誰も読んでいない生成を止める準備をします。"""
+        self._trim_if_idle()
+        if self.done or self._subscribers or self._task is None:
+            return
+        if self._cancel_grace_seconds <= 0:
+            self._cancel_if_abandoned()
+            return
+        if self._abandon_timer is None:
+            self._abandon_timer = asyncio.get_running_loop().call_later(
+                self._cancel_grace_seconds, self._cancel_if_abandoned
+            )
+
+    def _cancel_if_abandoned(self) -> None:
+        self._abandon_timer = None
+        if self.done or self._subscribers or self._task is None:
+            return
+        LOGGER.info(
+            "Cancelling stream %s: no subscribers left after event %s",
+            self.stream_id,
+            self._last_seq,
+        )
+        self._task.cancel()
+
+    def _evict_events(self) -> None:
+        # 件数またはバイト数の上限を超えた古いイベントから捨てる。直近の1件は常に残す
+        while len(self._events) > 1 and (
+            (self._max_events is not None and len(self._events) > self._max_events)
+            or self._buffered_bytes > self.buffer_bytes
+        ):
+            _, chunk = self._events.popleft()
+            self._buffered_bytes -= len(chunk)
+
+    def _trim_if_idle(self) -> None:
+        # 件数で切り詰めずに保持していたイベントは、読み終えて購読者もいなくなった時点で切り詰める
+        if self.done and self._subscribers == 0 and self._max_events is None:
+            self._max_events = self.buffer_events
+            self._evict_events()
+
+    def check_resumable(self, after_seq: int) -> None:
+        """指定した番号の次から再送できるかを確認します。
+
+        Args:
+            after_seq: クライアントが最後に受け取ったイベントの番号。
+
+        Raises:
+            ReplayGapError: 必要なイベントがバッファに残っていない、または番号が未来の場合。
+        """
+        if after_seq > self._last_seq:
+            raise ReplayGapError(f"event {after_seq} has not been produced")
+        oldest = self._events[0][0] if self._events else self._last_seq + 1
+        if after_seq + 1 < oldest:
+            raise ReplayGapError(f"events after {after_seq} were evicted from the replay buffer")
+
+    async def subscribe(
+        self,
+        after_seq: int = 0,
+        keepalive_seconds: Optional[float] = None,
+        is_disconnected: Optional[DisconnectCheck] = None,
+        reserved: bool = False,
+    ) -> AsyncIterator[Optional[Tuple[int, bytes]]]:
+        """指定した番号より後のイベントを再送し、その後は新しいイベントを順に返します。
+
+        Args:
+            after_seq: クライアントが最後に受け取ったイベントの番号。0の場合は先頭から。
+            keepalive_seconds: 指定時はイベントがこの秒数途切れるたびにNoneを返します。
+            is_disconnected: 指定時は定期的に呼び出し、Trueを返したら購読を終了します。
+            reserved: Trueの場合はreserveで確保済みの購読者を引き継ぎます。
+
+        Yields:
+            Optional[Tuple[int, bytes]]: イベント番号とチャンク。キープアライブ時はNone。
+
+        Raises:
+            ReplayGapError: 購読者の読み出しが遅く、未送信のイベントが押し出された場合。
+        """
+        cursor = after_seq
+        if reserved and self._reserved:
+            self._reserved = False
+        else:
+            self._subscribers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        last_checked = last_yielded = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                if is_disconnected is not None and now - last_checked >= DISCONNECT_POLL_SECONDS:
+                    last_checked = now
+                    if await is_disconnected():
+                        LOGGER.info(
+                            "Client disconnected from stream %s after event %s",
+                            self.stream_id,
+                            cursor,
+                        )
+                        return
+                self.check_resumable(cursor)
+                waiter = self._changed
+                pending = self._events_after(cursor)
+                for event in pending:
+                    yield event
+                    cursor = event[0]
+                if pending:
+                    last_yielded = time.monotonic()
+                    continue
+                if self.done:
+                    return
+                timeouts = []
+                if keepalive_seconds is not None:
+                    timeouts.append(max(0.0, keepalive_seconds - (now - last_yielded)))
+                if is_disconnected is not None:
+                    timeouts.append(DISCONNECT_POLL_SECONDS)
+                try:
+                    await asyncio.wait_for(waiter.wait(), min(timeouts) if timeouts else None)
+                except asyncio.TimeoutError:
+                    if (
+                        keepalive_seconds is not None
+                        and time.monotonic() - last_yielded >= keepalive_seconds
+                    ):
+                        last_yielded = time.monotonic()
+                        yield None
+        finally:
+            self._subscribers -= 1
+            self._on_unsubscribed()
+
+
+class StreamReplayRegistry:
+    """再接続を受け付けるストリームを保持し、終了後一定時間で破棄します。"""
+
+    def __init__(
+        self,
+        buffer_events: int = 5000,
+        retention_seconds: float = 300.0,
+        max_streams: int = 200,
+        resume_grace_seconds: float = 60.0,
+        buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+    ) -> None:
+        """バッファ長と保持期間を受け取り初期化します。
+
+        Args:
+            buffer_events: ストリームごとに保持するイベント数の上限。
+            retention_seconds: 生成完了後に再接続を受け付ける秒数。
+            max_streams: 保持するストリーム数の上限。超えた分は終了済みの古いものから破棄します。
+            resume_grace_seconds: SSEの購読者が全員切断した後、生成を止めるまで再接続を待つ秒数。
+            buffer_bytes: ストリームごとに保持するイベントの合計バイト数の上限。
+        """
+        self.buffer_events = max(1, buffer_events)
+        self.buffer_bytes = max(1, buffer_bytes)
+        self.retention_seconds = retention_seconds
+        self.max_streams = max(1, max_streams)
+        self.resume_grace_seconds = max(0.0, resume_grace_seconds)
+        self._streams: "OrderedDict[str, ReplayableStream]" = OrderedDict()
+
+    def create(
+        self,
+        session_id: str,
+        source: AsyncIterator[bytes],
+        keep_all: bool = False,
+        reserve: bool = False,
+    ) -> ReplayableStream:
+        """新しいストリームを登録し、上流の読み出しを開始します。
+
+        Args:
+            session_id: ストリームを生成したセッションID。
+            source: 生成ストリーム。
+            keep_all: Trueの場合は生成中のイベントを件数で切り詰めずに保持し、途中から購読した
+                リクエストにも先頭から再送できるようにします（バイト数の上限までに限ります）。
+            reserve: Trueの場合は読み出しを始める前に購読者を1人分確保します（ReplayableStream.reserve）。
+
+        Returns:
+            ReplayableStream: 登録したストリーム。
+        """
+        self._evict()
+        stream = ReplayableStream(
+            uuid.uuid4().hex,
+            session_id,
+            self.buffer_events,
+            keep_all=keep_all,
+            resume_grace_seconds=self.resume_grace_seconds,
+            buffer_bytes=self.buffer_bytes,
+        )
+        self._streams[stream.stream_id] = stream
+        if reserve:
+            stream.reserve()
+        stream.start(source)
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ReplayableStream]:
+        """ストリームIDに対応するストリームを返します。期限切れの場合はNone。"""
+        self._evict()
+        return self._streams.get(stream_id)
+
+    def _evict(self) -> None:
+        """保持期間を過ぎたストリームと、上限を超えた終了済みのストリームを破棄します。"""
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            finished_at = stream.finished_at
+            if finished_at is not None and now - finished_at >= self.retention_seconds:
+                del self._streams[stream_id]
+        excess = len(self._streams) - self.max_streams + 1
+        if excess <= 0:
+            return
+        # 生成中のストリームは破棄せず、終了済みのものだけを古い順に捨てる
+        for stream_id in [key for key, stream in self._streams.items() if stream.done][:excess]:
+            del self._streams[stream_id]
+
+    async def shutdown(self) -> None:
+        """生成中のストリームをすべて停止します。"""
+        streams = list(self._streams.values())
+        self._streams.clear()
+        await asyncio.gather(*(stream.cancel() for stream in streams), return_exceptions=True)
+
+
+def format_event_id(stream_id: str, seq: int) -> str:
+    """SSEのidフィールドに載せる値を返します。"""
+    return f"{stream_id}:{seq}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Last-Event-IDヘッダーの値をストリームIDとイベント番号に分解します。
+
+    Args:
+        value: Last-Event-IDヘッダーの値。
+
+    Returns:
+        Optional[Tuple[str, int]]: ストリームIDと番号。形式が不正な場合はNone。
+    """
+    if not value:
+        return None
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+async def ndjson_events(
+    stream: ReplayableStream,
+    is_disconnected: Optional[DisconnectCheck] = None,
+    reserved: bool = False,
+) -> AsyncIterator[bytes]:
+    """ストリームのイベントを先頭から既存のNDJSON形式のまま返します。
+
+    NDJSONは再接続できないため、購読者が全員切断した時点で上流の生成を止めます。
+
+    Args:
+        stream: 購読するストリーム。
+        is_disconnected: クライアントの切断を確認する関数（Request.is_disconnected）。
+        reserved: Trueの場合はreserveで確保済みの購読者を引き継ぎます。
+
+    Yields:
+        bytes: 1行1イベントのJSON。
+    """
+    try:
+        async with aclosing(
+            stream.subscribe(0, is_disconnected=is_disconnected, reserved=reserved)
+        ) as events:
+            async for event in events:
+                if event is not None:
+                    yield event[1]
+    except ReplayGapError as exc:
+        LOGGER.warning("NDJSON subscriber fell behind on stream %s: %s", stream.stream_id, exc)
+        yield REPLAY_GAP_NDJSON
+
+
+async def sse_events(
+    stream: ReplayableStream,
+    after_seq: int = 0,
+    is_disconnected: Optional[DisconnectCheck] = None,
+    reserved: bool = False,
+) -> AsyncIterator[bytes]:
+    """ストリームのイベントをSSE形式へ変換して返します。
+
+    各イベントのdataには既存のNDJSONストリームと同じJSONを1行で載せます。
+    SSEの購読者が全員切断しても、再接続を待つ間は上流の生成を続けます。
+
+    Args:
+        stream: 購読するストリーム。
+        after_seq: クライアントが最後に受け取ったイベントの番号。
+        is_disconnected: クライアントの切断を確認する関数（Request.is_disconnected）。
+        reserved: Trueの場合はreserveで確保済みの購読者を引き継ぎます。
+
+    Yields:
+        bytes: SSE形式のイベント。
+    """
+    stream.allow_resume()
+    yield f"retry: {SSE_RETRY_MS}\n\n".encode("utf-8")
+    try:
+        async with aclosing(
+            stream.subscribe(
+                after_seq,
+                keepalive_seconds=SSE_KEEPALIVE_SECONDS,
+                is_disconnected=is_disconnected,
+                reserved=reserved,
+            )
+        ) as events:
+            async for event in events:
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                seq, chunk = event
+                lines = [
+                    f"id: {format_event_id(stream.stream_id, seq)}",
+                    *(f"data: {line}" for line in chunk.decode("utf-8").splitlines()),
+                ]
+                yield ("\n".join(lines) + "\n\n").encode("utf-8")
+    except ReplayGapError as exc:
+        LOGGER.warning("SSE subscriber fell behind on stream %s: %s", stream.stream_id, exc)
+        yield b"event: error\ndata: " + REPLAY_GAP_NDJSON + b"\n"
+
+
+def set_stream_replay_registry_singleton(registry: StreamReplayRegistry) -> None:
+    """create_appで生成したStreamReplayRegistryインスタンスを共有レジストリに登録。"""
+    global _STREAM_REPLAY_REGISTRY_SINGLETON
+    _STREAM_REPLAY_REGISTRY_SINGLETON = registry
+
+
+def get_stream_replay_registry_singleton() -> StreamReplayRegistry:
+    """登録済みのStreamReplayRegistryを返却し、未登録なら既定値で新規生成する。"""
+    global _STREAM_REPLAY_REGISTRY_SINGLETON
+    if _STREAM_REPLAY_REGISTRY_SINGLETON is None:
+        _STREAM_REPLAY_REGISTRY_SINGLETON = StreamReplayRegistry()
+    return _STREAM_REPLAY_REGISTRY_SINGLETON
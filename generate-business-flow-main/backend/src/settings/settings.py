@@ -19,6 +19,7 @@ LOGGER = logging.getLogger("core.settings")
 
 
 SRC_DIR = Path(__file__).resolve().parent.parent
+LOG_DIR = SRC_DIR.parent.parent / "logs"
 ANTHROPIC_CONFIG_FILE = "anthropic_llm_config.yaml"
 
 
@@ -32,6 +33,43 @@ class Settings:
     flow_prompt_path: Path
     flow_modification_prompt_path: Path
     api_url: str = "https://api.anthropic.com/v1/messages"
+    batch_concurrency: int = 2
+    batch_max_prompts: int = 50
+    attachment_max_bytes: int = 10 * 1024 * 1024
+    attachment_max_files: int = 10
+    extraction_timeout_seconds: float = 20.0
+    extraction_workers: int = 2
+    attachment_token_budget: int = 8000
+    attachment_top_k: int = 8
+    max_request_body_bytes: int = 32 * 1024 * 1024
+    retention_enabled: bool = False
+    retention_days: int = 90
+    retention_interval_seconds: float = 24 * 60 * 60
+    retention_batch_size: int = 500
+    trace_sample_rate: float = 0.1
+    trace_export_path: Path = LOG_DIR / "traces.jsonl"
+    log_level: str = "INFO"
+    log_json: bool = True
+    log_sampling: str = ""
+    usage_tracked_sessions: int = 1000
+    profile_token: str = ""
+    profile_dir: Path = LOG_DIR / "profiles"
+    profile_max_per_hour: int = 6
+    profile_interval_ms: float = 5.0
+    loop_monitor_interval_ms: float = 100.0
+    loop_block_threshold_ms: float = 250.0
+    ready_max_streams: int = 100
+    ready_max_loop_lag_ms: float = 500.0
+    ready_max_session_cache_mb: float = 512.0
+    ready_max_upstream_ttft_ms: float = 20000.0
+    ready_upstream_window_seconds: float = 300.0
+    stream_replay_buffer_events: int = 5000
+    stream_replay_retention_seconds: float = 300.0
+    stream_replay_max_streams: int = 200
+    stream_replay_buffer_bytes: int = 16 * 1024 * 1024
+    stream_resume_grace_seconds: float = 60.0
+    persist_partial_on_cancel: bool = False
+    persist_interactive_requests: bool = True
 
     @classmethod
     def load(cls) -> "Settings":
@@ -52,6 +90,57 @@ class Settings:
             )
 
         port = int(os.getenv("PORT", "3002"))
+        batch_concurrency = max(1, int(os.getenv("BATCH_CONCURRENCY", "2")))
+        batch_max_prompts = max(1, int(os.getenv("BATCH_MAX_PROMPTS", "50")))
+        attachment_max_bytes = int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+        attachment_max_files = int(os.getenv("ATTACHMENT_MAX_FILES", "10"))
+        extraction_timeout_seconds = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "20"))
+        extraction_workers = max(1, int(os.getenv("EXTRACTION_WORKERS", "2")))
+        attachment_token_budget = int(os.getenv("ATTACHMENT_TOKEN_BUDGET", "8000"))
+        attachment_top_k = max(1, int(os.getenv("ATTACHMENT_TOP_K", "8")))
+        max_request_body_bytes = int(
+            os.getenv("MAX_REQUEST_BODY_BYTES", str(32 * 1024 * 1024))
+        )
+        retention_enabled = os.getenv("RETENTION_ENABLED", "false").lower() in ("1", "true", "yes")
+        retention_days = int(os.getenv("RETENTION_DAYS", "90"))
+        retention_interval_seconds = float(os.getenv("RETENTION_INTERVAL_SECONDS", "86400"))
+        retention_batch_size = max(1, int(os.getenv("RETENTION_BATCH_SIZE", "500")))
+        trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+        trace_export_path = Path(os.getenv("TRACE_EXPORT_PATH") or LOG_DIR / "traces.jsonl")
+        log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        log_json = os.getenv("LOG_FORMAT", "json").lower() != "text"
+        log_sampling = os.getenv("LOG_SAMPLING", "")
+        usage_tracked_sessions = max(1, int(os.getenv("USAGE_TRACKED_SESSIONS", "1000")))
+        profile_token = os.getenv("PROFILE_TOKEN", "")
+        profile_dir = Path(os.getenv("PROFILE_DIR") or LOG_DIR / "profiles")
+        profile_max_per_hour = max(1, int(os.getenv("PROFILE_MAX_PER_HOUR", "6")))
+        profile_interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        loop_monitor_interval_ms = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+        loop_block_threshold_ms = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+        ready_max_streams = max(1, int(os.getenv("READY_MAX_STREAMS", "100")))
+        ready_max_loop_lag_ms = float(os.getenv("READY_MAX_LOOP_LAG_MS", "500"))
+        ready_max_session_cache_mb = float(os.getenv("READY_MAX_SESSION_CACHE_MB", "512"))
+        ready_max_upstream_ttft_ms = float(os.getenv("READY_MAX_UPSTREAM_TTFT_MS", "20000"))
+        ready_upstream_window_seconds = float(os.getenv("READY_UPSTREAM_WINDOW_SECONDS", "300"))
+        stream_replay_buffer_events = max(
+            1, int(os.getenv("STREAM_REPLAY_BUFFER_EVENTS", "5000"))
+        )
+        stream_replay_retention_seconds = float(
+            os.getenv("STREAM_REPLAY_RETENTION_SECONDS", "300")
+        )
+        stream_replay_max_streams = max(1, int(os.getenv("STREAM_REPLAY_MAX_STREAMS", "200")))
+        stream_replay_buffer_bytes = max(
+            1, int(os.getenv("STREAM_REPLAY_BUFFER_BYTES", str(16 * 1024 * 1024)))
+        )
+        stream_resume_grace_seconds = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "60"))
+        persist_partial_on_cancel = os.getenv("PERSIST_PARTIAL_ON_CANCEL", "false").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        persist_interactive_requests = os.getenv(
+            "PERSIST_INTERACTIVE_REQUESTS", "true"
+        ).lower() in ("1", "true", "yes")
 
         return cls(
             port=port,
@@ -61,6 +150,43 @@ class Settings:
             flow_modification_prompt_path=SRC_DIR
             / file_names.PROMPTS_DIR
             / file_names.FLOW_MODIFICATION_PROMPT_TEMPLATE,
+            batch_concurrency=batch_concurrency,
+            batch_max_prompts=batch_max_prompts,
+            attachment_max_bytes=attachment_max_bytes,
+            attachment_max_files=attachment_max_files,
+            extraction_timeout_seconds=extraction_timeout_seconds,
+            extraction_workers=extraction_workers,
+            attachment_token_budget=attachment_token_budget,
+            attachment_top_k=attachment_top_k,
+            max_request_body_bytes=max_request_body_bytes,
+            retention_enabled=retention_enabled,
+            retention_days=retention_days,
+            retention_interval_seconds=retention_interval_seconds,
+            retention_batch_size=retention_batch_size,
+            trace_sample_rate=trace_sample_rate,
+            trace_export_path=trace_export_path,
+            log_level=log_level,
+            log_json=log_json,
+            log_sampling=log_sampling,
+            usage_tracked_sessions=usage_tracked_sessions,
+            profile_token=profile_token,
+            profile_dir=profile_dir,
+            profile_max_per_hour=profile_max_per_hour,
+            profile_interval_ms=profile_interval_ms,
+            loop_monitor_interval_ms=loop_monitor_interval_ms,
+            loop_block_threshold_ms=loop_block_threshold_ms,
+            ready_max_streams=ready_max_streams,
+            ready_max_loop_lag_ms=ready_max_loop_lag_ms,
+            ready_max_session_cache_mb=ready_max_session_cache_mb,
+            ready_max_upstream_ttft_ms=ready_max_upstream_ttft_ms,
+            ready_upstream_window_seconds=ready_upstream_window_seconds,
+            stream_replay_buffer_events=stream_replay_buffer_events,
+            stream_replay_retention_seconds=stream_replay_retention_seconds,
+            stream_replay_max_streams=stream_replay_max_streams,
+            stream_replay_buffer_bytes=stream_replay_buffer_bytes,
+            stream_resume_grace_seconds=stream_resume_grace_seconds,
+            persist_partial_on_cancel=persist_partial_on_cancel,
+            persist_interactive_requests=persist_interactive_requests,
         )
 
     def read_flow_prompt(self) -> Optional[str]:
@@ -109,12 +235,23 @@ class Settings:
         return self.base_dir / file_names.STATIC_DIR / file_names.DEMO_UI_HTML
 
 
+@dataclass(frozen=True)
+class TokenPricing:
+    """100万トークンあたりの料金（USD）。"""
+
+    input: float
+    output: float
+    cache_read: float
+    cache_write: float
+
+
 @dataclass(frozen=True)
 class AnthropicModelConfig:
     """Anthropic向けのモデル設定。"""
 
     model: str
     max_tokens: int
+    pricing: Optional[TokenPricing] = None
 
 
 @lru_cache(maxsize=1)
@@ -165,4 +302,38 @@ def load_anthropic_model_config(
     if not isinstance(max_tokens, int):
         raise RuntimeError("Anthropic config 'max_tokens' must be an integer.")
 
-    return AnthropicModelConfig(model=model.strip(), max_tokens=max_tokens)
+    return AnthropicModelConfig(
+        model=model.strip(),
+        max_tokens=max_tokens,
+        pricing=_parse_pricing(vendor_config.get("pricing")),
+    )
+
+
+def _parse_pricing(data: object) -> Optional[TokenPricing]:
+    """モデル設定のpricingを読み込みます。未設定の場合はNoneを返します。
+
+    Args:
+        data: YAMLのpricingセクション。
+
+    Returns:
+        Optional[TokenPricing]: 料金表。
+
+    Raises:
+        RuntimeError: 値が数値でない場合。
+    """
+    if data is None:
+        return None
+    if not isinstance(data, dict):
+        raise RuntimeError("Anthropic config 'pricing' must be a mapping.")
+    try:
+        input_price = float(data["input"])
+        return TokenPricing(
+            input=input_price,
+            output=float(data["output"]),
+            cache_read=float(data.get("cache_read", input_price)),
+            cache_write=float(data.get("cache_write", input_price)),
+        )
+    except (KeyError, TypeError, ValueError) as exc:
+        raise RuntimeError(
+            "Anthropic config 'pricing' requires numeric 'input' and 'output'."
+        ) from exc
@@ -0,0 +1,78 @@
+"""Tests for failure handling in AttachmentTextExtractor."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from src.services.attachment_extraction import AttachmentTextExtractor
+from src.services.attachments import AttachmentError, StoredAttachment
+
+
+def _attachment(name: str, content_type: str, data: bytes) -> StoredAttachment:
+    file = tempfile.SpooledTemporaryFile()
+    file.write(data)
+    return StoredAttachment(
+        attachment_id=hashlib.sha256(name.encode("utf-8")).hexdigest()[:12],
+        name=name,
+        content_type=content_type,
+        size=len(data),
+        sha256=hashlib.sha256(data).hexdigest(),
+        file=file,
+    )
+
+
+class LibraryError(Exception):
+    """ValueErrorを継承しないライブラリ固有の例外（pypdfのPdfReadErrorなど）の代わり。"""
+
+
+def _raise_library_error(kind: str, data: bytes, timeout_seconds: float) -> str:
+    raise LibraryError("unreadable")
+
+
+@pytest.fixture
+def extractor():
+    extractor = AttachmentTextExtractor(max_bytes=1024 * 1024, timeout_seconds=10, max_workers=1)
+    yield extractor
+    extractor.shutdown()
+
+
+async def test_corrupt_pdf_raises_attachment_error(extractor):
+    pytest.importorskip("pypdf")
+    attachment = _attachment("broken.pdf", "application/pdf", b"%PDF-1.4 garbage")
+
+    with pytest.raises(AttachmentError):
+        await extractor.extract(attachment)
+
+
+async def test_unexpected_worker_exception_raises_attachment_error(extractor, monkeypatch):
+    # ValueErrorを継承しない例外もAttachmentError（APIでは400）として扱えること
+    monkeypatch.setattr(
+        "src.services.attachment_extraction.extract_text", _raise_library_error
+    )
+    extractor._executor = ProcessPoolExecutor(max_workers=1)
+    attachment = _attachment("broken.docx", "application/octet-stream", b"not a zip")
+
+    with pytest.raises(AttachmentError, match="unreadable"):
+        await extractor.extract(attachment)
+
+
+async def test_broken_pool_is_recreated_on_next_extraction(extractor):
+    broken = ProcessPoolExecutor(max_workers=1)
+    with pytest.raises(Exception):
+        broken.submit(os._exit, 1).result()
+    extractor._executor = broken
+
+    with pytest.raises(AttachmentError):
+        await extractor.extract(_attachment("first.docx", "application/octet-stream", b"one"))
+    assert extractor._executor is None
+
+    # 次の抽出では新しいプールで処理され、壊れたファイルは通常の抽出エラーになる
+    with pytest.raises(AttachmentError, match="からテキストを抽出できませんでした"):
+        await extractor.extract(_attachment("second.docx", "application/octet-stream", b"two"))
+    assert extractor._executor is not None
+    assert extractor._executor is not broken
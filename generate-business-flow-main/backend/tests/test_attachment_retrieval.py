@@ -0,0 +1,40 @@
+"""Tests for AttachmentRetriever when called from worker threads."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import tempfile
+
+from src.services.attachment_retrieval import AttachmentRetriever
+from src.services.attachments import StoredAttachment
+
+
+def _attachment(attachment_id: str, text: str) -> StoredAttachment:
+    data = text.encode("utf-8")
+    return StoredAttachment(
+        attachment_id=attachment_id,
+        name=f"{attachment_id}.txt",
+        content_type="text/plain",
+        size=len(data),
+        sha256=hashlib.sha256(data).hexdigest(),
+        file=tempfile.SpooledTemporaryFile(),
+    )
+
+
+async def test_concurrent_selects_share_one_index():
+    text = "\n".join(f"手順{index}: 経費を申請し、上長が承認する" for index in range(3000))
+    attachment = _attachment("a1", text)
+    retriever = AttachmentRetriever(token_budget=500, top_k=4)
+
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(retriever.select, "s1", "承認", [attachment], {"a1": text})
+            for _ in range(8)
+        )
+    )
+
+    assert all(result is not None for result in results)
+    assert len({result.texts["a1"] for result in results}) == 1
+    assert list(retriever._indexes) == ["s1"]
+    assert retriever.select("s1", "承認", [attachment], {"a1": text}).texts == results[0].texts
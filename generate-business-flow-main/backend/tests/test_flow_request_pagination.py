@@ -0,0 +1,56 @@
+"""Tests for keyset pagination of FlowRequest history on the SQLite profile."""
+
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db import Base
+from src.db.repository import (
+    FlowRequestCursor,
+    add_flow_request,
+    get_or_create_flow_session,
+    list_flow_request_page,
+)
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = tmp_path / "flows.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return path
+
+
+async def test_walks_every_page_of_rows_created_in_the_same_second(database_path):
+    engine = create_engine(f"sqlite:///{database_path}")
+    with sessionmaker(bind=engine)() as db:
+        flow_session = get_or_create_flow_session(db, "session-1")
+        # created_atが同じ秒に収まる連続した挿入でも、ページが進むことを確認する
+        expected_ids = [
+            add_flow_request(db, flow_session, f"prompt {index}", None, index == 0).id
+            for index in range(5)
+        ]
+        session_id = flow_session.id
+        db.commit()
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+    pages = []
+    cursor = None
+    async with async_sessionmaker(async_engine)() as db:
+        # カーソルが進まない場合に無限ループしないよう、行数以上のページは読まない
+        for _ in range(len(expected_ids) + 1):
+            rows, next_cursor = await list_flow_request_page(db, session_id, 2, cursor)
+            pages.append([row["requestId"] for row in rows])
+            if next_cursor is None:
+                break
+            # APIと同じく文字列を経由して次ページを読む
+            cursor = FlowRequestCursor.decode(next_cursor.encode())
+    await async_engine.dispose()
+
+    newest_first = expected_ids[::-1]
+    assert pages == [newest_first[0:2], newest_first[2:4], newest_first[4:]]